@@ -1,34 +1,104 @@
-from datetime import datetime
-from fastapi import APIRouter
-from sqlalchemy import select, delete
+import base64
+import csv
+import io
+import json
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, Literal, Optional
 
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy import DateTime
+
+from app.api import ws
 from app.db import database
-from app.db.database import engine, push_tokens
+from app.core import metrics, outbound
+from app.core.cache import AsyncTTLCache
+from app.core.heartbeat import heartbeat
+from app.core.matchmaker import STATE_METRICS
+from app.core.profiler import profiler
+from app.settings import settings
 
 router = APIRouter(tags=["admin"])
 
+# Dashboards poll the stats endpoints; answers are shared for a few seconds
+_stats_cache = AsyncTTLCache(settings.ADMIN_STATS_CACHE_SECONDS)
+
+# Rows fetched per query while streaming an export, and bytes buffered per write
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_WRITE_BYTES = 64 * 1024
+TOKEN_COLUMNS = [c.name for c in database.push_tokens.columns]
+
 
 @router.get("/health")
 async def health():
     return {"status": "ok"}
 
 
+@router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """
+    Prometheus text exposition of matchmaker, websocket, push and DB metrics.
+
+    Matchmaker and push series come from whichever process runs the matchmaker
+    (the broker, if there is one); the rest are this worker's.
+    """
+    local = metrics.REGISTRY.render(skip=STATE_METRICS)
+    return PlainTextResponse(local + await ws.mm.render_metrics(), media_type=metrics.CONTENT_TYPE)
+
+
 @router.get("/admin/tokens")
-async def list_tokens():
-    """List all registered push tokens in IST."""
-    with engine.connect() as conn:
-        rows = conn.execute(select(push_tokens)).fetchall()
-        
-    result = []
-    for r in rows:
-        d = dict(r._mapping)
-        for key, value in d.items():
-            if isinstance(value, datetime):
-                # Convert backend UTC straight into IST for the API consumer
-                d[key] = value.astimezone(database.IST)
-        result.append(d)
-        
-    return result
+async def list_tokens(
+    request: Request,
+    response: Response,
+    limit: int = Query(500, ge=1, le=5000),
+    cursor: Optional[str] = None,
+    sort: Literal["token", "created_at"] = "token",
+    active_since: Optional[datetime] = None,
+    never_sent: bool = False,
+    user_id: Optional[str] = None,
+):
+    """
+    List registered push tokens in IST, one keyset page at a time.
+
+    When more rows remain, the `X-Next-Cursor` header (and a `Link: rel="next"`
+    header) carries the cursor for the next page; pass it back as `cursor`
+    with the same sort and filters.
+
+    - **active_since**: only tokens whose app was opened at or after this time
+    - **never_sent**: only tokens that never received a push
+    - **user_id**: only this user's tokens
+    """
+    filters = _token_filters(active_since, never_sent, user_id)
+    rows = await database.run(database.list_tokens, limit + 1, _decode_cursor(cursor, sort), sort, **filters)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1], sort)
+        response.headers["X-Next-Cursor"] = next_cursor
+        response.headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
+    return [_to_ist(d) for d in rows]
+
+
+@router.get("/admin/tokens/export")
+async def export_tokens(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    active_since: Optional[datetime] = None,
+    never_sent: bool = False,
+    user_id: Optional[str] = None,
+):
+    """
+    Stream every matching token as NDJSON or CSV, in token order.
+
+    Rows are read in keyset chunks of `EXPORT_CHUNK_SIZE`, so memory stays flat
+    and no DB connection is held while the client reads. Same filters as
+    `/admin/tokens`.
+    """
+    rows = _iter_tokens(_token_filters(active_since, never_sent, user_id))
+    if format == "csv":
+        return StreamingResponse(
+            _csv_lines(rows), media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="push_tokens.csv"'},
+        )
+    return StreamingResponse(_ndjson_lines(rows), media_type="application/x-ndjson")
 
 
 @router.get("/admin/tokens/stats")
@@ -41,20 +111,144 @@ async def token_stats():
     - **active_users_today**: total unique devices that opened the app today
     - **app_opens_today**: total number of times the app was opened today
     - **app_opens_all_time**: total number of times the app was opened across all users
+
+    Served from a cache refreshed at most every `ADMIN_STATS_CACHE_SECONDS`.
     """
-    return database.get_token_stats()
+    return await _stats_cache.get("totals", lambda: database.run(database.get_token_stats))
+
+
+@router.get("/admin/tokens/stats/daily")
+async def daily_token_stats(days: int = Query(30, ge=1, le=366)):
+    """
+    Per-IST-day new users, active users and app opens for the last `days` days, oldest first.
+    Days with no activity are omitted.
+    """
+    return await _stats_cache.get(("daily", days), lambda: database.run(database.get_daily_stats, days))
+
+
+@router.get("/admin/ws/stats")
+async def ws_stats():
+    """Outbound queue depth, dropped/coalesced frames, slow-consumer evictions and heartbeat reaps."""
+    return {**outbound.stats.as_dict(), "heartbeat_watched": len(heartbeat), "zombies_reaped": heartbeat.reaped}
+
+
+@router.get("/admin/push/stats")
+async def push_stats():
+    """Expo dispatcher throughput, ticket/receipt outcomes and request latency."""
+    return await ws.mm.push_stats()
+
+
+@router.get("/admin/profiler")
+async def profiler_report():
+    """Event-loop lag percentiles, lock wait/hold times per operation and recent blocking calls."""
+    return profiler.snapshot()
+
+
+@router.post("/admin/profiler")
+async def profiler_toggle(enabled: bool, block_threshold_ms: Optional[float] = None, reset: bool = False):
+    """Switch the profiler on or off at runtime; optionally change the blocking threshold or clear data."""
+    if enabled:
+        profiler.enable(block_threshold_ms)
+    else:
+        profiler.disable()
+    if reset:
+        profiler.reset()
+    return profiler.snapshot()
 
 
 @router.delete("/admin/tokens/{token}")
 async def delete_single_token(token: str):
     """Delete a specific push token."""
-    database.delete_token(token)
+    await ws.mm.remove_push_tokens([token])
+    await database.run(database.delete_token, token)
+    _stats_cache.invalidate()
     return {"status": "deleted", "token": token}
 
 
 @router.delete("/admin/tokens")
 async def delete_all_tokens():
     """Delete all push tokens."""
-    with engine.begin() as conn:
-        result = conn.execute(delete(push_tokens))
-    return {"status": "deleted", "count": result.rowcount}
+    await ws.mm.clear_push_tokens()
+    count = await database.run(database.delete_all_tokens)
+    _stats_cache.invalidate()
+    return {"status": "deleted", "count": count}
+
+
+# ─── private ────────────────────────────────────────────────────────────
+
+def _to_ist(row: dict) -> dict:
+    for key, value in row.items():
+        if isinstance(value, datetime):
+            # Convert backend UTC straight into IST for the API consumer
+            if value.tzinfo is None:
+                value = value.replace(tzinfo=timezone.utc)
+            row[key] = value.astimezone(database.IST)
+    return row
+
+
+def _token_filters(active_since: Optional[datetime], never_sent: bool, user_id: Optional[str]) -> Dict:
+    if active_since is not None:
+        # Stored times are UTC; naive input is taken as UTC too
+        if active_since.tzinfo is None:
+            active_since = active_since.replace(tzinfo=timezone.utc)
+        active_since = active_since.astimezone(timezone.utc)
+    return {"active_since": active_since, "never_sent": never_sent, "user_id": user_id}
+
+
+def _encode_cursor(row: dict, sort: str) -> str:
+    values = [row[c.name] for c in database.TOKEN_SORTS[sort]]
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: Optional[str], sort: str) -> Optional[tuple]:
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        keys = database.TOKEN_SORTS[sort]
+        if len(values) != len(keys):
+            raise ValueError("cursor does not match sort")
+        return tuple(
+            datetime.fromisoformat(v) if isinstance(k.type, DateTime) else v
+            for k, v in zip(keys, values)
+        )
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def _iter_tokens(filters: Dict) -> AsyncIterator[dict]:
+    after: Optional[tuple] = None
+    while True:
+        rows = await database.run(database.list_tokens, EXPORT_CHUNK_SIZE, after, "token", **filters)
+        for row in rows:
+            yield _to_ist(row)
+        if len(rows) < EXPORT_CHUNK_SIZE:
+            return
+        after = (rows[-1]["token"],)
+
+
+async def _ndjson_lines(rows: AsyncIterator[dict]) -> AsyncIterator[str]:
+    buf = io.StringIO()
+    async for row in rows:
+        buf.write(json.dumps(row, default=lambda v: v.isoformat(), ensure_ascii=False))
+        buf.write("\n")
+        if buf.tell() >= EXPORT_WRITE_BYTES:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+async def _csv_lines(rows: AsyncIterator[dict]) -> AsyncIterator[str]:
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=TOKEN_COLUMNS)
+    writer.writeheader()
+    async for row in rows:
+        writer.writerow({k: v.isoformat() if isinstance(v, datetime) else v for k, v in row.items()})
+        # Hand over roughly a chunk at a time rather than one tiny write per row
+        if buf.tell() >= EXPORT_WRITE_BYTES:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
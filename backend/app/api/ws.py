@@ -1,70 +1,161 @@
-import json
+import logging
+import time
 
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 
+from app.core import metrics, shutdown
+from app.core.app_opens import app_opens
+from app.core.broker import BrokerClient
+from app.core.codec import negotiate
+from app.core.heartbeat import HEARTBEAT_CLOSE_CODE, heartbeat
 from app.core.matchmaker import Matchmaker
-from app.models.schemas import ErrorEvt
-from app.db import database
+from app.core.outbound import Outbound
+from app.core.rate_limit import FLOOD_CLOSED, FRAMES_REJECTED, FrameLimiter
+from app.settings import settings
+
+logger = logging.getLogger("uvicorn.error")
 
 router = APIRouter(tags=["websocket"])
 
-# Single shared matchmaker instance for the lifetime of the process
-mm = Matchmaker()
+FRAMES_IN = metrics.Counter("chat_ws_frames_in_total", "Frames received from clients", ("type",))
+# Close codes for clients that flood past the rate limits, or send oversized frames,
+# and for sockets dropped after an unexpected error
+POLICY_VIOLATION = 1008
+MESSAGE_TOO_BIG = 1009
+INTERNAL_ERROR = 1011
+
+# Frame types clients may send; anything else is counted as "unknown" to bound label cardinality
+CLIENT_TYPES = frozenset({"join_queue", "reconnect", "register_push", "message", "typing", "next", "leave", "pong"})
+
+# Single shared matchmaker instance for the lifetime of the process; with a
+# broker configured, matchmaking state is shared by every worker through it
+mm = BrokerClient(settings.MATCHMAKER_BROKER_URL) if settings.MATCHMAKER_BROKER_URL else Matchmaker()
 
 
 @router.websocket("/ws")
 async def ws_endpoint(ws: WebSocket):
-    await ws.accept()
+    # Clients may ask for a binary encoding; everyone else gets JSON text frames
+    subprotocol, codec = negotiate(ws.scope.get("subprotocols", []))
+    await ws.accept(subprotocol=subprotocol)
+    # All frames to this client go through its bounded outbound queue
+    conn = Outbound(ws, codec=codec)
+    conn.start()
     user_id: str | None = None
     avatar: str | None = None
+    limiter = FrameLimiter(time.monotonic())
+
+    async def close(code: int) -> None:
+        # Handled below like any disconnect: a user in a room gets the grace period
+        try:
+            await ws.close(code=code)
+        except Exception:
+            pass
+        raise WebSocketDisconnect(code)
+
+    async def throttled() -> None:
+        if limiter.flooding:
+            FLOOD_CLOSED.inc()
+            await close(POLICY_VIOLATION)
+        # Once per run of dropped frames, so a flood isn't answered with one
+        if limiter.strikes == 1:
+            conn.send(conn.codec.error("Rate limited"), kind="error")
+
+    async def reap() -> None:
+        # Same path as a disconnect (grace period if in a room); the receive
+        # loop's own disconnect later finds the socket already handled
+        await conn.close()
+        try:
+            await ws.close(code=HEARTBEAT_CLOSE_CODE)
+        except Exception:
+            pass
+        if user_id:
+            await mm.remove_user(user_id, ws=conn)
+
+    peer = heartbeat.watch(conn, reap)
     try:
         while True:
-            raw = await ws.receive_text()
+            message = await ws.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            peer.seen()
+            raw = message["text"] if message.get("text") is not None else message.get("bytes", b"")
+            # Size and rate checks come before decoding; nothing past them runs for a dropped frame.
+            # Text frames are measured in characters, which never exceeds their size in bytes.
+            if len(raw) > settings.WS_MAX_FRAME_BYTES:
+                FRAMES_REJECTED.inc("too_large")
+                await close(MESSAGE_TOO_BIG)
+            now = time.monotonic()
+            if not limiter.allow_frame(now):
+                await throttled()
+                continue
             try:
-                data = json.loads(raw)
+                data = conn.codec.decode(raw)
             except Exception:
-                await ws.send_text(json.dumps(ErrorEvt(message="Invalid JSON").model_dump()))
+                data = None
+            # Well-formed JSON or msgpack that isn't an object (5, [1, 2]) is just as invalid
+            if not isinstance(data, dict):
+                FRAMES_IN.inc("invalid")
+                conn.send(conn.codec.error("Invalid JSON"), kind="error")
                 continue
 
             t = data.get("type")
+            if not isinstance(t, str):
+                t = "unknown"
+            FRAMES_IN.inc(t if t in CLIENT_TYPES else "unknown")
+            if not limiter.allow(t, now):
+                await throttled()
+                continue
 
-            if t == "join_queue":
-                user_id = data.get("userId")
-                avatar = data.get("avatar")
-                if not user_id or not avatar:
-                    await ws.send_text(json.dumps(ErrorEvt(message="Missing userId/avatar").model_dump()))
+            if t == "pong":
+                peer.pong()
+
+            elif t == "join_queue":
+                joining, avatar = data.get("userId"), data.get("avatar")
+                if not isinstance(joining, str) or not joining or not isinstance(avatar, str) or not avatar:
+                    conn.send(conn.codec.error("Missing userId/avatar"), kind="error")
                     continue
-                await mm.register(user_id, ws, avatar)
-                await mm.join_queue(user_id)
+                user_id = joining
+                await mm.register(user_id, conn, avatar)
+                await mm.join_queue(user_id, data.get("prefs"))
 
             elif t == "reconnect":
-                user_id = data.get("userId")
-                if not user_id:
-                    await ws.send_text(json.dumps(ErrorEvt(message="Missing userId").model_dump()))
+                returning = data.get("userId")
+                if not isinstance(returning, str) or not returning:
+                    conn.send(conn.codec.error("Missing userId"), kind="error")
                     continue
-                    
-                success = await mm.handle_reconnect(user_id, ws)
+                user_id = returning
+
+                success = await mm.handle_reconnect(user_id, conn)
                 if success:
-                    await ws.send_text(json.dumps({"type": "system", "code": "reconnected", "message": "Restored"}))
+                    conn.send(conn.codec.system("reconnected", "Restored"), kind="system")
                 else:
-                    await ws.send_text(json.dumps({"type": "system", "code": "idle", "message": "Session expired"}))
+                    conn.send(conn.codec.system("idle", "Session expired"), kind="system")
 
             elif t == "register_push":
                 token = data.get("token")
                 p_user_id = data.get("userId") or user_id
                 device_name = data.get("deviceName")
-                if p_user_id and token:
-                    database.add_token(p_user_id, token, device_name=device_name)
+                if not (isinstance(token, str) and token and isinstance(p_user_id, str) and p_user_id
+                        and (device_name is None or isinstance(device_name, str))):
+                    conn.send(conn.codec.error("Invalid push registration"), kind="error")
+                    continue
+                await mm.add_push_token(p_user_id, token)
+                app_opens.record(p_user_id, token, device_name=device_name)
 
             elif t == "message":
                 if not user_id:
-                    await ws.send_text(json.dumps(ErrorEvt(message="Not joined").model_dump()))
+                    conn.send(conn.codec.error("Not joined"), kind="error")
+                    continue
+                text = data.get("text")
+                if isinstance(text, str) and len(text) > settings.WS_MAX_TEXT_LENGTH:
+                    FRAMES_REJECTED.inc("text_too_long")
+                    conn.send(conn.codec.error("Message too long"), kind="error")
                     continue
-                await mm.relay_message(user_id, data.get("room"), data.get("text"), data.get("sentAt"))
+                await mm.relay_message(user_id, data.get("room"), text, data.get("sentAt"))
 
             elif t == "typing":
                 if not user_id:
-                    await ws.send_text(json.dumps(ErrorEvt(message="Not joined").model_dump()))
+                    conn.send(conn.codec.error("Not joined"), kind="error")
                     continue
                 await mm.relay_typing(user_id, data.get("room"), data.get("isTyping", False))
 
@@ -77,8 +168,25 @@ async def ws_endpoint(ws: WebSocket):
                     await mm.remove_user(user_id, is_disconnect=False)
 
             else:
-                await ws.send_text(json.dumps(ErrorEvt(message="Unknown type").model_dump()))
+                conn.send(conn.codec.error("Unknown type"), kind="error")
 
     except WebSocketDisconnect:
+        # Uvicorn drops every socket (with 1012) before the lifespan shutdown runs. Only a
+        # signal to this process counts as a restart: a client can send 1012 itself.
+        if shutdown.requested():
+            # Deploy or restart: keep rooms and the queue for the snapshot instead of tearing down
+            await mm.drain()
+        if user_id:
+            await mm.remove_user(user_id, ws=conn)
+    except Exception as e:
+        # Never leave a registration behind on a dead socket: the next joiner would be paired with it
+        logger.error(f"[WS] Dropping socket of {user_id or 'an unjoined client'} after an error: {e!r}")
         if user_id:
-            await mm.remove_user(user_id)
+            await mm.remove_user(user_id, ws=conn)
+        try:
+            await ws.close(code=INTERNAL_ERROR)
+        except Exception:
+            pass
+    finally:
+        heartbeat.unwatch(peer)
+        await conn.close()
@@ -0,0 +1,150 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from sqlalchemy.exc import OperationalError
+
+from app.db import database
+from app.settings import settings
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class _Opens:
+    __slots__ = (
+        "user_id", "device_name", "opens_total", "opens_today",
+        "day_start", "first_opened_at", "last_opened_at",
+    )
+
+    def __init__(self, user_id: str, device_name: Optional[str], now: datetime, day_start: datetime) -> None:
+        self.user_id = user_id
+        self.device_name = device_name
+        self.opens_total = 0
+        self.opens_today = 0
+        self.day_start = day_start
+        self.first_opened_at = now
+        self.last_opened_at = now
+
+    def as_row(self, token: str) -> dict:
+        return {
+            "token": token,
+            "user_id": self.user_id,
+            "device_name": self.device_name,
+            "opens_total": self.opens_total,
+            "opens_today": self.opens_today,
+            "day_start": self.day_start,
+            "first_opened_at": self.first_opened_at,
+            "last_opened_at": self.last_opened_at,
+        }
+
+
+class AppOpenBuffer:
+    """
+    Aggregates `register_push` app opens per token and writes them as one
+    multi-row upsert every `flush_interval` seconds or `max_entries` tokens,
+    whichever comes first.
+
+    `opens_today` only counts opens on the IST day of the latest buffered
+    open, so a batch straddling midnight still resets `app_opens_today`
+    exactly like a single-row upsert would.
+    """
+
+    def __init__(self, flush_interval: float, max_entries: int) -> None:
+        self.flush_interval = flush_interval
+        self.max_entries = max_entries
+        self._pending: Dict[str, _Opens] = {}
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, user_id: str, token: str, device_name: Optional[str] = None) -> None:
+        if not (isinstance(user_id, str) and user_id and isinstance(token, str) and token
+                and (device_name is None or isinstance(device_name, str))):
+            logger.warning(f"Ignoring malformed app open: user {user_id!r}, token {token!r}")
+            return
+        now = datetime.now(timezone.utc)
+        day_start = database.ist_day_start_utc(now)
+
+        entry = self._pending.get(token)
+        if entry is None:
+            entry = self._pending[token] = _Opens(user_id, device_name, now, day_start)
+        entry.user_id = user_id
+        entry.device_name = device_name
+        entry.last_opened_at = now
+        entry.opens_total += 1
+        if entry.day_start != day_start:
+            entry.day_start = day_start
+            entry.opens_today = 0
+        entry.opens_today += 1
+
+        if len(self._pending) >= self.max_entries:
+            self._full.set()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        """Stop the background loop and flush whatever is still buffered."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        try:
+            await database.run(database.upsert_app_opens, [e.as_row(t) for t, e in pending.items()])
+        except OperationalError as e:
+            # The database is unreachable: keep everything for the next flush
+            logger.error(f"Failed to flush {len(pending)} app opens: {e}")
+            self._requeue(pending)
+        except Exception as e:
+            logger.error(f"Failed to flush {len(pending)} app opens, retrying one at a time: {e}")
+            await self._flush_each(pending)
+
+    async def _flush_each(self, pending: Dict[str, _Opens]) -> None:
+        """Write rows one by one so a bad row can't hold back the rest; rows that fail on their own are dropped."""
+        items = list(pending.items())
+        for i, (token, entry) in enumerate(items):
+            try:
+                await database.run(database.upsert_app_opens, [entry.as_row(token)])
+            except OperationalError as e:
+                logger.error(f"Failed to flush {len(items) - i} app opens: {e}")
+                self._requeue(dict(items[i:]))
+                return
+            except Exception as e:
+                logger.error(f"Dropping {entry.opens_total} app opens of token {token!r}: {e!r}")
+
+    def _requeue(self, failed: Dict[str, _Opens]) -> None:
+        # Opens recorded during the failed flush are newer; fold the old counts under them
+        for token, old in failed.items():
+            new = self._pending.get(token)
+            if new is None:
+                self._pending[token] = old
+                continue
+            new.opens_total += old.opens_total
+            if new.day_start == old.day_start:
+                new.opens_today += old.opens_today
+            new.first_opened_at = old.first_opened_at
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            await self.flush()
+
+
+app_opens = AppOpenBuffer(
+    flush_interval=settings.APP_OPEN_FLUSH_INTERVAL_MS / 1000,
+    max_entries=settings.APP_OPEN_FLUSH_MAX_ENTRIES,
+)
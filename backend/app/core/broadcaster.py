@@ -0,0 +1,57 @@
+import asyncio
+import logging
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from app.core.codec import JsonCodec, Payload
+from app.core.outbound import Outbound
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class QueueSizeBroadcaster:
+    """
+    Coalesces queue-size changes into at most one fan-out per interval.
+
+    Callers only mark the queue as dirty; the actual fan-out runs in its own
+    task, outside the matchmaker lock, encodes the payload once per codec and
+    hands the same buffer to every recipient's outbound queue.
+    """
+
+    def __init__(
+        self,
+        snapshot: Callable[[], Tuple[int, Iterable[Outbound]]],
+        interval: float,
+    ) -> None:
+        # snapshot() returns the current queue length and the connections to notify
+        self._snapshot = snapshot
+        self.interval = interval
+        self._dirty = False
+        self._last_sent = float("-inf")
+        self._task: Optional[asyncio.Task] = None
+
+    def mark_dirty(self) -> None:
+        self._dirty = True
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self._dirty:
+            wait = self._last_sent + self.interval - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._dirty = False
+            self._last_sent = loop.time()
+            try:
+                self._fan_out()
+            except Exception as e:
+                logger.error(f"queue_size broadcast failed: {e}")
+
+    def _fan_out(self) -> None:
+        count, targets = self._snapshot()
+        encoded: Dict[JsonCodec, Payload] = {}
+        for conn in targets:
+            payload = encoded.get(conn.codec)
+            if payload is None:
+                payload = encoded[conn.codec] = conn.codec.encode("queue_size", count)
+            conn.send(payload, kind="queue_size")
@@ -0,0 +1,363 @@
+"""
+Shared matchmaking for several uvicorn workers / nodes.
+
+With `MATCHMAKER_BROKER_URL` unset every worker runs its own in-memory
+`Matchmaker` (the default, single-worker setup). When it is set, one broker
+process hosts the only `Matchmaker` — waiting queue, rooms and relay — and
+each worker talks to it through a `BrokerClient`, which exposes the same
+async API. The broker holds a `RemoteSocket` for every client websocket;
+frames it sends are forwarded to the worker that owns the real socket.
+
+Transport is length-prefixed JSON over a Unix socket (`unix:///path`) or TCP
+(`tcp://host:port`). Calls from one worker are handled in order, so a
+client's own events are never reordered.
+
+    python -m app.core.broker              # listens on MATCHMAKER_BROKER_URL
+"""
+import asyncio
+import itertools
+import json
+import logging
+import signal
+import struct
+import threading
+import weakref
+from typing import Any, Dict, List, Optional
+
+from app.core.matchmaker import Matchmaker
+from app.core.outbound import Outbound
+from app.db import database
+from app.settings import settings
+
+logger = logging.getLogger("uvicorn.error")
+
+_HEADER = struct.Struct("!I")
+
+# Matchmaker methods a worker may invoke; the value is the index of a socket argument
+_METHODS: Dict[str, Optional[int]] = {
+    "register": 1,
+    "join_queue": None,
+    "handle_reconnect": 1,
+    "handle_next": None,
+    "remove_user": 2,
+    "relay_message": None,
+    "relay_typing": None,
+    "add_push_token": None,
+    "remove_push_tokens": None,
+    "clear_push_tokens": None,
+    "push_stats": None,
+    "render_metrics": None,
+}
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> Dict[str, Any]:
+    (size,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    return json.loads(await reader.readexactly(size))
+
+
+def _write_frame(writer: asyncio.StreamWriter, msg: Dict[str, Any]) -> None:
+    body = json.dumps(msg, separators=(",", ":")).encode()
+    writer.write(_HEADER.pack(len(body)) + body)
+
+
+async def _open_connection(url: str) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    if url.startswith("unix://"):
+        return await asyncio.open_unix_connection(url[len("unix://"):])
+    if url.startswith("tcp://"):
+        host, port = url[len("tcp://"):].rsplit(":", 1)
+        return await asyncio.open_connection(host, int(port))
+    raise ValueError(f"Unsupported broker URL: {url}")
+
+
+async def _start_server(url: str, handler) -> asyncio.AbstractServer:
+    if url.startswith("unix://"):
+        return await asyncio.start_unix_server(handler, url[len("unix://"):])
+    if url.startswith("tcp://"):
+        host, port = url[len("tcp://"):].rsplit(":", 1)
+        return await asyncio.start_server(handler, host, int(port))
+    raise ValueError(f"Unsupported broker URL: {url}")
+
+
+# ──────────────────────────────────────────────
+# Broker side
+# ──────────────────────────────────────────────
+
+class _WorkerLink:
+    def __init__(self, writer: asyncio.StreamWriter) -> None:
+        self.writer = writer
+
+    def send(self, msg: Dict[str, Any]) -> None:
+        if not self.writer.is_closing():
+            _write_frame(self.writer, msg)
+
+
+class _ForwardCodec:
+    """Leaves events unencoded so the worker can apply the client's own codec."""
+
+    name = "forward"
+
+    def encode(self, kind: str, *args: Any) -> List[Any]:
+        return list(args)
+
+
+_forward_codec = _ForwardCodec()
+
+
+class RemoteSocket:
+    """Broker-side stand-in for the Outbound of a websocket held by a worker."""
+
+    __slots__ = ("link", "conn_id")
+
+    codec = _forward_codec
+
+    def __init__(self, link: _WorkerLink, conn_id: str) -> None:
+        self.link = link
+        self.conn_id = conn_id
+
+    def __eq__(self, other: object) -> bool:
+        # Each call builds a new stand-in, so the same client socket is matched by id
+        if not isinstance(other, RemoteSocket):
+            return NotImplemented
+        return self.link is other.link and self.conn_id == other.conn_id
+
+    def __hash__(self) -> int:
+        return hash((id(self.link), self.conn_id))
+
+    def send(self, args: List[Any], kind: str = "event") -> None:
+        # The worker only enqueues on the real socket's Outbound, so it drains this link quickly
+        self.link.send({"op": "send", "conn": self.conn_id, "kind": kind, "args": args})
+
+
+class BrokerServer:
+    def __init__(self, url: str, mm: Optional[Matchmaker] = None) -> None:
+        self.url = url
+        self.mm = mm or Matchmaker()
+        self._links: set[_WorkerLink] = set()
+        self._stopping = asyncio.Event()
+
+    def shutdown(self) -> None:
+        """Make `serve_forever` drain, snapshot and return."""
+        self._stopping.set()
+
+    async def serve_forever(self) -> None:
+        """Serve until SIGTERM/SIGINT (or `shutdown()`), then drain and write the snapshot."""
+        await self.mm.start()
+        server = await _start_server(self.url, self._handle_worker)
+        loop = asyncio.get_running_loop()
+        # Without handlers the default SIGTERM action would kill the process before the cleanup below
+        signals = (signal.SIGTERM, signal.SIGINT) if threading.current_thread() is threading.main_thread() else ()
+        for sig in signals:
+            loop.add_signal_handler(sig, self.shutdown)
+        logger.info(f"✅ Matchmaker broker listening on {self.url}")
+        try:
+            await self._stopping.wait()
+            logger.info("[broker] Shutting down")
+        finally:
+            for sig in signals:
+                loop.remove_signal_handler(sig)
+            # Drain first, so the worker links dropping below leave users and rooms as they are
+            await self.mm.drain()
+            server.close()
+            for link in list(self._links):
+                link.writer.close()
+            await server.wait_closed()
+            await self.mm.stop()
+
+    async def _handle_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        link = _WorkerLink(writer)
+        self._links.add(link)
+        logger.info("[broker] worker connected")
+        try:
+            while True:
+                msg = await _read_frame(reader)
+                await self._dispatch(link, msg)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            logger.info("[broker] worker disconnected")
+            self._links.discard(link)
+            writer.close()
+            # Every socket that worker held is gone: same path as a client disconnect
+            lost = [(uid, u.ws) for uid, u in self.mm.users.items()
+                    if isinstance(u.ws, RemoteSocket) and u.ws.link is link]
+            for uid, ws in lost:
+                await self.mm.remove_user(uid, ws=ws)
+
+    async def _dispatch(self, link: _WorkerLink, msg: Dict[str, Any]) -> None:
+        method = msg.get("method")
+        args = list(msg.get("args", []))
+        result: Any = None
+        error: Optional[str] = None
+        if method not in _METHODS:
+            error = f"Unknown method: {method}"
+        else:
+            socket_arg = _METHODS[method]
+            if socket_arg is not None and len(args) > socket_arg and args[socket_arg] is not None:
+                args[socket_arg] = RemoteSocket(link, args[socket_arg])
+            try:
+                result = await getattr(self.mm, method)(*args)
+            except Exception as e:
+                logger.error(f"[broker] {method} failed: {e!r}")
+                error = repr(e)
+        if "id" in msg:
+            link.send({"op": "result", "id": msg["id"], "result": result, "error": error})
+
+
+# ──────────────────────────────────────────────
+# Worker side
+# ──────────────────────────────────────────────
+
+class BrokerError(Exception):
+    pass
+
+
+class BrokerClient:
+    """Matchmaker API for a worker whose matchmaking state lives in the broker."""
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._connect_lock = asyncio.Lock()
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._call_ids = itertools.count()
+        self._conn_ids = itertools.count()
+        # Local connections by id; entries vanish once a connection is garbage collected
+        self._conns: "weakref.WeakValueDictionary[str, Outbound]" = weakref.WeakValueDictionary()
+
+    async def start(self) -> None:
+        await self._ensure_connected()
+
+    async def drain(self) -> None:
+        # Matchmaking state lives in the broker, which drains on its own shutdown; a worker
+        # going away just hands its users to the reconnect grace path
+        pass
+
+    async def stop(self) -> None:
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    # ─── Matchmaker API ─────────────────────────────────────────────────────
+
+    async def register(self, user_id: str, ws: Outbound, avatar: str) -> None:
+        await self._call("register", user_id, self._conn_id(ws), avatar)
+
+    async def join_queue(self, user_id: str, prefs: Dict[str, Any] | None = None) -> None:
+        await self._call("join_queue", user_id, prefs)
+
+    async def handle_reconnect(self, user_id: str, ws: Outbound) -> bool:
+        return bool(await self._call("handle_reconnect", user_id, self._conn_id(ws)))
+
+    async def handle_next(self, user_id: str) -> None:
+        await self._call("handle_next", user_id)
+
+    async def remove_user(self, user_id: str, is_disconnect: bool = True, ws: Optional[Outbound] = None) -> None:
+        await self._call("remove_user", user_id, is_disconnect, None if ws is None else self._conn_id(ws))
+
+    async def relay_message(self, sender_id: str, room: str, text: str, sent_at: int) -> None:
+        await self._cast("relay_message", sender_id, room, text, sent_at)
+
+    async def relay_typing(self, sender_id: str, room: str, is_typing: bool) -> None:
+        await self._cast("relay_typing", sender_id, room, is_typing)
+
+    async def add_push_token(self, user_id: str, token: str) -> None:
+        await self._cast("add_push_token", user_id, token)
+
+    async def remove_push_tokens(self, tokens: List[str]) -> None:
+        await self._call("remove_push_tokens", tokens)
+
+    async def clear_push_tokens(self) -> None:
+        await self._call("clear_push_tokens")
+
+    async def push_stats(self) -> Dict[str, Any]:
+        return await self._call("push_stats")
+
+    async def render_metrics(self) -> str:
+        return await self._call("render_metrics")
+
+    # ─── private ────────────────────────────────────────────────────────────
+
+    def _conn_id(self, conn: Outbound) -> str:
+        if conn.broker_conn_id is None:
+            conn.broker_conn_id = str(next(self._conn_ids))
+            self._conns[conn.broker_conn_id] = conn
+        return conn.broker_conn_id
+
+    async def _ensure_connected(self) -> asyncio.StreamWriter:
+        if self._writer is not None:
+            return self._writer
+        async with self._connect_lock:
+            if self._writer is None:
+                reader, writer = await _open_connection(self.url)
+                self._writer = writer
+                self._reader_task = asyncio.create_task(self._read_loop(reader, writer))
+                logger.info(f"✅ Connected to matchmaker broker at {self.url}")
+        return self._writer
+
+    async def _call(self, method: str, *args: Any) -> Any:
+        writer = await self._ensure_connected()
+        call_id = next(self._call_ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[call_id] = future
+        _write_frame(writer, {"op": "call", "id": call_id, "method": method, "args": list(args)})
+        await writer.drain()
+        return await future
+
+    async def _cast(self, method: str, *args: Any) -> None:
+        """Fire-and-forget call; still ordered with every other call from this worker."""
+        writer = await self._ensure_connected()
+        _write_frame(writer, {"op": "call", "method": method, "args": list(args)})
+        await writer.drain()
+
+    async def _read_loop(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                msg = await _read_frame(reader)
+                op = msg.get("op")
+                if op == "send":
+                    conn = self._conns.get(msg["conn"])
+                    if conn is not None:
+                        kind = msg["kind"]
+                        conn.send(conn.codec.encode(kind, *msg["args"]), kind=kind)
+                elif op == "result":
+                    future = self._pending.pop(msg["id"], None)
+                    if future is None or future.done():
+                        continue
+                    if msg.get("error"):
+                        future.set_exception(BrokerError(msg["error"]))
+                    else:
+                        future.set_result(msg.get("result"))
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            logger.error(f"Lost connection to matchmaker broker: {e!r}")
+        finally:
+            if self._writer is writer:
+                self._writer = None
+            writer.close()
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(BrokerError("broker connection lost"))
+            self._pending.clear()
+
+
+async def _main(url: str) -> None:
+    database.init_db()
+    try:
+        await BrokerServer(url).serve_forever()
+    finally:
+        database.shutdown_db()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Run the shared matchmaker broker.")
+    parser.add_argument("--url", default=settings.MATCHMAKER_BROKER_URL, help="unix:///path or tcp://host:port")
+    args = parser.parse_args()
+    if not args.url:
+        parser.error("set MATCHMAKER_BROKER_URL or pass --url")
+    asyncio.run(_main(args.url))
@@ -0,0 +1,45 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class AsyncTTLCache:
+    """
+    Caches async results per key for `ttl` seconds.
+
+    Concurrent misses on the same key share one load, so a burst of polls
+    right after expiry still costs a single query.
+    """
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self._entries: Dict[Hashable, Tuple[float, Any]] = {}
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def get(self, key: Hashable, load: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > loop.time():
+            return entry[1]
+
+        future = self._inflight.get(key)
+        if future is None:
+            future = self._inflight[key] = asyncio.ensure_future(load())
+            future.add_done_callback(lambda f: self._store(key, f))
+        # A caller that gives up must not cancel the load others are waiting on
+        return await asyncio.shield(future)
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        if key is None:
+            self._entries.clear()
+            self._inflight.clear()
+        else:
+            self._entries.pop(key, None)
+            self._inflight.pop(key, None)
+
+    def _store(self, key: Hashable, future: asyncio.Future) -> None:
+        # Dropped by invalidate() while loading: the result may predate the change
+        if self._inflight.get(key) is not future:
+            return
+        del self._inflight[key]
+        if not future.cancelled() and future.exception() is None:
+            self._entries[key] = (asyncio.get_running_loop().time() + self.ttl, future.result())
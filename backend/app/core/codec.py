@@ -0,0 +1,222 @@
+"""
+WebSocket protocol codecs.
+
+A codec turns server events into wire payloads and inbound frames into dicts.
+Each event kind has its own method taking the event fields positionally:
+
+    paired(room, partner_id, avatar, started_at)
+    message(room, text, sent_at)
+    typing(room, is_typing)
+    system(code, message)
+    queue_size(count)
+    error(message)
+    ping()
+
+`JsonCodec` is the reference implementation (pydantic models + json);
+`FastJsonCodec` produces the same JSON documents without building models,
+using orjson when installed, prebuilt constant frames and string templates
+for frames whose fields are server-generated. Both keep the wire format of
+`frontend/src/types/events.ts`.
+
+`MsgpackCodec` is the binary format of the "chat.msgpack.v1" subprotocol,
+offered when msgpack is installed. Clients opt in through
+Sec-WebSocket-Protocol (see `negotiate`); clients that don't ask get JSON.
+"""
+import json
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from app.models.schemas import (
+    ErrorEvt, Paired, Partner, Ping, QueueSize, ServerMessage, ServerTyping, System,
+)
+from app.settings import settings
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional binary subprotocol
+    msgpack = None
+
+Payload = Union[str, bytes]
+
+
+class JsonCodec:
+    name = "json"
+
+    def __init__(self) -> None:
+        self._encoders: Dict[str, Callable[..., Payload]] = {
+            "paired": self.paired,
+            "message": self.message,
+            "typing": self.typing,
+            "system": self.system,
+            "queue_size": self.queue_size,
+            "error": self.error,
+            "ping": self.ping,
+        }
+
+    def encode(self, kind: str, *args: Any) -> Payload:
+        return self._encoders[kind](*args)
+
+    def decode(self, raw: Payload) -> Dict[str, Any]:
+        return json.loads(raw)
+
+    def paired(self, room: str, partner_id: str, avatar: str, started_at: int) -> Payload:
+        evt = Paired(room=room, partner=Partner(id=partner_id, avatar=avatar), startedAt=started_at)
+        return json.dumps(evt.model_dump())
+
+    def message(self, room: str, text: str, sent_at: int) -> Payload:
+        return json.dumps(ServerMessage(room=room, text=text, sentAt=sent_at).model_dump())
+
+    def typing(self, room: str, is_typing: bool) -> Payload:
+        return json.dumps(ServerTyping(room=room, isTyping=is_typing).model_dump())
+
+    def system(self, code: str, message: str) -> Payload:
+        return json.dumps(System(code=code, message=message).model_dump())
+
+    def queue_size(self, count: int) -> Payload:
+        return json.dumps(QueueSize(count=count).model_dump())
+
+    def error(self, message: str) -> Payload:
+        return json.dumps(ErrorEvt(message=message).model_dump())
+
+    def ping(self) -> Payload:
+        return json.dumps(Ping().model_dump())
+
+
+if orjson is not None:
+    def _dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode()
+
+    _loads = orjson.loads
+else:
+    def _dumps(obj: Any) -> str:
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+    _loads = json.loads
+
+
+class FastJsonCodec(JsonCodec):
+    """
+    Same JSON documents as JsonCodec, built without pydantic.
+
+    Room ids are server-generated hex strings (relays only accept known
+    rooms), so frames made only of room ids, booleans and integers are
+    filled into templates; anything carrying user input goes through the
+    JSON encoder.
+    """
+
+    name = "json-fast"
+
+    def decode(self, raw: Payload) -> Dict[str, Any]:
+        return _loads(raw)
+
+    def paired(self, room: str, partner_id: str, avatar: str, started_at: int) -> Payload:
+        return _dumps({
+            "type": "paired",
+            "room": room,
+            "partner": {"id": partner_id, "avatar": avatar},
+            "startedAt": started_at,
+        })
+
+    def message(self, room: str, text: str, sent_at: int) -> Payload:
+        return _dumps({"type": "message", "room": room, "text": text, "sentAt": sent_at})
+
+    def typing(self, room: str, is_typing: bool) -> Payload:
+        return '{"type":"typing","room":"%s","isTyping":%s}' % (room, "true" if is_typing else "false")
+
+    @lru_cache(maxsize=64)
+    def system(self, code: str, message: str) -> Payload:
+        return _dumps({"type": "system", "code": code, "message": message})
+
+    def queue_size(self, count: int) -> Payload:
+        return '{"type":"queue_size","count":%d}' % count
+
+    @lru_cache(maxsize=64)
+    def error(self, message: str) -> Payload:
+        return _dumps({"type": "error", "message": message})
+
+    def ping(self) -> Payload:
+        return '{"type":"ping"}'
+
+
+class MsgpackCodec(JsonCodec):
+    """
+    Binary frames: every server event is a msgpack array of a numeric tag
+    followed by the event fields in the order listed above, e.g.
+    `[2, room, text, sentAt]` for a message. Tags: paired 1, message 2,
+    typing 3, system 4, queue_size 5, error 6, ping 7.
+
+    Clients send `message` and `typing` the same way (`[2, room, text,
+    sentAt]`, `[3, room, isTyping]`) and any other frame as a msgpack map
+    shaped like its JSON counterpart. Text frames are still read as JSON.
+    """
+
+    name = "msgpack"
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._pack = msgpack.Packer().pack
+
+    def decode(self, raw: Payload) -> Dict[str, Any]:
+        if isinstance(raw, str):
+            return _loads(raw)
+        data = msgpack.unpackb(raw)
+        if isinstance(data, dict):
+            return data
+        tag = data[0]
+        if tag == 2:
+            _, room, text, sent_at = data
+            return {"type": "message", "room": room, "text": text, "sentAt": sent_at}
+        if tag == 3:
+            _, room, is_typing = data
+            return {"type": "typing", "room": room, "isTyping": is_typing}
+        raise ValueError(f"Unknown frame tag: {tag!r}")
+
+    def paired(self, room: str, partner_id: str, avatar: str, started_at: int) -> Payload:
+        return self._pack((1, room, partner_id, avatar, started_at))
+
+    def message(self, room: str, text: str, sent_at: int) -> Payload:
+        return self._pack((2, room, text, sent_at))
+
+    def typing(self, room: str, is_typing: bool) -> Payload:
+        return self._pack((3, room, is_typing))
+
+    @lru_cache(maxsize=64)
+    def system(self, code: str, message: str) -> Payload:
+        return self._pack((4, code, message))
+
+    def queue_size(self, count: int) -> Payload:
+        return self._pack((5, count))
+
+    @lru_cache(maxsize=64)
+    def error(self, message: str) -> Payload:
+        return self._pack((6, message))
+
+    def ping(self) -> Payload:
+        return self._pack((7,))
+
+
+CODECS: Dict[str, JsonCodec] = {c.name: c for c in (JsonCodec(), FastJsonCodec())}
+if msgpack is not None:
+    CODECS["msgpack"] = MsgpackCodec()
+
+# Codec used for connections that don't negotiate a subprotocol
+default_codec = CODECS[settings.WS_CODEC]
+
+# Sec-WebSocket-Protocol values the server accepts, and the codec each one selects
+SUBPROTOCOLS: Dict[str, JsonCodec] = {"chat.json.v1": default_codec}
+if msgpack is not None:
+    SUBPROTOCOLS["chat.msgpack.v1"] = CODECS["msgpack"]
+
+
+def negotiate(offered: List[str]) -> Tuple[Optional[str], JsonCodec]:
+    """Pick the first subprotocol the client offered that we support; none offered means legacy JSON."""
+    for name in offered:
+        codec = SUBPROTOCOLS.get(name)
+        if codec is not None:
+            return name, codec
+    return None, default_codec
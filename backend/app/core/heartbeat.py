@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, List, Optional
+
+from app.core import metrics
+from app.core.outbound import Outbound
+from app.core.timer_wheel import TimerWheel
+from app.settings import settings
+
+logger = logging.getLogger("uvicorn.error")
+
+# Close code sent to connections reaped for missing heartbeats ("Going Away")
+HEARTBEAT_CLOSE_CODE = 1001
+
+PINGS_SENT = metrics.Counter("chat_ws_pings_sent_total", "Heartbeat pings sent to idle client sockets")
+ZOMBIES_REAPED = metrics.Counter(
+    "chat_ws_zombies_reaped_total",
+    "Client sockets evicted by the heartbeat: no frame within the timeout after a ping, or writes already failing",
+    ("reason",),
+)
+
+
+class Peer:
+    """Heartbeat state of one watched connection."""
+
+    __slots__ = ("conn", "on_dead", "last_seen", "pinged_at", "answers")
+
+    def __init__(self, conn: Outbound, on_dead: Callable[[], Awaitable[None]]) -> None:
+        self.conn = conn
+        self.on_dead = on_dead
+        self.last_seen = time.monotonic()
+        # When the outstanding ping went out, or None
+        self.pinged_at: Optional[float] = None
+        # Set once the client has answered a ping, which makes it eligible for reaping
+        self.answers = False
+
+    def seen(self) -> None:
+        """Any inbound frame proves the connection is alive."""
+        self.last_seen = time.monotonic()
+
+    def pong(self) -> None:
+        self.answers = True
+        self.last_seen = time.monotonic()
+
+
+class Heartbeat:
+    """
+    Application-level ping/pong for every socket, driven by one timer wheel.
+
+    Each watched connection has a single wheel deadline. Reading a frame
+    only stamps `Peer.last_seen`; the wheel entry is re-armed lazily when it
+    comes due, so busy sockets cost nothing per frame and never get pinged.
+    A socket silent for `interval` is sent a ping. If nothing arrives within
+    `timeout` after it, the socket is reaped through its `on_dead` callback.
+
+    Clients that have never answered a ping (builds that predate it) are
+    kept pinged but not reaped on silence alone; their sockets are reaped
+    once writes to them fail. Sockets whose writer already failed are reaped
+    at their next deadline either way.
+    """
+
+    def __init__(self, interval: Optional[float] = None, timeout: Optional[float] = None, tick: float = 1.0) -> None:
+        self.interval = interval or settings.HEARTBEAT_INTERVAL_SECONDS
+        self.timeout = timeout or settings.HEARTBEAT_TIMEOUT_SECONDS
+        self.reaped = 0
+        # Deadlines only need about a second of precision
+        self.wheel = TimerWheel(tick, int(max(self.interval, self.timeout) / tick) + 2, self._due)
+
+    def __len__(self) -> int:
+        return len(self.wheel)
+
+    def watch(self, conn: Outbound, on_dead: Callable[[], Awaitable[None]]) -> Peer:
+        peer = Peer(conn, on_dead)
+        self.wheel.schedule(peer, self.interval)
+        return peer
+
+    def unwatch(self, peer: Peer) -> None:
+        self.wheel.cancel(peer)
+
+    async def stop(self) -> None:
+        await self.wheel.stop()
+
+    # ─── private ────────────────────────────────────────────────────────────
+
+    async def _due(self, peers: List[Peer]) -> None:
+        now = time.monotonic()
+        dead: List[Peer] = []
+        for peer in peers:
+            if peer.conn.closed:
+                ZOMBIES_REAPED.inc("write_failed")
+                dead.append(peer)
+                continue
+            if peer.pinged_at is not None and peer.last_seen < peer.pinged_at:
+                if peer.answers:
+                    ZOMBIES_REAPED.inc("timeout")
+                    dead.append(peer)
+                    continue
+                # Never answered a ping: keep probing, once per interval
+                peer.pinged_at = None
+                self.wheel.schedule(peer, self.interval)
+                continue
+            idle = now - peer.last_seen
+            if idle < self.interval:
+                peer.pinged_at = None
+                self.wheel.schedule(peer, self.interval - idle)
+                continue
+            peer.pinged_at = now
+            peer.conn.send(peer.conn.codec.ping(), kind="ping")
+            PINGS_SENT.inc()
+            self.wheel.schedule(peer, self.timeout)
+
+        if dead:
+            self.reaped += len(dead)
+            logger.warning(f"[WS] Heartbeat reaped {len(dead)} dead connection(s)")
+            results = await asyncio.gather(*(p.on_dead() for p in dead), return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error(f"[WS] Reaping a dead connection failed: {result!r}")
+
+
+heartbeat = Heartbeat()
+metrics.GaugeFunc("chat_ws_heartbeat_watched", "Client sockets watched by the heartbeat", lambda: len(heartbeat))
@@ -0,0 +1,167 @@
+"""
+Preference-aware waiting queue.
+
+Users may send match preferences with `join_queue`:
+
+    "prefs": {"language": "en", "region": "eu", "interests": ["music", "games"]}
+
+Two users are compatible when, for every attribute both of them set, they
+share a value; an attribute only one side sets doesn't constrain the pair.
+Users without preferences are compatible with everyone, so when nobody
+sends any this is the plain FIFO queue it replaces.
+
+Instead of scanning the queue for a compatible user, every waiting user is
+filed under bucket keys made of one component per attribute, and a joining
+user reads the heads of the buckets that can hold a compatible user:
+
+- a user is filed under each of their values or NONE if they set none,
+  and under ANY for every attribute
+- a searcher looks up each of their values plus NONE for an attribute
+  they set, and ANY for one they don't
+
+Each side is a cartesian product over the attributes, at most
+2 · 2 · (MATCH_MAX_INTERESTS + 1) keys, so filing, removal and lookup cost
+the same at any queue length. The oldest head among the looked-up buckets
+is the longest-waiting compatible user. The all-ANY bucket holds everyone,
+in join order.
+
+The Matchmaker `relax`es users who are still waiting MATCH_FALLBACK_SECONDS
+after joining: from then on they match anyone, so pairing latency stays
+bounded however narrow their preferences are.
+"""
+import itertools
+import re
+from functools import lru_cache
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from app.core.waiting_queue import WaitingQueue
+from app.settings import settings
+
+# Preferences as normalized value tuples, in ATTRIBUTES order
+Prefs = Tuple[Tuple[str, ...], ...]
+Key = Tuple[str, ...]
+
+ATTRIBUTES = ("language", "region", "interests")
+# Key components besides attribute values, which are never empty and never "*"
+NONE = ""
+ANY = "*"
+ANY_KEY: Key = (ANY,) * len(ATTRIBUTES)
+
+_VALUE = re.compile(r"^[a-z0-9][a-z0-9_-]{0,31}$")
+
+
+def parse_prefs(raw: Any) -> Optional[Prefs]:
+    """Normalize client preferences; values that aren't short slugs are ignored. None if nothing is left."""
+    if not isinstance(raw, dict):
+        return None
+    prefs = []
+    for attr in ATTRIBUTES:
+        value = raw.get(attr)
+        values = value if isinstance(value, list) else [value]
+        clean = sorted({v.strip().lower() for v in values if isinstance(v, str)} - {""})
+        clean = [v for v in clean if _VALUE.match(v)]
+        if attr == "interests":
+            clean = clean[:settings.MATCH_MAX_INTERESTS]
+        else:
+            clean = clean[:1]
+        prefs.append(tuple(clean))
+    return tuple(prefs) if any(prefs) else None
+
+
+def compatible(a: Optional[Prefs], b: Optional[Prefs]) -> bool:
+    if a is None or b is None:
+        return True
+    return all(not x or not y or not set(x).isdisjoint(y) for x, y in zip(a, b))
+
+
+# Both are cached: users with the same preferences share one tuple of keys
+
+@lru_cache(maxsize=4096)
+def filing_keys(prefs: Optional[Prefs]) -> Tuple[Key, ...]:
+    if prefs is None:
+        return tuple(itertools.product(*[(NONE, ANY)] * len(ATTRIBUTES)))
+    return tuple(itertools.product(*[(*values, ANY) if values else (NONE, ANY) for values in prefs]))
+
+
+@lru_cache(maxsize=4096)
+def lookup_keys(prefs: Optional[Prefs]) -> Tuple[Optional[Key], ...]:
+    """Buckets that can hold a user compatible with `prefs`; None stands for the relaxed users."""
+    if prefs is None:
+        return (ANY_KEY,)
+    return (*itertools.product(*[(*values, NONE) if values else (ANY,) for values in prefs]), None)
+
+
+class MatchEngine:
+    """Waiting users, bucketed by preferences so a compatible partner is found without a scan."""
+
+    __slots__ = ("_buckets", "_relaxed", "_keys", "_seq", "_counter")
+
+    def __init__(self) -> None:
+        self._buckets: Dict[Key, WaitingQueue] = {ANY_KEY: WaitingQueue()}
+        # Users whose preferences were dropped, in the order that happened. They stay in
+        # their own buckets too; being compatible with everyone, every lookup checks here.
+        self._relaxed = WaitingQueue()
+        # user → the keys they are filed under, and their join order
+        self._keys: Dict[str, Tuple[Key, ...]] = {}
+        self._seq: Dict[str, int] = {}
+        self._counter = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, user_id: object) -> bool:
+        return user_id in self._keys
+
+    def __iter__(self) -> Iterator[str]:
+        """Waiting users in join order."""
+        return iter(self._buckets[ANY_KEY])
+
+    def append(self, user_id: str, prefs: Optional[Prefs] = None) -> bool:
+        """File a user at the back of their buckets; returns False if they are already waiting."""
+        if user_id in self._keys:
+            return False
+        keys = filing_keys(prefs)
+        for key in keys:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = WaitingQueue()
+            bucket.append(user_id)
+        self._keys[user_id] = keys
+        self._seq[user_id] = next(self._counter)
+        return True
+
+    def discard(self, user_id: str) -> bool:
+        keys = self._keys.pop(user_id, None)
+        if keys is None:
+            return False
+        del self._seq[user_id]
+        self._relaxed.discard(user_id)
+        for key in keys:
+            bucket = self._buckets[key]
+            bucket.discard(user_id)
+            if not bucket and key != ANY_KEY:
+                del self._buckets[key]
+        return True
+
+    def find(self, prefs: Optional[Prefs], exclude: Optional[str] = None) -> Optional[str]:
+        """The longest-waiting user compatible with `prefs`, other than `exclude`."""
+        best: Optional[str] = None
+        best_seq = -1
+        for key in lookup_keys(prefs):
+            bucket = self._buckets.get(key) if key is not None else self._relaxed
+            if not bucket:
+                continue
+            head = bucket.peek()
+            if head == exclude:
+                head = bucket.peek(1)
+                if head is None:
+                    continue
+            seq = self._seq[head]
+            if best is None or seq < best_seq:
+                best, best_seq = head, seq
+        return best
+
+    def relax(self, user_id: str) -> None:
+        """Let a waiting user match anyone from now on, as if they had sent no preferences."""
+        if user_id in self._keys:
+            self._relaxed.append(user_id)
@@ -1,211 +1,539 @@
 import asyncio
-import json
+import gc
+import math
 import time
 import uuid
 import logging
-from collections import deque
-from typing import Dict
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Tuple
 
-from fastapi import WebSocket
-
-from app.models.schemas import (
-    Paired, Partner, QueueSize, ServerMessage, ServerTyping, System,
-)
 from app.models.types import Room, UserConn
-from app.core.push_service import push_service
-from app.db import database
+from app.core import metrics, snapshot
+from app.core.broadcaster import QueueSizeBroadcaster
+from app.core.codec import JsonCodec, Payload
+from app.core.match_engine import MatchEngine, parse_prefs
+from app.core.notifier import CAMPAIGNS, NotificationScheduler
+from app.core.outbound import SENDS_DROPPED, Outbound
+from app.core.profiler import ProfiledLock
+from app.core.push_index import INDEXED, push_index
+from app.core.push_service import RECEIPTS, TICKETS, push_service
+from app.core.timer_wheel import TimerWheel
+from app.settings import settings
 
 logger = logging.getLogger("uvicorn.error")
 
+# Events produced while holding a lock, enqueued only after it is released:
+# (user id, event kind, event fields in codec argument order)
+Outbox = List[Tuple[str, str, tuple]]
+
+PAIR_WAIT = metrics.Histogram("chat_pair_wait_seconds", "Time from entering the waiting queue to being paired")
+PAIRS = metrics.Counter(
+    "chat_pairs_total", "Rooms created: on a join, or once a waiting user's preferences timed out", ("match",),
+)
+TYPING_FRAMES = metrics.Counter(
+    "chat_typing_frames_total", "Client typing frames: forwarded, suppressed as a repeat, or partner in grace",
+    ("outcome",),
+)
+TYPING_GENERATED = metrics.Counter(
+    "chat_typing_generated_total", "Typing frames the server sent itself: deferred refreshes and timeouts", ("reason",),
+)
+# Series read from the process that runs the matchmaker: with a broker, its copies, not the worker's
+STATE_METRICS = frozenset(
+    [m.name for m in (PAIR_WAIT, PAIRS, TYPING_FRAMES, TYPING_GENERATED, CAMPAIGNS, TICKETS, RECEIPTS, INDEXED)]
+    + ["chat_users", "chat_waiting_users", "chat_active_rooms", "chat_grace_teardowns_pending"]
+)
+
 
 class Matchmaker:
     def __init__(self) -> None:
         self.users: Dict[str, UserConn] = {}
-        self.waiting: deque[str] = deque()
+        # Waiting users, indexed by match preferences
+        self.waiting = MatchEngine()
         self.rooms: Dict[str, Room] = {}
-        self.lock = asyncio.Lock()
-        self.previous_wait_count = 0
+        # Queue membership and pairing share one short critical section; room
+        # lifecycle (next / leave / reconnect / teardown) is serialized per room
+        # on a striped lock. Nothing awaits I/O while holding either.
+        self.pair_lock = ProfiledLock("pair")
+        self.room_locks = [ProfiledLock("room") for _ in range(settings.ROOM_LOCK_STRIPES)]
+        # Reconnect grace deadlines, keyed by user id; expired in batches per tick
+        tick = settings.TIMER_WHEEL_TICK_MS / 1000
+        self.grace = TimerWheel(
+            tick,
+            slots=math.ceil(settings.RECONNECT_GRACE_SECONDS / tick) + 1,
+            on_expire=self._expire_graces,
+        )
+        # Waiting users with preferences, due to be relaxed to match anyone
+        self.match_fallback = TimerWheel(
+            tick,
+            slots=math.ceil(settings.MATCH_FALLBACK_SECONDS / tick) + 1,
+            on_expire=self._relax_prefs,
+        )
+        # Per typing sender, the next deferred refresh or timeout
+        self.typing_timers = TimerWheel(
+            tick,
+            slots=math.ceil(settings.TYPING_TIMEOUT_MS / 1000 / tick) + 1,
+            on_expire=self._typing_due,
+        )
+        self.queue_size = QueueSizeBroadcaster(
+            self._queue_size_snapshot,
+            interval=settings.QUEUE_SIZE_BROADCAST_INTERVAL_MS / 1000,
+        )
+        # Online users are never pushed
+        self.notifier = NotificationScheduler(lambda: len(self.waiting), lambda: self.users)
+        # Set on shutdown: joins are refused and disconnects leave state as is for the snapshot
+        self.draining = False
+        # Users waiting when the last snapshot was taken → when they started waiting, kept
+        # through the grace period so a re-join resumes the wait instead of starting over
+        self.rejoin: Dict[str, float] = {}
 
-    async def register(self, user_id: str, ws: WebSocket, avatar: str) -> None:
-        self.users[user_id] = {"id": user_id, "ws": ws, "avatar": avatar, "disconnect_task": None}
+    async def start(self) -> None:
+        self._register_metrics()
+        if settings.MATCHMAKER_SNAPSHOT_PATH:
+            self.load_snapshot(settings.MATCHMAKER_SNAPSHOT_PATH)
+        # Push candidates are picked wherever the matchmaker runs
+        await push_index.load()
+        push_index.start()
 
-    async def join_queue(self, user_id: str) -> None:
-        async with self.lock:
-            if user_id not in self.waiting and not self.users.get(user_id, {}).get("room_id"):
-                self.waiting.append(user_id)
+    async def drain(self) -> None:
+        """Stop matchmaking ahead of a shutdown so the current state can be snapshotted."""
+        if self.draining:
+            return
+        self.draining = True
+        # Grace periods stop running out; they resume from the snapshot
+        await self.grace.stop()
+        await self.match_fallback.stop()
+        logger.info(f"[WS] Draining: {len(self.rooms)} rooms, {len(self.waiting)} waiting")
 
-                current_count = len(self.waiting)
-                if current_count >= 1:
-                    logger.info(f"Liquidity event detected: {current_count} in queue. Triggering notifications.")
-                    await self._trigger_notifications(current_count)
+    async def stop(self) -> None:
+        if self.draining and settings.MATCHMAKER_SNAPSHOT_PATH:
+            self.save_snapshot(settings.MATCHMAKER_SNAPSHOT_PATH)
+        await self.grace.stop()
+        await self.match_fallback.stop()
+        await self.typing_timers.stop()
+        await self.notifier.stop()
+        await push_service.aclose()
+        await push_index.stop()
 
-                self.previous_wait_count = current_count
-                await self._broadcast_queue_size()
-            await self._try_pair()
+    async def register(self, user_id: str, ws: Outbound, avatar: str) -> None:
+        old = self.users.get(user_id)
+        if old is not None:
+            # A re-join from another socket is queued afresh by join_queue, with the
+            # preferences it sends now; the old registration's place and wait go with it
+            async with self.pair_lock:
+                self.waiting.discard(user_id)
+            if old.room is not None:
+                # Joining afresh from another socket ends the chat the old one was in, rather than
+                # leaving the room holding a registration that is no longer in self.users
+                await self.remove_user(user_id, is_disconnect=False)
+        self.users[user_id] = UserConn(user_id, ws, avatar)
 
-    async def handle_reconnect(self, user_id: str, ws: WebSocket) -> bool:
-        async with self.lock:
+    async def join_queue(self, user_id: str, prefs: Dict[str, Any] | None = None) -> None:
+        """Queue a user, pairing them at once with the longest-waiting compatible user if there is one."""
+        outbox: Outbox = []
+        parsed = parse_prefs(prefs)
+        async with self.pair_lock:
             user = self.users.get(user_id)
-            if not user:
-                return False
-                
-            room_id = user.get("room_id")
-            if not room_id:
+            if self.draining:
+                logger.info(f"[WS] Draining, not queueing {user_id}")
+            elif user and user_id not in self.waiting and user.room is None:
+                user.prefs = parsed
+                user.queued_at = self.rejoin.pop(user_id, None) or time.monotonic()
+                self._enqueue(user, outbox)
+                self.queue_size.mark_dirty()
+                self.notifier.observe()
+        self._deliver(outbox)
+
+    async def handle_reconnect(self, user_id: str, ws: Outbound) -> bool:
+        user = self.users.get(user_id)
+        if not user or user.room is None:
+            return False
+
+        room = user.room
+        async with self._room_lock(room.id):
+            # The room may have been torn down while we waited for its lock
+            if self.users.get(user_id) is not user or user.room is not room:
                 return False
 
-            # Cancel the teardown task if it's running
-            task = user.get("disconnect_task")
-            if task and not task.done():
-                task.cancel()
-            user["disconnect_task"] = None
-            
+            # Stop the grace period if it's running
+            if user.grace_until is not None:
+                user.grace_until = None
+                self.grace.cancel(user_id)
+
             # Update websocket
-            user["ws"] = ws
-            logger.info(f"[WS] {user_id} successfully reconnected to room {room_id}.")
-            return True
+            user.ws = ws
+        logger.info(f"[WS] {user_id} successfully reconnected to room {room.id}.")
+        return True
 
     async def handle_next(self, user_id: str) -> None:
-        async with self.lock:
-            room_id = self.users.get(user_id, {}).get("room_id")
-            if not room_id:
-                return
-            room = self.rooms.get(room_id)
-            if not room:
+        outbox: Outbox = []
+        leaver = self.users.get(user_id)
+        room = leaver.room if leaver else None
+        if room is None:
+            return
+        async with self._room_lock(room.id):
+            if not self._teardown_room(room, leaver=leaver, partner_idle=True, outbox=outbox):
                 return
-            clicker = room["u1"] if room["u1"] == user_id else room["u2"]
-            await self._teardown_room(room_id, leaver=clicker, partner_idle=True)
-            await self._send_system(clicker, code="searching", message="Searching for the next stranger…")
-            if clicker not in self.waiting:
-                self.waiting.append(clicker)
-            await self._broadcast_queue_size()
-            await self._try_pair()
-
-    async def remove_user(self, user_id: str, is_disconnect: bool = True) -> None:
-        async with self.lock:
-            try:
-                self.waiting.remove(user_id)
-            except ValueError:
-                pass
-            
+            outbox.append((user_id, "system", ("searching", "Searching for the next stranger…")))
+
+        async with self.pair_lock:
             user = self.users.get(user_id)
-            if not user:
-                return
+            # Requeued with the preferences they joined with
+            if user and user.room is None and user_id not in self.waiting:
+                user.queued_at = time.monotonic()
+                self._enqueue(user, outbox)
+        self.queue_size.mark_dirty()
+        self._deliver(outbox)
 
-            room_id = user.get("room_id")
-            if room_id:
-                if is_disconnect:
-                    # User is in a room. Give them a 30s grace period to reconnect.
-                    if not user.get("disconnect_task"):
-                        logger.info(f"[WS] {user_id} disconnected while in room {room_id}. Starting 30s grace period.")
-                        user["disconnect_task"] = asyncio.create_task(self._delayed_teardown(user_id, room_id))
-                else:
+    async def remove_user(self, user_id: str, is_disconnect: bool = True, ws: Outbound | None = None) -> None:
+        """Handle a leave or a lost socket. With `ws`, only if it is still the user's socket."""
+        outbox: Outbox = []
+        user = self.users.get(user_id)
+        # A late disconnect of a socket the user has since replaced (reconnect or re-join)
+        if not user or (ws is not None and user.ws != ws):
+            return
+        if is_disconnect and self.draining:
+            return  # kept for the snapshot; the user reconnects to the next process
+
+        async with self.pair_lock:
+            if self.users.get(user_id) is user:
+                self.waiting.discard(user_id)
+
+        room = user.room
+        if room is not None:
+            async with self._room_lock(room.id):
+                if ws is not None and user.ws != ws:
+                    return  # reconnected on another socket while we waited for the lock
+                if user.room is room:
+                    if is_disconnect:
+                        # User is in a room. Give them a grace period to reconnect.
+                        if user.grace_until is None:
+                            grace = settings.RECONNECT_GRACE_SECONDS
+                            logger.info(f"[WS] {user_id} disconnected while in room {room.id}. Starting {grace:g}s grace period.")
+                            user.grace_until = time.monotonic() + grace
+                            self.grace.schedule(user_id, grace)
+                        return
                     # User explicitly left the room, tear down immediately.
-                    await self._teardown_room(room_id, leaver=user_id, partner_idle=True)
-                    self.users.pop(user_id, None)
-                    await self._broadcast_queue_size()
-            else:
-                # User not in a room, remove immediately.
-                self.users.pop(user_id, None)
-                await self._broadcast_queue_size()
+                    self._teardown_room(room, leaver=user, partner_idle=True, outbox=outbox)
+
+        # User not in a room (or just left it), remove immediately.
+        self._forget(user_id, user)
+        self.queue_size.mark_dirty()
+        self._deliver(outbox)
 
     async def relay_message(self, sender_id: str, room: str, text: str, sent_at: int) -> None:
-        r = self.rooms.get(room)
-        if not r:
+        sender = self.users.get(sender_id)
+        # Only relay into the room the sender is actually in
+        if not sender or sender.room is None or sender.room.id != room:
             return
-        evt = ServerMessage(room=room, text=text, sentAt=sent_at).model_dump()
-        await asyncio.gather(*[self._safe_send(uid, evt) for uid in (r["u1"], r["u2"])])
+        self._send_many((sender, sender.partner), "message", (room, text, sent_at))
 
     async def relay_typing(self, sender_id: str, room: str, is_typing: bool) -> None:
-        r = self.rooms.get(room)
-        if not r:
+        """
+        Forward typing state changes right away. A repeated isTyping=true is
+        held back until TYPING_REFRESH_MS after the last one sent, then sent
+        once to keep the partner's indicator up.
+        """
+        sender = self.users.get(sender_id)
+        if not sender or sender.room is None or sender.room.id != room:
+            return
+        now = time.monotonic()
+        if not is_typing:
+            self.typing_timers.cancel(sender_id)
+            if not sender.typing:
+                TYPING_FRAMES.inc("suppressed")
+                return
+            TYPING_FRAMES.inc(self._forward_typing(sender, False, now))
             return
-        other = r["u2"] if r["u1"] == sender_id else r["u1"]
-        evt = ServerTyping(room=room, isTyping=is_typing).model_dump()
-        await self._safe_send(other, evt)
 
-    # ─── private ────────────────────────────────────────────────────────────
+        sender.typing_seen_at = now
+        if sender.typing and now - sender.typing_sent_at < settings.TYPING_REFRESH_MS / 1000:
+            TYPING_FRAMES.inc("suppressed")
+        else:
+            TYPING_FRAMES.inc(self._forward_typing(sender, True, now))
+        self._arm_typing(sender, now)
 
-    async def _trigger_notifications(self, pool_size: int) -> None:
-        connected_users = list(self.users.keys())
-        # 30-minute cooldown: each device gets at most 1 push per 30 minutes
-        eligible_tokens = database.get_eligible_tokens(
-            limit=100, cooldown_minutes=30, exclude_user_ids=connected_users
-        )
-        logger.info(f"Found {len(eligible_tokens)} eligible tokens for push (active users: {len(connected_users)})")
-        if eligible_tokens:
-            asyncio.create_task(push_service.send_push_notifications(eligible_tokens, pool_size))
+    async def add_push_token(self, user_id: str, token: str) -> None:
+        push_index.add(token, user_id)
+
+    async def remove_push_tokens(self, tokens: List[str]) -> None:
+        push_index.remove(tokens)
+
+    async def clear_push_tokens(self) -> None:
+        push_index.clear()
+
+    async def push_stats(self) -> Dict[str, Any]:
+        return push_service.snapshot_stats()
+
+    async def render_metrics(self) -> str:
+        """Exposition text of the `STATE_METRICS` series."""
+        return metrics.REGISTRY.render(only=STATE_METRICS)
 
-    async def _delayed_teardown(self, user_id: str, room_id: str) -> None:
-        """Wait 30 seconds before tearing down the room."""
+    def save_snapshot(self, path: str) -> None:
+        started = time.perf_counter()
         try:
-            await asyncio.sleep(30)
-            async with self.lock:
-                logger.info(f"[WS] 30s grace period ended for {user_id} in room {room_id}. Tearing down.")
-                user = self.users.get(user_id)
-                # If the task completed and wasn't cancelled, we do the teardown.
-                if user and user.get("room_id") == room_id:
-                    await self._teardown_room(room_id, leaver=user_id, partner_idle=True)
-                self.users.pop(user_id, None)
-        except asyncio.CancelledError:
-            logger.info(f"[WS] Reconnected {user_id} before grace period ended.")
-
-    async def _teardown_room(self, room_id: str, leaver: str | None, partner_idle: bool) -> None:
-        room = self.rooms.pop(room_id, None)
-        if not room:
+            size = snapshot.save(self.snapshot(), path)
+        except OSError as e:
+            logger.error(f"Could not write matchmaker snapshot {path}: {e!r}")
             return
-        for uid in (room["u1"], room["u2"]):
-            if uid in self.users:
-                self.users[uid]["room_id"] = None
+        logger.info(f"✅ Wrote matchmaker snapshot ({len(self.rooms)} rooms, {len(self.waiting)} waiting, "
+                    f"{size / 1024:.0f} KB) in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    def load_snapshot(self, path: str) -> bool:
+        """Restore from the snapshot at `path`, if there is one; returns whether one was loaded."""
+        started = time.perf_counter()
+        # Bulk load of long-lived objects: cyclic GC passes over them would only add time
+        gc.disable()
+        try:
+            state = snapshot.load(path)
+            if state is None:
+                return False
+            rooms, waiting = self.restore(state)
+        finally:
+            gc.enable()
+        logger.info(f"✅ Restored {rooms} rooms and {waiting} waiting users from snapshot "
+                    f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return True
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Rooms and the waiting queue in the layout of app/core/snapshot.py; times are relative to now."""
+        now = time.monotonic()
+        grace = settings.RECONNECT_GRACE_SECONDS
+        rooms = []
+        for room in self.rooms.values():
+            u1, u2 = room.u1, room.u2
+            # Users still connected at drain time get a whole grace period to come back
+            rooms.append((
+                room.id, room.created_at,
+                u1.id, u1.avatar, grace if u1.grace_until is None else u1.grace_until - now,
+                u2.id, u2.avatar, grace if u2.grace_until is None else u2.grace_until - now,
+            ))
+        waiting = [(uid, now - self.users[uid].queued_at) for uid in self.waiting]
+        return {"version": snapshot.SNAPSHOT_VERSION, "taken_at": time.time(), "rooms": rooms, "waiting": waiting}
+
+    def restore(self, state: Dict[str, Any]) -> Tuple[int, int]:
+        """
+        Load a snapshot into an idle matchmaker: every room member is put in
+        a reconnect grace period, less the time since the snapshot was taken.
+        Returns how many rooms and waiting users were restored.
+        """
+        now = time.monotonic()
+        downtime = max(0.0, time.time() - state["taken_at"])
+        users, rooms = self.users, self.rooms
+        deadlines: List[Tuple[str, float]] = []
+        restored = 0
+        for room_id, created_at, id1, avatar1, left1, id2, avatar2, left2 in state["rooms"]:
+            left1 -= downtime
+            left2 -= downtime
+            # A grace period that ran out meanwhile would have ended the room
+            if left1 <= 0 or left2 <= 0 or id1 in users or id2 in users:
+                continue
+            user1 = UserConn(id1, snapshot.DETACHED, avatar1)
+            user2 = UserConn(id2, snapshot.DETACHED, avatar2)
+            room = Room(room_id, user1, user2, created_at)
+            user1.room = user2.room = room
+            user1.partner, user2.partner = user2, user1
+            user1.grace_until = now + left1
+            user2.grace_until = now + left2
+            users[id1] = user1
+            users[id2] = user2
+            rooms[room_id] = room
+            deadlines.append((id1, left1))
+            deadlines.append((id2, left2))
+            restored += 1
+
+        left = settings.RECONNECT_GRACE_SECONDS - downtime
+        if left > 0:
+            for uid, waited in state["waiting"]:
+                self.rejoin[uid] = now - waited - downtime
+                deadlines.append((uid, left))
+        self.grace.schedule_many(deadlines)
+        return restored, len(self.rejoin)
+
+    # ─── private ────────────────────────────────────────────────────────────
+
+    def _register_metrics(self) -> None:
+        """Scrape-time gauges over this instance's state; the serving matchmaker registers last."""
+        metrics.GaugeFunc("chat_users", "Registered users, including those in a reconnect grace period",
+                          lambda: len(self.users))
+        metrics.GaugeFunc("chat_waiting_users", "Users in the waiting queue", lambda: len(self.waiting))
+        metrics.GaugeFunc("chat_active_rooms", "Rooms with two paired users", lambda: len(self.rooms))
+        metrics.GaugeFunc("chat_grace_teardowns_pending", "Disconnected users still inside their grace period",
+                          lambda: len(self.grace))
+
+    def _room_lock(self, room_id: str) -> asyncio.Lock:
+        return self.room_locks[self._room_stripe(room_id)]
+
+    def _room_stripe(self, room_id: str) -> int:
+        return hash(room_id) % len(self.room_locks)
+
+    async def _expire_graces(self, user_ids: List[str]) -> None:
+        """Tear down every grace period that ran out this tick, taking each room lock stripe once."""
+        outbox: Outbox = []
+        by_stripe: Dict[int, List[Tuple[str, UserConn]]] = defaultdict(list)
+        roomless: List[Tuple[str, UserConn]] = []
+        for uid in user_ids:
+            self.rejoin.pop(uid, None)
+            user = self.users.get(uid)
+            # A user registered again since the deadline was set has no grace_until
+            if not user or user.grace_until is None:
+                continue
+            if user.room is not None:
+                by_stripe[self._room_stripe(user.room.id)].append((uid, user))
+            else:
+                roomless.append((uid, user))  # partner already left; only the registration remains
+
+        expired = roomless
+        for stripe, entries in by_stripe.items():
+            async with self.room_locks[stripe]:
+                for uid, user in entries:
+                    # Reconnected while we waited for the lock
+                    if self.users.get(uid) is not user or user.grace_until is None:
+                        continue
+                    if user.room is not None:
+                        self._teardown_room(user.room, leaver=user, partner_idle=True, outbox=outbox)
+                    expired.append((uid, user))
+
+        for uid, user in expired:
+            self._forget(uid, user)
+        if expired:
+            logger.info(f"[WS] Grace period ended for {len(expired)} user(s). Tearing down.")
+            self.queue_size.mark_dirty()
+        self._deliver(outbox)
+
+    async def _typing_due(self, user_ids: List[str]) -> None:
+        """Send held-back refreshes, and isTyping=false for senders that went quiet."""
+        now = time.monotonic()
+        for uid in user_ids:
+            user = self.users.get(uid)
+            if not user or not user.typing or user.room is None:
+                continue
+            if now - user.typing_seen_at >= settings.TYPING_TIMEOUT_MS / 1000:
+                self._forward_typing(user, False, now)
+                TYPING_GENERATED.inc("timeout")
+                continue
+            if user.typing_seen_at > user.typing_sent_at:
+                self._forward_typing(user, True, now)
+                TYPING_GENERATED.inc("refresh")
+            self._arm_typing(user, now)
+
+    def _arm_typing(self, user: UserConn, now: float) -> None:
+        if not user.typing:
+            return
+        due = user.typing_seen_at + settings.TYPING_TIMEOUT_MS / 1000
+        if user.typing_seen_at > user.typing_sent_at:
+            # A repeat is being held back; send it when the refresh window ends
+            due = min(due, user.typing_sent_at + settings.TYPING_REFRESH_MS / 1000)
+        self.typing_timers.schedule(user.id, due - now)
+
+    def _forward_typing(self, sender: UserConn, is_typing: bool, now: float) -> str:
+        partner = sender.partner
+        if partner.grace_until is not None:
+            # Nobody to tell; a client that reconnects starts without an indicator
+            sender.typing = False
+            return "partner_in_grace"
+        sender.typing = is_typing
+        sender.typing_sent_at = now
+        self._send_to(partner, "typing", (sender.room.id, is_typing))
+        return "forwarded"
+
+    def _forget(self, user_id: str, user: UserConn | None = None) -> None:
+        # Only drop the registration we were acting on, not one made since by a new socket.
+        # The queue stays a subset of self.users so _enqueue never meets a stale id.
+        if user is not None and self.users.get(user_id) is not user:
+            return
+        self.waiting.discard(user_id)
+        self.users.pop(user_id, None)
+
+    def _teardown_room(self, room: Room, leaver: UserConn | None, partner_idle: bool, outbox: Outbox) -> bool:
+        if self.rooms.get(room.id) is not room:
+            return False
+        del self.rooms[room.id]
+        for user in (room.u1, room.u2):
+            user.room = None
+            user.partner = None
+            user.typing = False
         if leaver is not None:
-            other = room["u2"] if room["u1"] == leaver else room["u1"]
+            other = room.u2 if room.u1 is leaver else room.u1
             if partner_idle:
-                await self._send_system(other, code="idle", message="Partner left.")
+                outbox.append((other.id, "system", ("idle", "Partner left.")))
+        return True
 
-    async def _try_pair(self) -> None:
-        while len(self.waiting) >= 2:
-            u1 = self.waiting.popleft()
-            if u1 not in self.users:
-                continue
-            u2 = None
-            while self.waiting and not u2:
-                candidate = self.waiting.popleft()
-                if candidate in self.users:
-                    u2 = candidate
-            if not u2:
-                self.waiting.appendleft(u1)
-                break
-            room_id = uuid.uuid4().hex
-            now = int(time.time() * 1000)
-            self.rooms[room_id] = {"id": room_id, "u1": u1, "u2": u2, "created_at": now}
-            self.users[u1]["room_id"] = room_id
-            self.users[u2]["room_id"] = room_id
-            await self._send_paired(u1, partner_id=u2, room_id=room_id, started_at=now)
-            await self._send_paired(u2, partner_id=u1, room_id=room_id, started_at=now)
-            await self._broadcast_queue_size()
-
-    async def _broadcast_queue_size(self) -> None:
-        evt = QueueSize(count=len(self.waiting)).model_dump()
-        await asyncio.gather(*[self._safe_send(uid, evt) for uid in list(self.users.keys())])
-
-    async def _send_paired(self, uid: str, partner_id: str, room_id: str, started_at: int) -> None:
-        partner = self.users.get(partner_id)
-        if not partner:
+    def _enqueue(self, user: UserConn, outbox: Outbox) -> None:
+        """Pair `user` with a compatible waiting user, or leave them waiting. Caller holds pair_lock."""
+        # Nobody compatible waits together: each join either pairs or finds no match
+        partner_id = self.waiting.find(user.prefs)
+        if partner_id is not None:
+            # Everyone in the queue is registered: users always leave the queue before self.users
+            self.waiting.discard(partner_id)
+            self._pair(self.users[partner_id], user, outbox)
+            PAIRS.inc("compatible")
             return
-        evt = Paired(
-            room=room_id,
-            partner=Partner(id=partner_id, avatar=partner["avatar"]),
-            startedAt=started_at,
-        )
-        await self._safe_send(uid, evt.model_dump())
+        self.waiting.append(user.id, user.prefs)
+        if user.prefs is not None:
+            self.match_fallback.schedule(user.id, settings.MATCH_FALLBACK_SECONDS - (time.monotonic() - user.queued_at))
+
+    def _pair(self, user1: UserConn, user2: UserConn, outbox: Outbox) -> None:
+        now = int(time.time() * 1000)
+        room = Room(uuid.uuid4().hex, user1, user2, now)
+        self.rooms[room.id] = room
+        user1.room = user2.room = room
+        user1.partner, user2.partner = user2, user1
+        paired_at = time.monotonic()
+        PAIR_WAIT.observe(paired_at - user1.queued_at)
+        PAIR_WAIT.observe(paired_at - user2.queued_at)
+        outbox.append((user1.id, "paired", (room.id, user2.id, user2.avatar, now)))
+        outbox.append((user2.id, "paired", (room.id, user1.id, user1.avatar, now)))
+        self.queue_size.mark_dirty()
+
+    async def _relax_prefs(self, user_ids: List[str]) -> None:
+        """Users whose preferences timed out match anyone: pair each with the longest-waiting user."""
+        outbox: Outbox = []
+        now = time.monotonic()
+        slack = self.match_fallback.tick
+        async with self.pair_lock:
+            for uid in user_ids:
+                user = self.users.get(uid)
+                # Paired, left, or queued again since the deadline was set
+                if (user is None or uid not in self.waiting
+                        or now - user.queued_at < settings.MATCH_FALLBACK_SECONDS - slack):
+                    continue
+                partner_id = self.waiting.find(None, exclude=uid)
+                if partner_id is None:
+                    self.waiting.relax(uid)
+                    continue
+                self.waiting.discard(uid)
+                self.waiting.discard(partner_id)
+                self._pair(self.users[partner_id], user, outbox)
+                PAIRS.inc("fallback")
+        self._deliver(outbox)
 
-    async def _send_system(self, uid: str, code: str, message: str) -> None:
-        await self._safe_send(uid, System(code=code, message=message).model_dump())
+    def _queue_size_snapshot(self) -> tuple[int, list[Outbound]]:
+        # Users in a room (including those in a reconnect grace period) don't see the counter
+        targets = [u.ws for u in self.users.values() if u.room is None]
+        return len(self.waiting), targets
 
-    async def _safe_send(self, uid: str, payload: dict) -> None:
+    def _deliver(self, outbox: Outbox) -> None:
+        """Enqueue events on each user's outbound queue, which keeps them in order per user."""
+        for uid, kind, args in outbox:
+            self._send(uid, kind, args)
+
+    def _send(self, uid: str, kind: str, args: tuple) -> None:
         user = self.users.get(uid)
         if not user:
+            SENDS_DROPPED.inc("no_user")
             return
-        try:
-            await user["ws"].send_text(json.dumps(payload))
-        except Exception:
-            pass
+        self._send_to(user, kind, args)
+
+    def _send_to(self, user: UserConn, kind: str, args: tuple) -> None:
+        conn = user.ws
+        conn.send(conn.codec.encode(kind, *args), kind=kind)
+
+    def _send_many(self, users: Iterable[UserConn], kind: str, args: tuple) -> None:
+        """Send one event to several users, encoding it once per codec in use."""
+        encoded: Dict[JsonCodec, Payload] = {}
+        for user in users:
+            conn = user.ws
+            payload = encoded.get(conn.codec)
+            if payload is None:
+                payload = encoded[conn.codec] = conn.codec.encode(kind, *args)
+            conn.send(payload, kind=kind)
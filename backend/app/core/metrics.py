@@ -0,0 +1,151 @@
+"""
+Prometheus text-format metrics.
+
+Instruments are only touched from the event loop thread, so they are plain
+dict / int / float updates with no locking. Values that already live
+elsewhere (matchmaker sizes, push and outbound counters) are registered as
+callbacks and only read when `/metrics` is scraped.
+
+    FRAMES_IN = Counter("chat_ws_frames_in_total", "Frames received", ("type",))
+    FRAMES_IN.inc("message")
+"""
+from bisect import bisect_left
+from typing import Callable, Container, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+LabelValues = Tuple[str, ...]
+# (series name, rendered labels, value)
+Sample = Tuple[str, str, float]
+# A callback returns one value, or (label values, value) pairs for labelled series
+Reading = Union[float, Iterable[Tuple[LabelValues, float]]]
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; spans sub-millisecond relays up to slow pairings
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, "_Metric"] = {}
+
+    def register(self, metric: "_Metric") -> None:
+        # Re-registering a name replaces it, e.g. when a new Matchmaker starts
+        self._metrics[metric.name] = metric
+
+    def render(self, only: Optional[Container[str]] = None, skip: Container[str] = ()) -> str:
+        """Exposition text for every metric, or just those named in `only`, minus those in `skip`."""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            if (only is not None and metric.name not in only) or metric.name in skip:
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_number(value)}")
+        lines.append("")
+        return "\n".join(lines)
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), registry: Registry = REGISTRY) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        registry.register(self)
+
+    def samples(self) -> Iterator[Sample]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> Iterator[Sample]:
+        for labels, value in self._values.items():
+            yield self.name, _labels(self.labelnames, labels), value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(buckets)
+        # Per series: one count per bucket plus +Inf (not cumulative), then sum and count
+        self._series: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 3)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def samples(self) -> Iterator[Sample]:
+        bucket_names = self.labelnames + ("le",)
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                yield self.name + "_bucket", _labels(bucket_names, labels + (_number(bound),)), cumulative
+            rendered = _labels(self.labelnames, labels)
+            yield self.name + "_sum", rendered, series[-2]
+            yield self.name + "_count", rendered, series[-1]
+
+
+class _Callback(_Metric):
+    def __init__(self, name: str, help: str, fn: Callable[[], Reading], labelnames: Sequence[str] = (), **kwargs) -> None:
+        super().__init__(name, help, labelnames, **kwargs)
+        self.fn = fn
+
+    def samples(self) -> Iterator[Sample]:
+        reading = self.fn()
+        if isinstance(reading, (int, float)):
+            yield self.name, "", reading
+            return
+        for labels, value in reading:
+            yield self.name, _labels(self.labelnames, labels), value
+
+
+class GaugeFunc(_Callback):
+    """Gauge whose value is computed at scrape time."""
+
+    type = "gauge"
+
+
+class CounterFunc(_Callback):
+    """Counter kept elsewhere (e.g. a stats object), read at scrape time."""
+
+    type = "counter"
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not values:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+from typing import Callable, Container, Optional
+
+from app.core import metrics
+from app.core.push_index import push_index
+from app.core.push_service import push_service
+from app.settings import settings
+
+logger = logging.getLogger("uvicorn.error")
+
+CAMPAIGNS = metrics.Counter(
+    "chat_push_campaigns_total", "Notification windows by outcome: sent, or why no campaign went out", ("outcome",),
+)
+
+
+class NotificationScheduler:
+    """
+    Turns waiting-queue joins into at most one push campaign per window.
+
+    `observe` only sets a flag, so joining the queue does no notification
+    work inline. When a window with joins in it closes, the pool is checked
+    against the thresholds in a background task. A campaign goes out if the
+    pool has at least `min_pool` users and has grown by `min_growth` since
+    the last campaign; the baseline follows the pool back down when it
+    shrinks, so a refill counts as growth again.
+    """
+
+    def __init__(
+        self,
+        pool_size: Callable[[], int],
+        exclude_user_ids: Callable[[], Container[str]],
+        window: Optional[float] = None,
+        min_pool: Optional[int] = None,
+        min_growth: Optional[int] = None,
+    ) -> None:
+        self._pool_size = pool_size
+        self._exclude_user_ids = exclude_user_ids
+        self.window = settings.NOTIFY_WINDOW_SECONDS if window is None else window
+        self.min_pool = settings.NOTIFY_MIN_POOL if min_pool is None else min_pool
+        self.min_growth = settings.NOTIFY_MIN_GROWTH if min_growth is None else min_growth
+        self._joins = 0
+        # Pool size the next campaign's growth is measured from
+        self._baseline = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def observe(self) -> None:
+        """Record a join; the window it falls in is evaluated when it closes."""
+        self._joins += 1
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # ─── private ────────────────────────────────────────────────────────────
+
+    async def _run(self) -> None:
+        while self._joins:
+            await asyncio.sleep(self.window)
+            joins, self._joins = self._joins, 0
+            try:
+                await self._close_window(joins)
+            except Exception as e:
+                logger.error(f"Notification window failed: {e!r}")
+
+    async def _close_window(self, joins: int) -> None:
+        pool = self._pool_size()
+        self._baseline = min(self._baseline, pool)
+        if pool < self.min_pool:
+            CAMPAIGNS.inc("small_pool")
+            return
+        if pool - self._baseline < self.min_growth:
+            CAMPAIGNS.inc("no_growth")
+            return
+
+        tokens = push_index.select(
+            limit=settings.NOTIFY_BATCH_SIZE,
+            cooldown_seconds=settings.PUSH_COOLDOWN_SECONDS,
+            exclude_user_ids=self._exclude_user_ids(),
+        )
+        logger.info(f"Liquidity event: {pool} in queue after {joins} joins; {len(tokens)} eligible tokens")
+        if not tokens:
+            CAMPAIGNS.inc("no_tokens")
+            return
+        self._baseline = pool
+        CAMPAIGNS.inc("sent")
+        # Awaited, so campaigns never overlap; joins keep counting toward the next window meanwhile
+        await push_service.send_push_notifications(tokens, pool)
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import time
+import weakref
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from fastapi import WebSocket
+
+from app.core import metrics
+from app.core.codec import JsonCodec, Payload, default_codec
+from app.settings import settings
+
+logger = logging.getLogger("uvicorn.error")
+
+# Only the latest value of these matters, so a pending frame is overwritten in place
+COALESCED_KINDS = frozenset({"queue_size", "typing", "ping"})
+# Shed first once a client falls behind
+DROPPABLE_KINDS = frozenset({"queue_size", "typing"})
+
+# Close code sent to clients evicted for not keeping up ("Try Again Later")
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+class OutboundStats:
+    """Process-wide counters across every outbound queue."""
+
+    def __init__(self) -> None:
+        self.frames_sent = 0
+        self.frames_coalesced = 0
+        self.frames_dropped: Dict[str, int] = {}
+        self.evictions = 0
+        self.max_depth = 0
+
+    def as_dict(self) -> dict:
+        live = list(_live)
+        return {
+            "connections": len(live),
+            "queued_frames": sum(len(c) for c in live),
+            "max_depth_seen": self.max_depth,
+            "frames_sent": self.frames_sent,
+            "frames_coalesced": self.frames_coalesced,
+            "frames_dropped": dict(self.frames_dropped),
+            "slow_consumer_evictions": self.evictions,
+        }
+
+
+stats = OutboundStats()
+_live: "weakref.WeakSet[Outbound]" = weakref.WeakSet()
+
+FRAMES_OUT = metrics.Counter("chat_ws_frames_out_total", "Frames written to client sockets", ("type",))
+SENDS_DROPPED = metrics.Counter(
+    "chat_ws_sends_dropped_total", "Frames discarded before reaching a socket", ("reason",),
+)
+RELAY_LATENCY = metrics.Histogram(
+    "chat_relay_latency_seconds", "Chat message frames: enqueued for the partner until written to its socket",
+)
+metrics.GaugeFunc("chat_ws_connections", "Open client websockets", lambda: len(_live))
+metrics.CounterFunc("chat_ws_slow_consumer_evictions_total", "Clients disconnected for falling behind",
+                    lambda: stats.evictions)
+
+
+class Outbound:
+    """
+    Bounded send queue in front of one websocket, drained by its own writer task.
+
+    `send` never blocks: the matchmaker enqueues and moves on. A client that
+    falls behind first has its typing/queue_size frames shed, and is
+    disconnected once `high_water` frames are pending.
+    """
+
+    __slots__ = (
+        "ws", "codec", "soft_limit", "high_water", "closed", "broker_conn_id",
+        "_frames", "_pending_latest", "_wakeup", "_task", "__weakref__",
+    )
+
+    def __init__(
+        self,
+        ws: WebSocket,
+        codec: Optional[JsonCodec] = None,
+        soft_limit: Optional[int] = None,
+        high_water: Optional[int] = None,
+    ) -> None:
+        self.ws = ws
+        self.codec = codec or default_codec
+        self.soft_limit = soft_limit or settings.OUTBOUND_SOFT_LIMIT
+        self.high_water = high_water or settings.OUTBOUND_HIGH_WATER
+        self.closed = False
+        self.broker_conn_id: Optional[str] = None
+        # Entries are mutable [kind, payload, enqueued_at] so coalesced kinds can be rewritten in place
+        self._frames: Deque[List[Any]] = deque()
+        self._pending_latest: Dict[str, List[Any]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        _live.add(self)
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._drain())
+
+    async def close(self) -> None:
+        """Stop the writer; frames still queued are discarded."""
+        self.closed = True
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._frames.clear()
+        self._pending_latest.clear()
+
+    def send(self, payload: Payload, kind: str = "event") -> None:
+        if self.closed:
+            SENDS_DROPPED.inc("closed")
+            return
+
+        entry = self._pending_latest.get(kind)
+        if entry is not None:
+            entry[1] = payload
+            stats.frames_coalesced += 1
+            return
+
+        depth = len(self._frames)
+        if depth >= self.high_water:
+            SENDS_DROPPED.inc("evicted")
+            self._evict()
+            return
+        if depth >= self.soft_limit and kind in DROPPABLE_KINDS:
+            stats.frames_dropped[kind] = stats.frames_dropped.get(kind, 0) + 1
+            SENDS_DROPPED.inc("shed")
+            return
+
+        entry = [kind, payload, time.perf_counter()]
+        self._frames.append(entry)
+        if kind in COALESCED_KINDS:
+            self._pending_latest[kind] = entry
+        if depth + 1 > stats.max_depth:
+            stats.max_depth = depth + 1
+        self._wakeup.set()
+
+    # ─── private ────────────────────────────────────────────────────────────
+
+    async def _drain(self) -> None:
+        while True:
+            if not self._frames:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            entry = self._frames.popleft()
+            kind, payload, enqueued_at = entry
+            if self._pending_latest.get(kind) is entry:
+                del self._pending_latest[kind]
+            try:
+                if isinstance(payload, str):
+                    await self.ws.send_text(payload)
+                else:
+                    await self.ws.send_bytes(payload)
+            except Exception:
+                # Socket is gone; the receive loop will notice and clean up
+                self.closed = True
+                self._frames.clear()
+                self._pending_latest.clear()
+                return
+            stats.frames_sent += 1
+            FRAMES_OUT.inc(kind)
+            if kind == "message":
+                RELAY_LATENCY.observe(time.perf_counter() - enqueued_at)
+
+    def _evict(self) -> None:
+        self.closed = True
+        stats.evictions += 1
+        logger.warning(f"[WS] Evicting slow consumer with {len(self._frames)} pending frames")
+        asyncio.create_task(self._close_socket())
+
+    async def _close_socket(self) -> None:
+        await self.close()
+        try:
+            await self.ws.close(code=SLOW_CONSUMER_CLOSE_CODE)
+        except Exception:
+            pass
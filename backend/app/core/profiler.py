@@ -0,0 +1,223 @@
+"""
+Event-loop lag and lock-contention profiler.
+
+Off by default and switchable at runtime (`POST /admin/profiler`). While on:
+
+- a ticker task measures how late each `tick_ms` sleep wakes up (loop lag)
+- a watchdog thread notices when the ticker has not run for longer than
+  `block_threshold_ms` and captures the loop thread's stack, i.e. the
+  synchronous call that is blocking the loop
+- every `ProfiledLock` acquisition records wait and hold time, attributed to
+  the function that took the lock (join_queue, handle_next, ...)
+
+While off, a `ProfiledLock` costs one attribute check per acquire/release.
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from app.settings import settings
+
+logger = logging.getLogger("uvicorn.error")
+
+# Loop-lag samples kept for percentiles, and blocking calls kept with their stacks
+LAG_WINDOW = 2000
+BLOCKING_WINDOW = 50
+
+
+class _LockStats:
+    __slots__ = ("count", "contended", "wait_total", "wait_max", "hold_total", "hold_max")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.contended = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.hold_total = 0.0
+        self.hold_max = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        n = self.count or 1
+        return {
+            "acquisitions": self.count,
+            "contended": self.contended,
+            "wait_ms_avg": round(self.wait_total / n * 1000, 3),
+            "wait_ms_max": round(self.wait_max * 1000, 3),
+            "hold_ms_avg": round(self.hold_total / n * 1000, 3),
+            "hold_ms_max": round(self.hold_max * 1000, 3),
+        }
+
+
+class LoopProfiler:
+    def __init__(self) -> None:
+        self.enabled = False
+        self.block_threshold = settings.PROFILER_BLOCK_THRESHOLD_MS / 1000
+        self.tick = settings.PROFILER_TICK_MS / 1000
+        self.enabled_at: Optional[float] = None
+        self._lags: Deque[float] = deque(maxlen=LAG_WINDOW)
+        self._lag_max = 0.0
+        self._locks: Dict[Tuple[str, str], _LockStats] = {}
+        self._blocking: Deque[Dict[str, Any]] = deque(maxlen=BLOCKING_WINDOW)
+        self._last_beat = 0.0
+        self._stall: Optional[Dict[str, Any]] = None
+        self._loop_thread_id: Optional[int] = None
+        self._ticker: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def enable(self, block_threshold_ms: Optional[float] = None) -> None:
+        """Start profiling on the running loop; call again to change the threshold."""
+        if block_threshold_ms is not None:
+            self.block_threshold = block_threshold_ms / 1000
+        if self.enabled:
+            return
+        self.reset()
+        self.enabled = True
+        self.enabled_at = time.time()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        # A fresh event per watchdog, so one from a previous enable can't be revived
+        self._stop = threading.Event()
+        self._ticker = asyncio.create_task(self._tick_loop())
+        self._watchdog = threading.Thread(target=self._watch, args=(self._stop,), name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info(f"Profiler enabled (block threshold {self.block_threshold * 1000:.0f} ms)")
+
+    def disable(self) -> None:
+        if not self.enabled:
+            return
+        self.enabled = False
+        self._stop.set()
+        if self._ticker is not None:
+            self._ticker.cancel()
+            self._ticker = None
+        self._watchdog = None
+        logger.info("Profiler disabled")
+
+    def reset(self) -> None:
+        self._lags.clear()
+        self._lag_max = 0.0
+        self._locks.clear()
+        self._blocking.clear()
+        self._stall = None
+
+    def record_lock(self, lock: str, op: str, waited: float, held: float, contended: bool) -> None:
+        stats = self._locks.get((lock, op))
+        if stats is None:
+            stats = self._locks[(lock, op)] = _LockStats()
+        stats.count += 1
+        stats.contended += contended
+        stats.wait_total += waited
+        stats.hold_total += held
+        if waited > stats.wait_max:
+            stats.wait_max = waited
+        if held > stats.hold_max:
+            stats.hold_max = held
+
+    def snapshot(self) -> Dict[str, Any]:
+        lags = sorted(self._lags)
+
+        def pct(q: float) -> Optional[float]:
+            return round(lags[min(len(lags) - 1, int(q * len(lags)))] * 1000, 3) if lags else None
+
+        locks: Dict[str, Dict[str, Any]] = {}
+        for (lock, op), stats in sorted(self._locks.items()):
+            locks.setdefault(lock, {})[op] = stats.as_dict()
+        return {
+            "enabled": self.enabled,
+            "enabled_at": self.enabled_at,
+            "block_threshold_ms": self.block_threshold * 1000,
+            "tick_ms": self.tick * 1000,
+            "loop_lag": {
+                "samples": len(lags),
+                "p50_ms": pct(0.50),
+                "p99_ms": pct(0.99),
+                "max_ms": round(self._lag_max * 1000, 3),
+            },
+            "locks": locks,
+            "blocking_calls": list(self._blocking),
+        }
+
+    # ─── private ────────────────────────────────────────────────────────────
+
+    async def _tick_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.tick)
+            lag = max(0.0, loop.time() - started - self.tick)
+            self._last_beat = time.monotonic()
+            self._lags.append(lag)
+            if lag > self._lag_max:
+                self._lag_max = lag
+            stall = self._stall
+            if stall is not None:
+                # The blocking call is over; now we know how long it took
+                stall["duration_ms"] = round(lag * 1000, 1)
+                self._stall = None
+
+    def _watch(self, stop: threading.Event) -> None:
+        """Runs in its own thread, so it still gets scheduled while the loop is blocked."""
+        while not stop.wait(max(self.block_threshold / 4, 0.005)):
+            overdue = time.monotonic() - self._last_beat - self.tick
+            if overdue < self.block_threshold or self._stall is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = traceback.format_stack(frame)
+            event = {
+                "detected_at": time.time(),
+                "blocked_ms_at_detection": round(overdue * 1000, 1),
+                "duration_ms": None,
+                "stack": [line for entry in stack[-15:] for line in entry.rstrip().splitlines()],
+            }
+            self._stall = event
+            self._blocking.append(event)
+            logger.warning(f"Event loop blocked for {overdue * 1000:.0f} ms in: {stack[-1].strip()}")
+
+
+profiler = LoopProfiler()
+
+
+class ProfiledLock(asyncio.Lock):
+    """
+    asyncio.Lock that reports wait/hold time to the profiler while it is on.
+
+    The operation is the name of the function that entered `async with`.
+    """
+
+    def __init__(self, name: str) -> None:
+        super().__init__()
+        self.name = name
+        self._acquired_at: Optional[float] = None
+        self._op = ""
+        self._waited = 0.0
+        self._contended = False
+
+    async def acquire(self) -> bool:
+        if not profiler.enabled:
+            return await super().acquire()
+        # Frames: acquire ← __aenter__ ← the coroutine doing `async with`
+        op = sys._getframe(2).f_code.co_name
+        contended = self.locked()
+        started = time.perf_counter()
+        result = await super().acquire()
+        self._acquired_at = time.perf_counter()
+        self._waited = self._acquired_at - started
+        self._op = op
+        self._contended = contended
+        return result
+
+    def release(self) -> None:
+        acquired_at, self._acquired_at = self._acquired_at, None
+        super().release()
+        if acquired_at is not None and profiler.enabled:
+            profiler.record_lock(
+                self.name, self._op, self._waited, time.perf_counter() - acquired_at, self._contended,
+            )
@@ -0,0 +1,170 @@
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Container, Dict, Iterable, List, Optional, Tuple
+
+from app.core import metrics
+from app.db import database
+from app.settings import settings
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class _Entry:
+    __slots__ = ("user_id", "last_sent", "key")
+
+    def __init__(self, user_id: Optional[str], last_sent: float) -> None:
+        self.user_id = user_id
+        self.last_sent = last_sent  # epoch seconds, 0.0 = never sent
+        self.key = last_sent  # heap key; moves ahead of last_sent while a push is in flight
+
+
+class PushTokenIndex:
+    """
+    In-memory view of `push_tokens` used to pick push candidates without a query.
+
+    Tokens sit in a min-heap keyed by their last send time, so the next `k`
+    cooldown-expired tokens are found in O(k log n). Heap entries are
+    invalidated lazily: an item is only honoured if its key still matches the
+    token's entry. Send times are persisted write-behind, in batches.
+    """
+
+    def __init__(self, flush_interval: float) -> None:
+        self.flush_interval = flush_interval
+        self._entries: Dict[str, _Entry] = {}
+        self._heap: List[Tuple[float, str]] = []
+        self._pending: Dict[str, Tuple[float, int]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ─── lifecycle ──────────────────────────────────────────────────────────
+
+    async def load(self) -> None:
+        rows = await database.run(database.load_push_index_rows)
+        self._entries = {token: _Entry(user_id, _to_epoch(sent)) for token, user_id, sent in rows}
+        self._heap = [(e.key, token) for token, e in self._entries.items()]
+        heapq.heapify(self._heap)
+        logger.info(f"✅ Push index loaded ({len(self._entries)} tokens)")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    # ─── mutations ──────────────────────────────────────────────────────────
+
+    def add(self, token: str, user_id: Optional[str]) -> None:
+        entry = self._entries.get(token)
+        if entry is None:
+            entry = self._entries[token] = _Entry(user_id, 0.0)
+            heapq.heappush(self._heap, (entry.key, token))
+        else:
+            entry.user_id = user_id
+
+    def remove(self, tokens: Iterable[str]) -> None:
+        for token in tokens:
+            self._entries.pop(token, None)
+            self._pending.pop(token, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._heap.clear()
+        self._pending.clear()
+
+    def select(self, limit: int, cooldown_seconds: float, exclude_user_ids: Container[str]) -> List[str]:
+        """
+        Claim up to `limit` tokens whose cooldown has expired and whose user is
+        not in `exclude_user_ids`. Claimed tokens are not handed out again until
+        they are either marked sent or released.
+        """
+        now = time.time()
+        cutoff = now - cooldown_seconds
+        selected: List[str] = []
+        skipped: List[Tuple[float, str]] = []
+
+        while self._heap and len(selected) < limit and self._heap[0][0] < cutoff:
+            key, token = heapq.heappop(self._heap)
+            entry = self._entries.get(token)
+            if entry is None or entry.key != key:
+                continue  # stale heap item
+            if entry.user_id is not None and entry.user_id in exclude_user_ids:
+                skipped.append((key, token))
+                continue
+            entry.key = now
+            heapq.heappush(self._heap, (now, token))
+            selected.append(token)
+
+        for item in skipped:
+            heapq.heappush(self._heap, item)
+        if len(self._heap) > 2 * len(self._entries) + 1024:
+            self._compact()
+        return selected
+
+    def mark_sent(self, tokens: Iterable[str]) -> None:
+        now = time.time()
+        for token in tokens:
+            entry = self._entries.get(token)
+            if entry is None:
+                continue
+            entry.last_sent = now
+            if entry.key != now:
+                entry.key = now
+                heapq.heappush(self._heap, (now, token))
+            _, count = self._pending.get(token, (now, 0))
+            self._pending[token] = (now, count + 1)
+
+    def release(self, tokens: Iterable[str]) -> None:
+        """Return claimed tokens whose push was not delivered to the eligible pool."""
+        for token in tokens:
+            entry = self._entries.get(token)
+            if entry is None or entry.key == entry.last_sent:
+                continue
+            entry.key = entry.last_sent
+            heapq.heappush(self._heap, (entry.key, token))
+
+    def _compact(self) -> None:
+        self._heap = [(e.key, token) for token, e in self._entries.items()]
+        heapq.heapify(self._heap)
+
+    # ─── write-behind ───────────────────────────────────────────────────────
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        groups: Dict[Tuple[datetime, int], List[str]] = {}
+        for token, (sent, count) in pending.items():
+            groups.setdefault((datetime.fromtimestamp(sent, timezone.utc), count), []).append(token)
+        try:
+            await database.run(database.update_last_sent_many, groups)
+        except Exception as e:
+            logger.error(f"Failed to persist push send times: {e}")
+            for token, (sent, count) in pending.items():
+                newer_sent, newer_count = self._pending.get(token, (sent, 0))
+                self._pending[token] = (max(sent, newer_sent), count + newer_count)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+def _to_epoch(value: Optional[datetime]) -> float:
+    if value is None:
+        return 0.0
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+push_index = PushTokenIndex(flush_interval=settings.PUSH_INDEX_FLUSH_INTERVAL_MS / 1000)
+INDEXED = metrics.GaugeFunc("chat_push_tokens_indexed", "Push tokens in the in-memory index", lambda: len(push_index))
@@ -1,16 +1,129 @@
 import asyncio
-import httpx
+import gzip
+import json
 import logging
-from typing import List, Any, Dict
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
 
+from app.core import metrics
+from app.core.push_index import push_index
 from app.db import database
+from app.settings import settings
 
 logger = logging.getLogger("uvicorn.error")
 
-EXPO_PUSH_API_URL = "https://exp.host/--/api/v2/push/send"
+# Expo accepts at most 100 messages per send request and 1000 ids per receipts request
+SEND_BATCH_SIZE = 100
+RECEIPT_BATCH_SIZE = 1000
+# Only compress bodies big enough for gzip to pay off
+GZIP_MIN_BYTES = 1024
+
+try:
+    import h2  # noqa: F401
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
+
+class PushStats:
+    """Plain counters, updated inline from the event loop."""
+
+    def __init__(self) -> None:
+        self.started_at = time.time()
+        self.messages_sent = 0
+        self.batches_sent = 0
+        self.batches_failed = 0
+        self.retries = 0
+        self.tickets_ok = 0
+        self.tickets_error = 0
+        self.receipts_checked = 0
+        self.receipts_error = 0
+        self.tokens_deleted = 0
+        self.request_count = 0
+        self.request_seconds_total = 0.0
+        self.request_seconds_max = 0.0
+
+    def observe_request(self, seconds: float) -> None:
+        self.request_count += 1
+        self.request_seconds_total += seconds
+        if seconds > self.request_seconds_max:
+            self.request_seconds_max = seconds
+
+    def as_dict(self) -> Dict[str, Any]:
+        uptime = max(time.time() - self.started_at, 1e-9)
+        avg = self.request_seconds_total / self.request_count if self.request_count else 0.0
+        return {
+            "messages_sent": self.messages_sent,
+            "messages_per_sec": round(self.messages_sent / uptime, 3),
+            "batches_sent": self.batches_sent,
+            "batches_failed": self.batches_failed,
+            "retries": self.retries,
+            "tickets_ok": self.tickets_ok,
+            "tickets_error": self.tickets_error,
+            "receipts_checked": self.receipts_checked,
+            "receipts_error": self.receipts_error,
+            "tokens_deleted": self.tokens_deleted,
+            "request_latency_ms_avg": round(avg * 1000, 2),
+            "request_latency_ms_max": round(self.request_seconds_max * 1000, 2),
+        }
 
 
 class PushService:
+    """
+    Long-lived Expo push dispatcher.
+
+    Messages are chunked into batches of 100 and posted concurrently over one
+    pooled (HTTP/2 when `h2` is installed) client. Tickets are followed up by a
+    delayed receipts check; any `DeviceNotRegistered` token found on either
+    stage is removed in a single bulk delete.
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        concurrency: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        receipt_delay: Optional[float] = None,
+    ) -> None:
+        self.base_url = (base_url or settings.EXPO_PUSH_BASE_URL).rstrip("/")
+        self.concurrency = concurrency or settings.PUSH_CONCURRENCY
+        self.max_retries = settings.PUSH_MAX_RETRIES if max_retries is None else max_retries
+        self.receipt_delay = settings.PUSH_RECEIPT_DELAY_SECONDS if receipt_delay is None else receipt_delay
+        self.stats = PushStats()
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._receipt_tasks: set[asyncio.Task] = set()
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=_HTTP2 and self._transport is None,
+                transport=self._transport,
+                timeout=httpx.Timeout(10.0, connect=5.0),
+                limits=httpx.Limits(
+                    max_connections=self.concurrency,
+                    max_keepalive_connections=self.concurrency,
+                ),
+                headers={
+                    "Accept": "application/json",
+                    "Accept-Encoding": "gzip, deflate",
+                    "Content-Type": "application/json",
+                },
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        for task in list(self._receipt_tasks):
+            task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
     async def send_push_notifications(self, tokens: List[str], pool_size: int) -> None:
         if not tokens:
             return
@@ -38,46 +151,171 @@ class PushService:
         if not messages:
             return
 
-        # Expo recommends batches of 100; production should chunk this list.
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    EXPO_PUSH_API_URL,
-                    json=messages,
-                    headers={
-                        "Accept": "application/json",
-                        "Accept-Encoding": "gzip, deflate",
-                        "Content-Type": "application/json",
-                    },
-                )
-                response.raise_for_status()
-                await self._handle_expo_response(response.json(), tokens)
-            except Exception as e:
-                logger.error(f"Failed to send push notifications: {e}")
+        batches = [messages[i:i + SEND_BATCH_SIZE] for i in range(0, len(messages), SEND_BATCH_SIZE)]
+        results = await asyncio.gather(*[self._send_batch(batch) for batch in batches])
+
+        successful_tokens: List[str] = []
+        invalid_tokens: List[str] = []
+        receipt_ids: Dict[str, str] = {}
+        for ok, invalid, ids in results:
+            successful_tokens.extend(ok)
+            invalid_tokens.extend(invalid)
+            receipt_ids.update(ids)
+
+        # Send times are persisted write-behind by the index; anything not
+        # delivered goes straight back into the eligible pool.
+        push_index.mark_sent(successful_tokens)
+        delivered = set(successful_tokens) | set(invalid_tokens)
+        push_index.release(m["to"] for m in messages if m["to"] not in delivered)
+        try:
+            await self._remove_tokens(invalid_tokens)
+        except Exception as e:
+            logger.error(f"Failed to remove unregistered tokens: {e}")
 
-    async def _handle_expo_response(self, data: Dict[str, Any], tokens: List[str]) -> None:
+        if receipt_ids:
+            task = asyncio.create_task(self._check_receipts(receipt_ids))
+            self._receipt_tasks.add(task)
+            task.add_done_callback(self._receipt_tasks.discard)
+
+    def snapshot_stats(self) -> Dict[str, Any]:
+        return self.stats.as_dict()
+
+    # ─── private ────────────────────────────────────────────────────────────
+
+    async def _send_batch(self, batch: List[Dict[str, Any]]) -> tuple[List[str], List[str], Dict[str, str]]:
+        """Post one batch; returns (ok tokens, unregistered tokens, ticket id → token)."""
+        tokens = [m["to"] for m in batch]
+        try:
+            data = await self._post("/send", batch)
+        except Exception as e:
+            self.stats.batches_failed += 1
+            logger.error(f"Failed to send push notifications: {e}")
+            return [], [], {}
+
+        self.stats.batches_sent += 1
+        self.stats.messages_sent += len(batch)
+        return self._handle_expo_response(data, tokens)
+
+    def _handle_expo_response(
+        self, data: Dict[str, Any], tokens: List[str]
+    ) -> tuple[List[str], List[str], Dict[str, str]]:
         tickets = data.get("data", [])
         successful_tokens: List[str] = []
         invalid_tokens: List[str] = []
+        receipt_ids: Dict[str, str] = {}
 
-        for i, ticket in enumerate(tickets):
+        for token, ticket in zip(tokens, tickets):
             status = ticket.get("status")
             if status == "ok":
-                successful_tokens.append(tokens[i])
-                logger.info(f"push_sent: {tokens[i]}")
+                self.stats.tickets_ok += 1
+                successful_tokens.append(token)
+                if ticket.get("id"):
+                    receipt_ids[ticket["id"]] = token
+                logger.info(f"push_sent: {token}")
             elif status == "error":
+                self.stats.tickets_error += 1
                 details = ticket.get("details", {})
                 error_code = details.get("error")
-                logger.error(f"push_failed: {tokens[i]} - {error_code}")
+                logger.error(f"push_failed: {token} - {error_code}")
                 if error_code == "DeviceNotRegistered":
-                    invalid_tokens.append(tokens[i])
+                    invalid_tokens.append(token)
+
+        return successful_tokens, invalid_tokens, receipt_ids
+
+    async def _check_receipts(self, receipt_ids: Dict[str, str]) -> None:
+        """Poll Expo for delivery receipts once they are ready and prune dead devices."""
+        await asyncio.sleep(self.receipt_delay)
+        ids = list(receipt_ids.keys())
+        invalid_tokens: List[str] = []
+
+        for i in range(0, len(ids), RECEIPT_BATCH_SIZE):
+            chunk = ids[i:i + RECEIPT_BATCH_SIZE]
+            try:
+                data = await self._post("/getReceipts", {"ids": chunk})
+            except Exception as e:
+                logger.error(f"Failed to fetch push receipts: {e}")
+                continue
+            receipts = data.get("data", {}) or {}
+            for receipt_id, receipt in receipts.items():
+                self.stats.receipts_checked += 1
+                if receipt.get("status") != "error":
+                    continue
+                self.stats.receipts_error += 1
+                error_code = (receipt.get("details") or {}).get("error")
+                token = receipt_ids.get(receipt_id)
+                logger.error(f"push_receipt_failed: {token} - {error_code}")
+                if token and error_code == "DeviceNotRegistered":
+                    invalid_tokens.append(token)
+
+        try:
+            await self._remove_tokens(invalid_tokens)
+        except Exception as e:
+            logger.error(f"Failed to remove unregistered tokens: {e}")
+
+    async def _remove_tokens(self, tokens: List[str]) -> None:
+        if not tokens:
+            return
+        logger.info(f"Removing {len(tokens)} invalid tokens")
+        push_index.remove(tokens)
+        deleted = await database.run(database.delete_tokens, tokens)
+        self.stats.tokens_deleted += deleted
+
+    async def _post(self, path: str, payload: Any) -> Dict[str, Any]:
+        """POST with gzip and exponential backoff on 429 / 5xx / transport errors."""
+        client = self._get_client()
+        body = json.dumps(payload).encode()
+        headers = {}
+        if len(body) >= GZIP_MIN_BYTES:
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+
+        attempt = 0
+        while True:
+            retry_after: Optional[float] = None
+            async with self._semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await client.post(self.base_url + path, content=body, headers=headers)
+                except httpx.TransportError as e:
+                    if attempt >= self.max_retries:
+                        raise
+                    logger.warning(f"Expo request failed ({e!r}), retrying")
+                else:
+                    self.stats.observe_request(time.perf_counter() - started)
+                    if response.status_code != 429 and response.status_code < 500:
+                        response.raise_for_status()
+                        return response.json()
+                    if attempt >= self.max_retries:
+                        response.raise_for_status()
+                    retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+                    logger.warning(f"Expo responded {response.status_code}, retrying")
 
-        if successful_tokens:
-            database.update_last_sent(successful_tokens)
+            attempt += 1
+            self.stats.retries += 1
+            delay = retry_after if retry_after is not None else min(
+                settings.PUSH_RETRY_BASE_SECONDS * (2 ** (attempt - 1)), 30.0
+            )
+            await asyncio.sleep(delay * random.uniform(0.8, 1.2))
 
-        for token in invalid_tokens:
-            logger.info(f"Removing invalid token: {token}")
-            database.delete_token(token)
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
 
 
 push_service = PushService()
+
+TICKETS = metrics.CounterFunc(
+    "chat_push_tickets_total", "Expo push tickets by outcome", lambda: (
+        (("ok",), push_service.stats.tickets_ok),
+        (("error",), push_service.stats.tickets_error),
+    ), labelnames=("status",),
+)
+RECEIPTS = metrics.CounterFunc(
+    "chat_push_receipts_total", "Expo push receipts checked, by outcome", lambda: (
+        (("ok",), push_service.stats.receipts_checked - push_service.stats.receipts_error),
+        (("error",), push_service.stats.receipts_error),
+    ), labelnames=("status",),
+)
@@ -0,0 +1,97 @@
+"""
+Flood protection for frames clients send over /ws.
+
+Every connection gets a token bucket for all of its frames, checked before
+the frame is decoded, and one bucket per event type for the types listed in
+WS_EVENT_RATE_LIMITS, checked before the event reaches the matchmaker. A
+frame over either limit is dropped on the spot, without taking a lock or
+sending anything to the partner. The client gets one "Rate limited" error
+per run of dropped frames, not one per frame, so a flood isn't answered
+with a flood. A connection that keeps flooding for WS_FLOOD_CLOSE_AFTER
+frames in a row is closed.
+
+Buckets refill continuously: `rate` tokens per second up to `burst`, one
+token per frame. State is two floats per bucket, updated with the clock
+the caller already read.
+"""
+from typing import Dict, Optional, Tuple
+
+from app.core import metrics
+from app.settings import settings
+
+THROTTLED = metrics.Counter(
+    "chat_ws_throttled_total",
+    "Client frames dropped by rate limits, by event type ('frame' for the per-connection limit)",
+    ("type",),
+)
+FRAMES_REJECTED = metrics.Counter(
+    "chat_ws_frames_rejected_total", "Client frames refused for their size: too_large, text_too_long", ("reason",),
+)
+FLOOD_CLOSED = metrics.Counter("chat_ws_flood_closed_total", "Connections closed for flooding past the rate limits")
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate: float, burst: float, now: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = now
+
+    def take(self, now: float) -> bool:
+        """Spend one token if there is one."""
+        tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if tokens < 1:
+            self.tokens = tokens
+            return False
+        self.tokens = tokens - 1
+        return True
+
+
+class FrameLimiter:
+    """Rate limits of one connection; per-type buckets are created on first use."""
+
+    __slots__ = ("_frames", "_types", "_limits", "strikes")
+
+    def __init__(
+        self,
+        now: float,
+        rate: Optional[float] = None,
+        burst: Optional[int] = None,
+        limits: Optional[Dict[str, Tuple[float, int]]] = None,
+    ) -> None:
+        self._frames = TokenBucket(rate or settings.WS_RATE_LIMIT_PER_SECOND, burst or settings.WS_RATE_LIMIT_BURST, now)
+        self._types: Dict[str, TokenBucket] = {}
+        self._limits = settings.WS_EVENT_RATE_LIMITS if limits is None else limits
+        # Frames dropped since the last one let through
+        self.strikes = 0
+
+    @property
+    def flooding(self) -> bool:
+        return self.strikes >= settings.WS_FLOOD_CLOSE_AFTER
+
+    def allow_frame(self, now: float) -> bool:
+        """The per-connection limit, before the frame is decoded."""
+        if self._frames.take(now):
+            return True
+        THROTTLED.inc("frame")
+        self.strikes += 1
+        return False
+
+    def allow(self, event_type: str, now: float) -> bool:
+        """The limit for `event_type`, if it has one."""
+        bucket = self._types.get(event_type)
+        if bucket is None:
+            limit = self._limits.get(event_type)
+            if limit is None:
+                self.strikes = 0
+                return True
+            bucket = self._types[event_type] = TokenBucket(limit[0], limit[1], now)
+        if bucket.take(now):
+            self.strikes = 0
+            return True
+        THROTTLED.inc(event_type)
+        self.strikes += 1
+        return False
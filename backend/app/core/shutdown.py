@@ -0,0 +1,39 @@
+"""
+Whether this process has been told to shut down.
+
+Uvicorn closes every websocket with 1012 before it runs the lifespan
+shutdown, so /ws has to know while those sockets drop that the server is
+going away. The close code can't tell it: clients can send 1012 too.
+`install()` puts a handler in front of whatever handles SIGTERM and SIGINT
+(uvicorn's, when called from the lifespan startup) that records the signal
+and passes it on. Only this process's own signals set the flag.
+"""
+import signal
+import threading
+from types import FrameType
+from typing import Optional
+
+_requested = False
+
+
+def requested() -> bool:
+    return _requested
+
+
+def install() -> None:
+    # Signal handlers can only be set from the main thread (not e.g. under TestClient)
+    if threading.current_thread() is not threading.main_thread():
+        return
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        previous = signal.getsignal(sig)
+
+        def handler(signum: int, frame: Optional[FrameType], previous=previous) -> None:
+            global _requested
+            _requested = True
+            if callable(previous):
+                previous(signum, frame)
+            elif previous != signal.SIG_IGN:
+                signal.signal(signum, signal.SIG_DFL)
+                signal.raise_signal(signum)
+
+        signal.signal(sig, handler)
@@ -0,0 +1,84 @@
+"""
+On-disk snapshot of matchmaker state across a restart.
+
+On a draining shutdown `Matchmaker.snapshot()` captures the waiting queue
+and every room with its two members. The next process loads it at startup
+and `Matchmaker.restore()` puts each member back in their room inside a
+reconnect grace period, so clients sending `reconnect` are reattached.
+
+The file is one JSON document of flat arrays (no per-record keys):
+
+    {"version": 1, "taken_at": <unix seconds>,
+     "rooms": [[room_id, created_at, u1_id, u1_avatar, u1_grace_left,
+                u2_id, u2_avatar, u2_grace_left], ...],
+     "waiting": [[user_id, seconds_waited], ...]}
+
+It is written to a temporary file and renamed into place, and removed once
+loaded so it is never restored twice.
+"""
+import json
+import logging
+import os
+from typing import Any, Dict, Optional
+
+from app.core.codec import default_codec
+from app.core.outbound import SENDS_DROPPED
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+logger = logging.getLogger("uvicorn.error")
+
+SNAPSHOT_VERSION = 1
+
+
+class DetachedSocket:
+    """Stands in for the socket of a restored user until they reconnect; frames to it are dropped."""
+
+    codec = default_codec
+    closed = True
+
+    def send(self, payload: Any, kind: str = "event") -> None:
+        SENDS_DROPPED.inc("closed")
+
+
+DETACHED = DetachedSocket()
+
+
+def save(state: Dict[str, Any], path: str) -> int:
+    """Write `state` atomically; returns the size in bytes."""
+    if orjson is not None:
+        body = orjson.dumps(state)
+    else:
+        body = json.dumps(state, separators=(",", ":"), ensure_ascii=False).encode()
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(body)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return len(body)
+
+
+def load(path: str) -> Optional[Dict[str, Any]]:
+    """Read and remove the snapshot at `path`; None if there is none or it can't be used."""
+    try:
+        with open(path, "rb") as f:
+            body = f.read()
+    except FileNotFoundError:
+        return None
+    try:
+        os.remove(path)
+    except OSError as e:
+        logger.warning(f"Could not remove matchmaker snapshot {path}: {e!r}")
+    try:
+        state = orjson.loads(body) if orjson is not None else json.loads(body)
+    except ValueError as e:
+        logger.error(f"Ignoring unreadable matchmaker snapshot {path}: {e!r}")
+        return None
+    if not isinstance(state, dict) or state.get("version") != SNAPSHOT_VERSION:
+        logger.error(f"Ignoring matchmaker snapshot {path} with unsupported version")
+        return None
+    return state
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import math
+from typing import Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel: one background task for any number of deadlines.
+
+    `schedule` and `cancel` are O(1) dict operations, with no task or handle
+    per timer. Once per `tick` the wheel collects every key that came due and
+    hands the whole batch to `on_expire` in a single call. Deadlines are
+    rounded up to the next tick. A delay longer than one revolution
+    (`tick * slots`) just stays in its slot for extra rounds.
+
+    The task sleeps while nothing is scheduled and starts on first use, so a
+    wheel can be built before the event loop runs.
+    """
+
+    def __init__(
+        self,
+        tick: float,
+        slots: int,
+        on_expire: Callable[[List[Hashable]], Awaitable[None]],
+    ) -> None:
+        self.tick = tick
+        self.on_expire = on_expire
+        # slot → {key: absolute tick the key expires at}
+        self._slots: List[Dict[Hashable, int]] = [{} for _ in range(slots)]
+        self._slot_of: Dict[Hashable, int] = {}
+        self._origin: Optional[float] = None
+        self._done_tick = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._slot_of
+
+    def schedule(self, key: Hashable, delay: float) -> None:
+        """(Re)arm `key` to expire after `delay` seconds."""
+        self._ensure_running()
+        self.cancel(key)
+        due = self._current_tick() + max(1, math.ceil(delay / self.tick))
+        slot = due % len(self._slots)
+        self._slots[slot][key] = due
+        self._slot_of[key] = slot
+        self._wakeup.set()
+
+    def schedule_many(self, entries: Iterable[Tuple[Hashable, float]]) -> None:
+        """`schedule` for a batch of (key, delay), reading the clock once."""
+        self._ensure_running()
+        now_tick = self._current_tick()
+        slots = self._slots
+        slot_of = self._slot_of
+        for key, delay in entries:
+            old = slot_of.get(key)
+            if old is not None:
+                del slots[old][key]
+            due = now_tick + max(1, math.ceil(delay / self.tick))
+            slot = due % len(slots)
+            slots[slot][key] = due
+            slot_of[key] = slot
+        self._wakeup.set()
+
+    def cancel(self, key: Hashable) -> bool:
+        slot = self._slot_of.pop(key, None)
+        if slot is None:
+            return False
+        del self._slots[slot][key]
+        return True
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # ─── private ────────────────────────────────────────────────────────────
+
+    def _current_tick(self) -> int:
+        return int((asyncio.get_running_loop().time() - self._origin) / self.tick)
+
+    def _ensure_running(self) -> None:
+        if self._task is None or self._task.done():
+            if self._origin is None:
+                self._origin = asyncio.get_running_loop().time()
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._done_tick = self._current_tick()
+        while True:
+            if not self._slot_of:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                # Nothing was due while idle; resume from the present
+                self._done_tick = self._current_tick()
+                continue
+
+            # Sleep to the next tick boundary measured from the origin, so ticks don't drift
+            next_at = self._origin + (self._done_tick + 1) * self.tick
+            await asyncio.sleep(max(0.0, next_at - loop.time()))
+
+            now_tick = self._current_tick()
+            expired: List[Hashable] = []
+            # After a stall, one revolution visits every slot
+            first = max(self._done_tick + 1, now_tick - len(self._slots) + 1)
+            for t in range(first, now_tick + 1):
+                slot = self._slots[t % len(self._slots)]
+                if not slot:
+                    continue
+                due = [k for k, at in slot.items() if at <= now_tick]
+                for key in due:
+                    del slot[key]
+                    del self._slot_of[key]
+                expired.extend(due)
+            self._done_tick = now_tick
+
+            if expired:
+                try:
+                    await self.on_expire(expired)
+                except Exception as e:
+                    logger.error(f"Timer wheel expiry handler failed for {len(expired)} keys: {e!r}")
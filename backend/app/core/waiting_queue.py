@@ -0,0 +1,47 @@
+from collections import OrderedDict
+from typing import Iterator, Optional
+
+
+class WaitingQueue:
+    """
+    FIFO of waiting user ids with O(1) membership, removal and append.
+
+    Backed by an OrderedDict (a hash map threaded through a doubly linked
+    list), so leaving the queue unlinks the entry in place instead of
+    scanning, and no tombstones are left behind for the pairing loop to skip.
+    """
+
+    __slots__ = ("_items",)
+
+    def __init__(self) -> None:
+        self._items: "OrderedDict[str, None]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, user_id: object) -> bool:
+        return user_id in self._items
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._items)
+
+    def append(self, user_id: str) -> bool:
+        """Enqueue at the back; returns False if the user is already waiting."""
+        if user_id in self._items:
+            return False
+        self._items[user_id] = None
+        return True
+
+    def discard(self, user_id: str) -> bool:
+        """Remove a user wherever they are in the queue; returns whether they were waiting."""
+        if user_id not in self._items:
+            return False
+        del self._items[user_id]
+        return True
+
+    def peek(self, index: int = 0) -> Optional[str]:
+        """The user `index` places from the front, or None; walks `index` entries."""
+        for i, user_id in enumerate(self._items):
+            if i == index:
+                return user_id
+        return None
@@ -0,0 +1,80 @@
+"""
+Uvicorn websocket protocol with permessage-deflate tuned for chat frames.
+
+Uvicorn's own protocol negotiates deflate with fixed parameters (12-bit
+windows, memLevel 5: ~50 KB of zlib state per connection). This one takes
+the window size and memory level from Settings. It can also send messages
+shorter than WS_DEFLATE_MIN_BYTES uncompressed, which RFC 7692 allows per
+message, to trade bytes for CPU. See benchmarks/bench_wire_formats.py.
+Incoming messages are capped at WS_MAX_FRAME_BYTES.
+Select it with:
+
+    uvicorn app.main:app --ws app.core.ws_protocol:TunedWebSocketProtocol
+"""
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from uvicorn.protocols.websockets.websockets_sansio_impl import WebSocketsSansIOProtocol
+from websockets.extensions.base import Extension
+from websockets.extensions.permessage_deflate import PerMessageDeflate, ServerPerMessageDeflateFactory
+from websockets.frames import CONT, Frame
+from websockets.typing import ExtensionParameter
+
+from app.settings import settings
+
+
+class SmallFrameDeflate(PerMessageDeflate):
+    """PerMessageDeflate that leaves single-frame messages under `min_bytes` uncompressed."""
+
+    def __init__(self, *args: Any, min_bytes: int = 0, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.min_bytes = min_bytes
+
+    def encode(self, frame: Frame) -> Frame:
+        # RSV1 stays unset, which tells the peer this message isn't compressed
+        if frame.fin and frame.opcode is not CONT and len(frame.data) < self.min_bytes:
+            return frame
+        return super().encode(frame)
+
+
+class TunedDeflateFactory(ServerPerMessageDeflateFactory):
+    def __init__(self, min_bytes: int = 0, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.min_bytes = min_bytes
+
+    def process_request_params(
+        self,
+        params: Sequence[ExtensionParameter],
+        accepted_extensions: Sequence[Extension],
+    ) -> Tuple[list, PerMessageDeflate]:
+        response, ext = super().process_request_params(params, accepted_extensions)
+        tuned = SmallFrameDeflate(
+            ext.remote_no_context_takeover,
+            ext.local_no_context_takeover,
+            ext.remote_max_window_bits,
+            ext.local_max_window_bits,
+            ext.compress_settings,
+            min_bytes=self.min_bytes,
+        )
+        return response, tuned
+
+
+def deflate_factory(
+    window_bits: Optional[int] = None, mem_level: Optional[int] = None, min_bytes: Optional[int] = None,
+) -> TunedDeflateFactory:
+    window_bits = window_bits or settings.WS_DEFLATE_WINDOW_BITS
+    compress_settings: Dict[str, Any] = {"memLevel": mem_level or settings.WS_DEFLATE_MEM_LEVEL}
+    return TunedDeflateFactory(
+        min_bytes=settings.WS_DEFLATE_MIN_BYTES if min_bytes is None else min_bytes,
+        server_max_window_bits=window_bits,
+        client_max_window_bits=window_bits,
+        compress_settings=compress_settings,
+    )
+
+
+class TunedWebSocketProtocol(WebSocketsSansIOProtocol):
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        # Oversized messages are refused with 1009 from the frame header, before they are buffered
+        self.conn.max_message_size = min(self.config.ws_max_size, settings.WS_MAX_FRAME_BYTES)
+        if self.config.ws_per_message_deflate:
+            self.conn.available_extensions = [deflate_factory()]
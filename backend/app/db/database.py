@@ -1,17 +1,26 @@
-from datetime import datetime, timedelta, timezone
-from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+import asyncio
 import logging
+import time
 
 from sqlalchemy import (
-    create_engine, MetaData, Table, Column, String, Integer,
-    DateTime, delete, select, update, text, func, case
+    create_engine, MetaData, Table, Column, Index, String, Integer,
+    Date, DateTime, delete, select, update, text, func, case, literal, tuple_
 )
-from sqlalchemy.pool import StaticPool, NullPool
+from sqlalchemy.pool import StaticPool, QueuePool
 
+from app.core import metrics
 from app.settings import settings
 
 logger = logging.getLogger("uvicorn.error")
 
+DB_CALL = metrics.Histogram(
+    "chat_db_call_seconds", "DB calls made through run(), including wait for the DB thread", ("fn",),
+)
+
 # ──────────────────────────────────────────────
 # Engine setup
 # ──────────────────────────────────────────────
@@ -23,10 +32,21 @@ if _is_sqlite:
     _engine_kwargs["connect_args"] = {"check_same_thread": False}
     _engine_kwargs["poolclass"] = StaticPool
 else:
-    _engine_kwargs["poolclass"] = NullPool
+    _engine_kwargs["poolclass"] = QueuePool
+    _engine_kwargs["pool_size"] = settings.DB_POOL_SIZE
+    _engine_kwargs["max_overflow"] = settings.DB_MAX_OVERFLOW
+    _engine_kwargs["pool_recycle"] = 1800
 
 engine = create_engine(settings.DATABASE_URL, **_engine_kwargs)
 
+# All blocking DB work from async code goes through this pool. SQLite shares a
+# single connection (StaticPool), so it gets a single worker thread; Postgres
+# gets one thread per pooled connection so workers never queue on the pool.
+_executor = ThreadPoolExecutor(
+    max_workers=1 if _is_sqlite else settings.DB_POOL_SIZE,
+    thread_name_prefix="db",
+)
+
 metadata = MetaData()
 
 # ──────────────────────────────────────────────
@@ -47,6 +67,32 @@ push_tokens = Table(
     Column("created_at", DateTime(timezone=True), server_default=func.now()),
 )
 
+# Indexes for the hot push_tokens queries. Existing databases get them through
+# migrations (app/db/migrations.py); create_all adds them to new ones.
+PUSH_TOKEN_INDEXES = (
+    # Admin filter / push exclusion by user
+    Index("ix_push_tokens_user_id", push_tokens.c.user_id),
+    # "Active since" filters and today's activity
+    Index("ix_push_tokens_last_opened_at", push_tokens.c.last_opened_at),
+    # New users per day, and keyset pages sorted by created_at
+    Index("ix_push_tokens_created_at_token", push_tokens.c.created_at, push_tokens.c.token),
+    # Push eligibility: never notified (NULL) or notified before the cooldown cutoff.
+    # Both branches are ranges on this index (NULLs are indexed too), and it covers
+    # user_id/token so the exclusion check never touches the table.
+    Index("ix_push_tokens_cooldown", push_tokens.c.last_sent_at, push_tokens.c.user_id, push_tokens.c.token),
+)
+
+# Per-IST-day activity, maintained incrementally by upsert_app_opens. Deleting
+# tokens does not rewrite history here.
+daily_stats = Table(
+    "daily_stats",
+    metadata,
+    Column("day", Date, primary_key=True),
+    Column("new_users", Integer, nullable=False, server_default=text("0")),
+    Column("active_users", Integer, nullable=False, server_default=text("0")),
+    Column("app_opens", Integer, nullable=False, server_default=text("0")),
+)
+
 # UTC helper
 def _now_utc() -> datetime:
     return datetime.now(timezone.utc)
@@ -54,11 +100,18 @@ def _now_utc() -> datetime:
 # IST helper
 IST = timezone(timedelta(hours=5, minutes=30))
 
+def ist_day_start_utc(moment: datetime) -> datetime:
+    """Return the exact UTC equivalent of midnight (IST) on the IST day containing `moment`."""
+    day_start_ist = moment.astimezone(IST).replace(hour=0, minute=0, second=0, microsecond=0)
+    return day_start_ist.astimezone(timezone.utc)
+
 def _ist_today_start_utc() -> datetime:
     """Return the exact UTC equivalent of midnight today in IST."""
-    now_ist = datetime.now(IST)
-    today_start_ist = now_ist.replace(hour=0, minute=0, second=0, microsecond=0)
-    return today_start_ist.astimezone(timezone.utc)
+    return ist_day_start_utc(_now_utc())
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite hands back naive datetimes for timezone-aware columns
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
 
 
 # ──────────────────────────────────────────────
@@ -72,21 +125,49 @@ def init_db() -> None:
             conn.execute(text("SELECT 1"))
         logger.info(f"✅ Database connected ({engine.dialect.name}) — {engine.url.database}")
         metadata.create_all(engine)
+        from app.db import migrations
+        migrations.upgrade(engine)
         logger.info("✅ Tables ready")
     except Exception as e:
         logger.error(f"❌ Database connection failed: {e}")
         raise
 
 
+def shutdown_db() -> None:
+    """Wait for in-flight DB calls, then release pooled connections."""
+    _executor.shutdown(wait=True)
+    engine.dispose()
+
+
+T = TypeVar("T")
+
+
+async def run(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking DB function on the DB thread pool, off the event loop."""
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    try:
+        return await loop.run_in_executor(_executor, partial(fn, *args, **kwargs))
+    finally:
+        DB_CALL.observe(time.perf_counter() - started, getattr(fn, "__name__", "call"))
+
+
 # ──────────────────────────────────────────────
 # Token CRUD
 # ──────────────────────────────────────────────
 
-def add_token(user_id: str, token: str, device_name: Optional[str] = None) -> None:
-    now = _now_utc()
-    today_start = _ist_today_start_utc()
-    
+def upsert_app_opens(rows: List[dict]) -> None:
+    """
+    Apply aggregated app opens in one transaction.
+
+    Each row carries `opens_total`, `opens_today` (opens on the IST day that
+    starts at `day_start`), and the first/last open times seen for the token.
+    """
+    if not rows:
+        return
+
     with engine.begin() as conn:
+        _rollup_app_opens(conn, rows)
         if engine.dialect.name == "sqlite":
             conn.execute(
                 text("""
@@ -95,54 +176,64 @@ def add_token(user_id: str, token: str, device_name: Optional[str] = None) -> No
                         app_opens_total, app_opens_today, last_opened_at,
                         last_sent_at, created_at
                     )
-                    VALUES (:token, :user_id, :device_name, 1, 1, :now, NULL, :now)
+                    VALUES (
+                        :token, :user_id, :device_name,
+                        :opens_total, :opens_today, :last_opened_at,
+                        NULL, :first_opened_at
+                    )
                     ON CONFLICT(token) DO UPDATE SET
                         user_id = :user_id,
                         device_name = :device_name,
-                        app_opens_total = push_tokens.app_opens_total + 1,
+                        app_opens_total = push_tokens.app_opens_total + :opens_total,
                         app_opens_today = CASE
-                            WHEN push_tokens.last_opened_at >= :today_start THEN push_tokens.app_opens_today + 1
-                            ELSE 1
+                            WHEN push_tokens.last_opened_at >= :day_start THEN push_tokens.app_opens_today + :opens_today
+                            ELSE :opens_today
                         END,
-                        last_opened_at = :now
+                        last_opened_at = :last_opened_at
                 """),
-                {
-                    "token": token, 
-                    "user_id": user_id, 
-                    "device_name": device_name, 
-                    "now": now,
-                    "today_start": today_start
-                },
+                rows,
             )
         else:
             from sqlalchemy.dialects.postgresql import insert as pg_insert
 
-            stmt = pg_insert(push_tokens).values(
-                token=token,
-                user_id=user_id,
-                device_name=device_name,
-                app_opens_total=1,
-                app_opens_today=1,
-                last_opened_at=now,
-                last_sent_at=None,
-                created_at=now,
-            )
-            
-            # The EXCLUDED table represents the row proposed for insertion
-            update_stmt = stmt.on_conflict_do_update(
-                index_elements=["token"],
-                set_={
-                    "user_id": stmt.excluded.user_id,
-                    "device_name": stmt.excluded.device_name,
-                    "app_opens_total": push_tokens.c.app_opens_total + 1,
-                    "app_opens_today": case(
-                        (push_tokens.c.last_opened_at >= today_start, push_tokens.c.app_opens_today + 1),
-                        else_=1
-                    ),
-                    "last_opened_at": stmt.excluded.last_opened_at
-                },
-            )
-            conn.execute(update_stmt)
+            # One multi-row statement per IST day (a batch only spans two at midnight)
+            by_day: Dict[datetime, List[dict]] = {}
+            for row in rows:
+                by_day.setdefault(row["day_start"], []).append(row)
+
+            for day_start, day_rows in by_day.items():
+                stmt = pg_insert(push_tokens).values([
+                    {
+                        "token": r["token"],
+                        "user_id": r["user_id"],
+                        "device_name": r["device_name"],
+                        "app_opens_total": r["opens_total"],
+                        "app_opens_today": r["opens_today"],
+                        "last_opened_at": r["last_opened_at"],
+                        "last_sent_at": None,
+                        "created_at": r["first_opened_at"],
+                    }
+                    for r in day_rows
+                ])
+
+                # The EXCLUDED table represents the row proposed for insertion
+                update_stmt = stmt.on_conflict_do_update(
+                    index_elements=["token"],
+                    set_={
+                        "user_id": stmt.excluded.user_id,
+                        "device_name": stmt.excluded.device_name,
+                        "app_opens_total": push_tokens.c.app_opens_total + stmt.excluded.app_opens_total,
+                        "app_opens_today": case(
+                            (
+                                push_tokens.c.last_opened_at >= day_start,
+                                push_tokens.c.app_opens_today + stmt.excluded.app_opens_today,
+                            ),
+                            else_=stmt.excluded.app_opens_today,
+                        ),
+                        "last_opened_at": stmt.excluded.last_opened_at,
+                    },
+                )
+                conn.execute(update_stmt)
 
 
 def delete_token(token: str) -> None:
@@ -154,39 +245,78 @@ def delete_token(token: str) -> None:
         logger.error(f"❌ Failed to delete token {token} from database: {e}")
 
 
-def get_eligible_tokens(
-    limit: int = 100,
-    cooldown_minutes: int = 30,
-    exclude_user_ids: Optional[List[str]] = None,
-) -> List[str]:
-    """Return tokens that haven't been notified within the cooldown window."""
-    cutoff = _now_utc() - timedelta(minutes=cooldown_minutes)
+def delete_tokens(tokens: List[str]) -> int:
+    """Delete many tokens in one statement; returns the number of rows removed."""
+    if not tokens:
+        return 0
+    with engine.begin() as conn:
+        result = conn.execute(delete(push_tokens).where(push_tokens.c.token.in_(tokens)))
+    logger.info(f"✅ Deleted {result.rowcount} invalid tokens from database")
+    return result.rowcount
+
+
+# Keyset orderings for list_tokens: sort name → columns, the last one unique
+TOKEN_SORTS = {
+    "token": (push_tokens.c.token,),
+    "created_at": (push_tokens.c.created_at, push_tokens.c.token),
+}
+
+
+def list_tokens(
+    limit: int,
+    after: Optional[tuple] = None,
+    sort: str = "token",
+    active_since: Optional[datetime] = None,
+    never_sent: bool = False,
+    user_id: Optional[str] = None,
+) -> List[dict]:
+    """
+    Return one page of tokens in `sort` order, starting after the keyset
+    `after` (the sort columns' values of the previous page's last row).
+    Filters and the page boundary are applied in SQL.
+    """
+    keys = TOKEN_SORTS[sort]
+    query = select(push_tokens)
+    if after is not None:
+        query = query.where(tuple_(*keys) > tuple_(*(literal(v, k.type) for k, v in zip(keys, after))))
+    if active_since is not None:
+        query = query.where(push_tokens.c.last_opened_at >= active_since)
+    if never_sent:
+        query = query.where(push_tokens.c.last_sent_at.is_(None))
+    if user_id is not None:
+        query = query.where(push_tokens.c.user_id == user_id)
+    query = query.order_by(*keys).limit(limit)
+
+    with engine.connect() as conn:
+        return [dict(r) for r in conn.execute(query).mappings()]
 
-    query = select(push_tokens.c.token).where(
-        (push_tokens.c.last_sent_at == None)  # noqa: E711
-        | (push_tokens.c.last_sent_at < cutoff)
-    )
 
-    if exclude_user_ids:
-        query = query.where(push_tokens.c.user_id.notin_(exclude_user_ids))
+def delete_all_tokens() -> int:
+    with engine.begin() as conn:
+        result = conn.execute(delete(push_tokens))
+    return result.rowcount
 
-    query = query.limit(limit)
 
+def load_push_index_rows() -> List[tuple]:
+    """Return (token, user_id, last_sent_at) for every token, for the in-memory push index."""
     with engine.connect() as conn:
-        rows = conn.execute(query).fetchall()
-    return [row[0] for row in rows]
+        rows = conn.execute(
+            select(push_tokens.c.token, push_tokens.c.user_id, push_tokens.c.last_sent_at)
+        ).fetchall()
+    return [tuple(r) for r in rows]
 
 
-def update_last_sent(tokens: List[str]) -> None:
-    if not tokens:
+def update_last_sent_many(groups: Dict[Tuple[datetime, int], List[str]]) -> None:
+    """Apply batched send updates in one transaction: {(sent_at, pushes): tokens}."""
+    if not groups:
         return
-    now = _now_utc()
     with engine.begin() as conn:
-        conn.execute(
-            update(push_tokens)
-            .where(push_tokens.c.token.in_(tokens))
-            .values(last_sent_at=now, push_count=push_tokens.c.push_count + 1)
-        )
+        for (sent_at, count), tokens in groups.items():
+            conn.execute(
+                update(push_tokens)
+                .where(push_tokens.c.token.in_(tokens))
+                .values(last_sent_at=sent_at, push_count=push_tokens.c.push_count + count)
+            )
 
 
 # ──────────────────────────────────────────────
@@ -196,37 +326,159 @@ def update_last_sent(tokens: List[str]) -> None:
 def get_token_stats() -> dict:
     """Return total registered token count and how many were created today (IST), plus app opens."""
     today_start = _ist_today_start_utc()
+    opened_today = push_tokens.c.last_opened_at >= today_start
 
+    # One aggregate pass over push_tokens
     with engine.connect() as conn:
-        total_users: int = conn.execute(
-            select(func.count()).select_from(push_tokens)
-        ).scalar() or 0
-
-        new_users_today: int = conn.execute(
-            select(func.count())
-            .select_from(push_tokens)
-            .where(push_tokens.c.created_at >= today_start)
-        ).scalar() or 0
-        
-        # Calculate engagement metrics
-        app_opens_today: int = conn.execute(
-            select(func.sum(push_tokens.c.app_opens_today))
-            .where(push_tokens.c.last_opened_at >= today_start)
-        ).scalar() or 0
-        
-        app_opens_multi_day_today: int = conn.execute(
-            select(func.count())
-            .where(push_tokens.c.last_opened_at >= today_start)
-        ).scalar() or 0
-        
-        app_opens_total_all_time: int = conn.execute(
-            select(func.sum(push_tokens.c.app_opens_total))
-        ).scalar() or 0
-
+        row = conn.execute(
+            select(
+                func.count(),
+                func.sum(case((push_tokens.c.created_at >= today_start, 1), else_=0)),
+                func.sum(case((opened_today, 1), else_=0)),
+                func.sum(case((opened_today, push_tokens.c.app_opens_today), else_=0)),
+                func.sum(push_tokens.c.app_opens_total),
+            ).select_from(push_tokens)
+        ).one()
+
+    total_users, new_users_today, active_users_today, app_opens_today, app_opens_all_time = row
     return {
-        "users_total": total_users,
-        "new_users_today": new_users_today,
-        "active_users_today": app_opens_multi_day_today,
-        "app_opens_today": app_opens_today,
-        "app_opens_all_time": app_opens_total_all_time,
+        "users_total": total_users or 0,
+        "new_users_today": new_users_today or 0,
+        "active_users_today": active_users_today or 0,
+        "app_opens_today": app_opens_today or 0,
+        "app_opens_all_time": app_opens_all_time or 0,
     }
+
+
+def get_daily_stats(days: int) -> List[dict]:
+    """Return the rollup for the last `days` IST days (oldest first); days without activity are omitted."""
+    first_day = _now_utc().astimezone(IST).date() - timedelta(days=days - 1)
+    with engine.connect() as conn:
+        rows = conn.execute(
+            select(daily_stats).where(daily_stats.c.day >= first_day).order_by(daily_stats.c.day)
+        ).mappings().all()
+    return [dict(r) for r in rows]
+
+
+def _ist_date(day_start: datetime) -> date:
+    return day_start.astimezone(IST).date()
+
+
+def _upsert_daily_stats(conn, deltas: Dict[date, List[int]]) -> None:
+    """Add {day: [new_users, active_users, app_opens]} onto daily_stats."""
+    if not deltas:
+        return
+    if engine.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+
+    stmt = dialect_insert(daily_stats).values([
+        {"day": day, "new_users": new, "active_users": active, "app_opens": opens}
+        for day, (new, active, opens) in deltas.items()
+    ])
+    conn.execute(stmt.on_conflict_do_update(
+        index_elements=["day"],
+        set_={
+            "new_users": daily_stats.c.new_users + stmt.excluded.new_users,
+            "active_users": daily_stats.c.active_users + stmt.excluded.active_users,
+            "app_opens": daily_stats.c.app_opens + stmt.excluded.app_opens,
+        },
+    ))
+
+
+def _rollup_app_opens(conn, rows: List[dict]) -> None:
+    """
+    Fold a batch of app opens into daily_stats, judged against each token's
+    state before the batch: a token is new on the day of its first open and
+    active on a day the first time it opens the app that day.
+
+    Unknown tokens are inserted here with ON CONFLICT DO NOTHING RETURNING, so
+    when workers flush the same first open concurrently only the one whose
+    insert wins counts it. Rows are inserted and locked in token order, the
+    same in every flush, so concurrent flushes can't deadlock.
+    """
+    if engine.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+
+    by_token = {r["token"]: r for r in rows}
+    tokens = sorted(by_token)
+    created: set = set()
+    prior: Dict[str, Optional[datetime]] = {}
+    # Chunked to stay under SQLite's bound-parameter limit
+    for i in range(0, len(tokens), 200):
+        chunk = tokens[i:i + 200]
+        stmt = dialect_insert(push_tokens).values([
+            {
+                "token": token,
+                "user_id": by_token[token]["user_id"],
+                "device_name": by_token[token]["device_name"],
+                "created_at": by_token[token]["first_opened_at"],
+            }
+            for token in chunk
+        ])
+        created.update(conn.execute(
+            stmt.on_conflict_do_nothing(index_elements=["token"]).returning(push_tokens.c.token)
+        ).scalars())
+
+        existing = [token for token in chunk if token not in created]
+        if not existing:
+            continue
+        query = select(push_tokens.c.token, push_tokens.c.last_opened_at).where(
+            push_tokens.c.token.in_(existing)
+        ).order_by(push_tokens.c.token)
+        if engine.dialect.name != "sqlite":
+            query = query.with_for_update()
+        for token, last_opened_at in conn.execute(query):
+            prior[token] = _as_utc(last_opened_at) if last_opened_at is not None else None
+
+    deltas: Dict[date, List[int]] = {}
+
+    def bump(day_start: datetime, new: bool, active: bool, opens: int) -> None:
+        d = deltas.setdefault(_ist_date(day_start), [0, 0, 0])
+        d[0] += new
+        d[1] += active
+        d[2] += opens
+
+    for r in rows:
+        day_start = r["day_start"]
+        is_new = r["token"] in created
+        last = prior.get(r["token"])
+        # A buffer flushed across midnight holds opens from the previous IST day too
+        earlier = r["opens_total"] - r["opens_today"]
+        if earlier > 0:
+            prev_start = ist_day_start_utc(day_start - timedelta(hours=12))
+            bump(prev_start, is_new, is_new or last is None or last < prev_start, earlier)
+            bump(day_start, False, r["opens_today"] > 0, r["opens_today"])
+        else:
+            bump(day_start, is_new, is_new or last is None or last < day_start, r["opens_today"])
+
+    _upsert_daily_stats(conn, deltas)
+
+
+def backfill_daily_stats(conn) -> None:
+    """
+    Seed an empty rollup from push_tokens: new users for every past day, and
+    today's active users and opens (earlier days' activity was never kept).
+    """
+    if conn.execute(select(func.count()).select_from(daily_stats)).scalar():
+        return
+    deltas: Dict[date, List[int]] = {}
+    for (created_at,) in conn.execute(select(push_tokens.c.created_at).where(push_tokens.c.created_at.is_not(None))):
+        d = deltas.setdefault(_as_utc(created_at).astimezone(IST).date(), [0, 0, 0])
+        d[0] += 1
+
+    today_start = _ist_today_start_utc()
+    active, opens = conn.execute(
+        select(func.count(), func.sum(push_tokens.c.app_opens_today))
+        .where(push_tokens.c.last_opened_at >= today_start)
+    ).one()
+    if active:
+        d = deltas.setdefault(_ist_date(today_start), [0, 0, 0])
+        d[1] += active
+        d[2] += opens or 0
+    _upsert_daily_stats(conn, deltas)
+    if deltas:
+        logger.info(f"✅ Backfilled daily_stats for {len(deltas)} days")
@@ -0,0 +1,84 @@
+"""
+Versioned schema migrations, applied at startup by `database.init_db`.
+
+`metadata.create_all` only creates missing tables; anything that changes an
+existing database (indexes, new columns, data fixes) is a numbered step
+here. Each step runs in its own transaction together with the row that
+records it in `schema_migrations`, so a failed step is retried on the next
+start. On Postgres an advisory lock keeps concurrently starting workers from
+applying the same step twice.
+
+To add a migration, append `(next_version, "what it does", fn)` to
+MIGRATIONS; `fn(conn)` gets a connection inside the step's transaction.
+Never edit or reorder a step that has shipped.
+"""
+import logging
+from datetime import datetime, timezone
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, insert, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from app.db import database
+
+logger = logging.getLogger("uvicorn.error")
+
+_schema = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    _schema,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime(timezone=True), nullable=False),
+)
+
+# Arbitrary constant shared by every worker: key of the Postgres advisory lock
+_PG_LOCK_KEY = 7_301_942_001
+
+
+def _baseline(conn: Connection) -> None:
+    """Tables as created by metadata.create_all; nothing to change."""
+
+
+def _backfill_daily_stats(conn: Connection) -> None:
+    database.backfill_daily_stats(conn)
+
+
+def _push_token_indexes(conn: Connection) -> None:
+    for index in database.PUSH_TOKEN_INDEXES:
+        index.create(conn, checkfirst=True)
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "baseline schema", _baseline),
+    (2, "backfill daily_stats rollup", _backfill_daily_stats),
+    (3, "indexes for push_tokens hot queries", _push_token_indexes),
+]
+
+
+def upgrade(engine: Engine) -> None:
+    """Apply every migration not yet recorded, in version order."""
+    is_pg = engine.dialect.name == "postgresql"
+    with engine.connect() as conn:
+        if is_pg:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": _PG_LOCK_KEY})
+            conn.commit()
+        try:
+            _schema.create_all(conn)
+            conn.commit()
+            applied = set(conn.execute(select(schema_migrations.c.version)).scalars())
+            conn.commit()
+            for version, name, fn in sorted(MIGRATIONS):
+                if version in applied:
+                    continue
+                with conn.begin():
+                    fn(conn)
+                    conn.execute(insert(schema_migrations).values(
+                        version=version, name=name, applied_at=datetime.now(timezone.utc),
+                    ))
+                logger.info(f"✅ Applied migration {version}: {name}")
+        finally:
+            if is_pg:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _PG_LOCK_KEY})
+                conn.commit()
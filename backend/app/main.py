@@ -3,6 +3,10 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from app.settings import settings
 from app.db import database
+from app.core import shutdown
+from app.core.app_opens import app_opens
+from app.core.heartbeat import heartbeat
+from app.core.profiler import profiler
 from app.api import admin, ws
 
 app = FastAPI(title="Stranger Chat Backend")
@@ -18,7 +22,23 @@ app.add_middleware(
 
 @app.on_event("startup")
 async def startup_event():
+    # After uvicorn installed its signal handlers, so /ws can tell a shutdown from a client close
+    shutdown.install()
     database.init_db()
+    await ws.mm.start()
+    app_opens.start()
+    if settings.PROFILER_ENABLED:
+        profiler.enable()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    profiler.disable()
+    await heartbeat.stop()
+    await ws.mm.drain()
+    await ws.mm.stop()
+    await app_opens.stop()
+    database.shutdown_db()
 
 
 # ── Routers ────────────────────────────────────────────────────────────────
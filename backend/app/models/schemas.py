@@ -4,10 +4,16 @@ from pydantic import BaseModel, Field
 # Client → Server events
 # ──────────────────────────────────────────────
 
+class MatchPrefs(BaseModel):
+    language: str | None = None
+    region: str | None = None
+    interests: list[str] = []
+
 class JoinQueue(BaseModel):
     type: str = Field("join_queue", frozen=True)
     userId: str
     avatar: str
+    prefs: MatchPrefs | None = None
 
 class ClientMessage(BaseModel):
     type: str = Field("message", frozen=True)
@@ -30,7 +36,10 @@ class Reconnect(BaseModel):
     type: str = Field("reconnect", frozen=True)
     userId: str
 
-ClientEvent = JoinQueue | ClientMessage | Typing | Next | Leave | Reconnect
+class Pong(BaseModel):
+    type: str = Field("pong", frozen=True)
+
+ClientEvent = JoinQueue | ClientMessage | Typing | Next | Leave | Reconnect | Pong
 
 # ──────────────────────────────────────────────
 # Server → Client events
@@ -70,4 +79,7 @@ class ErrorEvt(BaseModel):
     type: str = Field("error", frozen=True)
     message: str
 
-ServerEvent = Paired | ServerMessage | ServerTyping | System | QueueSize | ErrorEvt
+class Ping(BaseModel):
+    type: str = Field("ping", frozen=True)
+
+ServerEvent = Paired | ServerMessage | ServerTyping | System | QueueSize | ErrorEvt | Ping
@@ -1,14 +1,37 @@
-from typing import TypedDict, Optional
-
-class UserConn(TypedDict, total=False):
-    id: str
-    ws: any
-    avatar: str
-    room_id: Optional[str]
-    disconnect_task: Optional[any]
-
-class Room(TypedDict):
-    id: str
-    u1: str
-    u2: str
-    created_at: int
+from typing import Any, Optional
+
+# Slotted records: one UserConn per connected user, so no per-instance dict
+
+
+class UserConn:
+    __slots__ = (
+        "id", "ws", "avatar", "prefs", "room", "partner", "queued_at", "grace_until",
+        "typing", "typing_sent_at", "typing_seen_at",
+    )
+
+    def __init__(self, id: str, ws: Any, avatar: str) -> None:
+        self.id = id
+        self.ws = ws
+        self.avatar = avatar
+        # Normalized match preferences from the last join_queue (see app/core/match_engine.py)
+        self.prefs: Optional[tuple] = None
+        self.room: Optional["Room"] = None
+        # The other user in `room`, so relays go straight to them
+        self.partner: Optional["UserConn"] = None
+        self.queued_at = 0.0
+        # monotonic deadline while disconnected and inside the reconnect grace period
+        self.grace_until: Optional[float] = None
+        # Typing state the partner was last told, when it was sent, and the latest isTyping=true
+        self.typing = False
+        self.typing_sent_at = 0.0
+        self.typing_seen_at = 0.0
+
+
+class Room:
+    __slots__ = ("id", "u1", "u2", "created_at")
+
+    def __init__(self, id: str, u1: UserConn, u2: UserConn, created_at: int) -> None:
+        self.id = id
+        self.u1 = u1
+        self.u2 = u2
+        self.created_at = created_at
@@ -3,6 +3,98 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 class Settings(BaseSettings):
     ALLOW_ORIGINS: list[str] = ["*"]
     DATABASE_URL: str = "sqlite:///app.db"
+    # Postgres connection pool; also sizes the thread pool that runs DB calls
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 5
+
+    # Minimum spacing between two queue_size fan-outs; changes in between are coalesced
+    QUEUE_SIZE_BROADCAST_INTERVAL_MS: int = 250
+    # Match preferences sent with join_queue only apply for this long; a user still waiting
+    # then matches anyone. Interest tags beyond MATCH_MAX_INTERESTS are ignored.
+    MATCH_FALLBACK_SECONDS: float = 10
+    MATCH_MAX_INTERESTS: int = 3
+    # Number of striped locks guarding room lifecycle operations
+    ROOM_LOCK_STRIPES: int = 64
+    # How long a disconnected user's room is kept for them to reconnect, and
+    # the resolution of the timer wheel that expires those grace periods
+    RECONNECT_GRACE_SECONDS: float = 30
+    TIMER_WHEEL_TICK_MS: int = 100
+    # Rooms and the waiting queue are written here on a draining shutdown and restored on the
+    # next start, so users can `reconnect` to their rooms across a deploy; empty disables it.
+    # /data is the volume docker-compose mounts, so the file outlives the container
+    MATCHMAKER_SNAPSHOT_PATH: str = "/data/matchmaker.snapshot"
+    # Typing indicators: a repeated isTyping=true is only forwarded once this long has
+    # passed since the last one, to refresh the partner's indicator (the app clears it
+    # after 2 s); isTyping=true with nothing newer expires and the partner gets false
+    TYPING_REFRESH_MS: int = 1500
+    TYPING_TIMEOUT_MS: int = 5000
+    # Per-connection outbound queue: typing/queue_size frames are shed past the
+    # soft limit, and the client is disconnected once the high-water mark is hit
+    OUTBOUND_SOFT_LIMIT: int = 32
+    OUTBOUND_HIGH_WATER: int = 256
+    # App-level heartbeat: a socket silent for HEARTBEAT_INTERVAL_SECONDS is sent a ping, and
+    # reaped (same path as a disconnect) if nothing arrives within HEARTBEAT_TIMEOUT_SECONDS.
+    # Clients that have never answered a ping are only reaped once writes to them fail.
+    HEARTBEAT_INTERVAL_SECONDS: float = 25
+    HEARTBEAT_TIMEOUT_SECONDS: float = 10
+    # Inbound flood protection. Frames over WS_MAX_FRAME_BYTES close the socket with 1009
+    # (under TunedWebSocketProtocol before they are even buffered); message text is capped at
+    # WS_MAX_TEXT_LENGTH characters. Each connection may send WS_RATE_LIMIT_PER_SECOND frames
+    # per second in bursts of up to WS_RATE_LIMIT_BURST, and each event type listed in
+    # WS_EVENT_RATE_LIMITS as many as its (per second, burst). Frames over a limit are dropped;
+    # WS_FLOOD_CLOSE_AFTER dropped in a row close the socket with 1008.
+    WS_MAX_FRAME_BYTES: int = 16384
+    WS_MAX_TEXT_LENGTH: int = 2000
+    WS_RATE_LIMIT_PER_SECOND: float = 20
+    WS_RATE_LIMIT_BURST: int = 40
+    WS_EVENT_RATE_LIMITS: dict[str, tuple[float, int]] = {
+        "message": (5, 20),
+        "typing": (10, 20),
+        "join_queue": (1, 5),
+        "next": (1, 5),
+        "reconnect": (1, 5),
+        "leave": (1, 5),
+        "register_push": (0.2, 3),
+    }
+    WS_FLOOD_CLOSE_AFTER: int = 200
+    # How long /admin/tokens/stats answers are reused before querying again
+    ADMIN_STATS_CACHE_SECONDS: float = 10
+    # Loop-lag / lock-contention profiler; can also be switched at runtime via /admin/profiler
+    PROFILER_ENABLED: bool = False
+    PROFILER_BLOCK_THRESHOLD_MS: float = 100
+    PROFILER_TICK_MS: float = 20
+    # Server → client frame encoder: "json-fast" (orjson/templates) or "json" (pydantic reference)
+    WS_CODEC: str = "json-fast"
+    # permessage-deflate under `--ws app.core.ws_protocol:TunedWebSocketProtocol`. The LZ77
+    # window (both directions) and zlib memLevel set each connection's zlib memory: about
+    # 23 KB at 10/3 vs 50 KB at uvicorn's 12/5, for ~25% more bytes on the wire.
+    # Messages shorter than WS_DEFLATE_MIN_BYTES go out uncompressed (saves CPU, costs bytes).
+    WS_DEFLATE_WINDOW_BITS: int = 10
+    WS_DEFLATE_MEM_LEVEL: int = 3
+    WS_DEFLATE_MIN_BYTES: int = 0
+    # Shared matchmaker broker (unix:///path or tcp://host:port); empty = in-process matchmaker
+    MATCHMAKER_BROKER_URL: str = ""
+
+    # Expo push dispatcher
+    EXPO_PUSH_BASE_URL: str = "https://exp.host/--/api/v2/push"
+    PUSH_CONCURRENCY: int = 4
+    PUSH_MAX_RETRIES: int = 3
+    PUSH_RETRY_BASE_SECONDS: float = 0.5
+    PUSH_RECEIPT_DELAY_SECONDS: float = 900
+    # Each device gets at most one push per cooldown
+    PUSH_COOLDOWN_SECONDS: float = 1800
+    # Liquidity pushes: queue joins are aggregated per window, and at most one campaign of
+    # up to NOTIFY_BATCH_SIZE devices goes out per window, if the waiting pool is at least
+    # NOTIFY_MIN_POOL and has grown by NOTIFY_MIN_GROWTH since the last campaign
+    NOTIFY_WINDOW_SECONDS: float = 10
+    NOTIFY_MIN_POOL: int = 1
+    NOTIFY_MIN_GROWTH: int = 1
+    NOTIFY_BATCH_SIZE: int = 100
+    # How often send times recorded in the in-memory push index are written back
+    PUSH_INDEX_FLUSH_INTERVAL_MS: int = 1000
+    # register_push app opens are buffered and upserted in bulk
+    APP_OPEN_FLUSH_INTERVAL_MS: int = 1000
+    APP_OPEN_FLUSH_MAX_ENTRIES: int = 500
 
     model_config = SettingsConfigDict(env_file=".env")
 
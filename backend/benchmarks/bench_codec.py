@@ -0,0 +1,78 @@
+"""
+Server frame encoding throughput: JsonCodec (pydantic + json) vs FastJsonCodec.
+
+Encodes every server event kind N times with each codec and reports frames
+per second, then a relay/queue_size fan-out where one payload goes to many
+recipients. Before timing, checks that both codecs produce the same JSON
+document for every kind (including non-ASCII and quoting edge cases).
+
+    cd backend && python -m benchmarks.bench_codec
+"""
+import json
+import time
+
+from app.core.codec import FastJsonCodec, JsonCodec, orjson
+
+N = 50_000
+FAN_OUT = 1_000
+
+ROOM = "3f2a9c1be0d44c7a9b8e6f1d2c3b4a59"
+CASES = {
+    "paired": (ROOM, "user-123", "🦊", 1_700_000_000_000),
+    "message": (ROOM, 'hi "there" — ça va? \n 👋', 1_700_000_000_000),
+    "typing": (ROOM, True),
+    "system": ("idle", "Partner left."),
+    "queue_size": (42,),
+    "error": ("Not joined",),
+}
+
+
+def check_equivalent(ref: JsonCodec, fast: JsonCodec) -> None:
+    for kind, args in CASES.items():
+        a = json.loads(ref.encode(kind, *args))
+        b = json.loads(fast.encode(kind, *args))
+        assert a == b, (kind, a, b)
+    assert json.loads(fast.typing(ROOM, False))["isTyping"] is False
+
+
+def rate(codec: JsonCodec, kind: str, args: tuple) -> float:
+    encode = codec.encode
+    started = time.perf_counter()
+    for _ in range(N):
+        encode(kind, *args)
+    return N / (time.perf_counter() - started)
+
+
+def fan_out(codec: JsonCodec, per_recipient: bool) -> float:
+    """Frames/s delivering one queue_size update to FAN_OUT recipients."""
+    sink: list = []
+    rounds = N // FAN_OUT
+    started = time.perf_counter()
+    for count in range(rounds):
+        if per_recipient:
+            for _ in range(FAN_OUT):
+                sink.append(codec.queue_size(count))
+        else:
+            payload = codec.queue_size(count)
+            for _ in range(FAN_OUT):
+                sink.append(payload)
+        sink.clear()
+    return rounds * FAN_OUT / (time.perf_counter() - started)
+
+
+def main() -> None:
+    ref, fast = JsonCodec(), FastJsonCodec()
+    check_equivalent(ref, fast)
+    print(f"orjson: {'yes' if orjson is not None else 'no (stdlib json fallback)'}")
+    print(f"{'event':<12}{'json frames/s':>16}{'json-fast frames/s':>21}{'speed-up':>10}")
+    for kind, args in CASES.items():
+        slow, quick = rate(ref, kind, args), rate(fast, kind, args)
+        print(f"{kind:<12}{slow:>16,.0f}{quick:>21,.0f}{quick / slow:>9.1f}x")
+    print(f"\nqueue_size fan-out to {FAN_OUT} recipients")
+    print(f"  encode per recipient (json):       {fan_out(ref, True):>14,.0f} frames/s")
+    print(f"  encode once, share (json):         {fan_out(ref, False):>14,.0f} frames/s")
+    print(f"  encode once, share (json-fast):    {fan_out(fast, False):>14,.0f} frames/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Flood protection end to end: what abusive clients cost everyone else.
+
+Starts the app (one uvicorn worker with TunedWebSocketProtocol), pairs two
+honest clients who exchange a message every 250 ms (under the per-type
+limit for `message`), and measures their
+relay latency first alone, then while flooders blast `next`, `join_queue`
+and `message` frames as fast as the socket takes them. Also sends one
+oversized frame and one over-long message text.
+
+Run once with the default limits and once with them effectively disabled
+(`--unlimited`) to see what the limits buy.
+
+    cd backend && python -m benchmarks.bench_flood
+    python -m benchmarks.bench_flood --unlimited
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+import urllib.request
+from typing import Any, Dict, List
+
+import websockets
+
+from benchmarks.load_harness import BASE_PORT, LocalServer
+
+UNLIMITED = {
+    "WS_RATE_LIMIT_PER_SECOND": "1e9", "WS_RATE_LIMIT_BURST": "1000000000",
+    "WS_EVENT_RATE_LIMITS": "{}", "WS_FLOOD_CLOSE_AFTER": "1000000000",
+}
+
+
+async def recv_type(ws, wanted: str, timeout: float = 10.0) -> Dict[str, Any]:
+    while True:
+        evt = json.loads(await asyncio.wait_for(ws.recv(), timeout))
+        if evt["type"] == wanted:
+            return evt
+
+
+async def honest_pair(url: str, seconds: float, tag: str) -> List[float]:
+    """Relay latencies of a message every 250 ms between two paired clients."""
+    async with websockets.connect(url) as a, websockets.connect(url) as b:
+        await a.send(json.dumps({"type": "join_queue", "userId": f"honest-a-{tag}", "avatar": "🦊"}))
+        await b.send(json.dumps({"type": "join_queue", "userId": f"honest-b-{tag}", "avatar": "🐻"}))
+        room = (await recv_type(a, "paired"))["room"]
+        await recv_type(b, "paired")
+        latencies: List[float] = []
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            sent = time.perf_counter()
+            await a.send(json.dumps({"type": "message", "room": room, "text": "hi", "sentAt": 0}))
+            await recv_type(b, "message")
+            latencies.append(time.perf_counter() - sent)
+            await asyncio.sleep(0.25)
+        return latencies
+
+
+async def flooder(url: str, n: int, seconds: float) -> Dict[str, Any]:
+    sent = 0
+    errors = 0
+    closed_with = None
+    closed_after = None
+    async with websockets.connect(url) as ws:
+        await ws.send(json.dumps({"type": "join_queue", "userId": f"flood{n}", "avatar": "🤖"}))
+        frames = [
+            json.dumps({"type": "next"}),
+            json.dumps({"type": "join_queue", "userId": f"flood{n}", "avatar": "🤖"}),
+            json.dumps({"type": "message", "room": "x", "text": "spam" * 50, "sentAt": 0}),
+        ]
+
+        async def drain() -> None:
+            nonlocal errors
+            async for raw in ws:
+                if json.loads(raw)["type"] == "error":
+                    errors += 1
+
+        reader = asyncio.create_task(drain())
+        start = time.monotonic()
+        try:
+            while time.monotonic() < start + seconds:
+                for frame in frames:
+                    await ws.send(frame)
+                    sent += 1
+                await asyncio.sleep(0)
+        except websockets.ConnectionClosed as e:
+            closed_with = e.rcvd.code if e.rcvd else None
+            closed_after = time.monotonic() - start
+        reader.cancel()
+    return {"sent": sent, "errors": errors, "closed_with": closed_with, "closed_after": closed_after}
+
+
+async def oversized(url: str) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    async with websockets.connect(url, max_size=None) as ws:
+        await ws.send(json.dumps({"type": "join_queue", "userId": "big", "avatar": "🐳"}))
+        await ws.send(json.dumps({"type": "message", "room": "x", "text": "a" * 5000, "sentAt": 0}))
+        out["long_text"] = (await recv_type(ws, "error"))["message"]
+        await ws.send("x" * 100_000)
+        try:
+            while True:
+                await asyncio.wait_for(ws.recv(), 5)
+        except websockets.ConnectionClosed as e:
+            out["too_large"] = e.rcvd.code if e.rcvd else None
+    return out
+
+
+def scrape(port: int) -> Dict[str, float]:
+    body = urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics").read().decode()
+    wanted = ("chat_ws_throttled_total", "chat_ws_frames_rejected_total", "chat_ws_flood_closed_total")
+    return {
+        line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1])
+        for line in body.splitlines() if line.startswith(wanted)
+    }
+
+
+async def scenario(url: str, flooders: int, seconds: float) -> Dict[str, Any]:
+    alone = await honest_pair(url, 2.0, "alone")
+    pair = asyncio.create_task(honest_pair(url, seconds, "flooded"))
+    await asyncio.sleep(0.5)
+    floods = await asyncio.gather(*(flooder(url, n, seconds - 1.0) for n in range(flooders)))
+    flooded = await pair
+    return {"alone": alone, "flooded": flooded, "floods": floods, "oversized": await oversized(url)}
+
+
+def pct(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] * 1000
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--flooders", type=int, default=3)
+    parser.add_argument("--seconds", type=float, default=6.0)
+    parser.add_argument("--unlimited", action="store_true", help="disable the rate limits for comparison")
+    args = parser.parse_args()
+
+    with LocalServer(1, UNLIMITED if args.unlimited else {}) as server:
+        r = asyncio.run(scenario(server.urls[0], args.flooders, args.seconds))
+        counters = scrape(BASE_PORT)
+    print(f"limits {'off' if args.unlimited else 'on'}, {args.flooders} flooders for {args.seconds - 1:g}s")
+    for name, lat in (("alone", r["alone"]), ("under flood", r["flooded"])):
+        print(f"honest relay {name:12} p50 {pct(lat, 0.5):7.2f} ms  p99 {pct(lat, 0.99):7.2f} ms  "
+              f"max {max(lat) * 1000:7.2f} ms  ({len(lat)} messages)")
+    for n, f in enumerate(r["floods"]):
+        closed = f"closed with {f['closed_with']} after {f['closed_after']:.2f}s" if f["closed_after"] else "never closed"
+        print(f"flooder {n}: sent {f['sent']:,} frames, got {f['errors']} error frames, {closed}")
+    print(f"5000-char message: {r['oversized'].get('long_text')!r}; 100 KB frame: "
+          f"closed with {r['oversized'].get('too_large')}")
+    for name, value in sorted(counters.items()):
+        print(f"{name} {value:g}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
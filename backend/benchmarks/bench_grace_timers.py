@@ -0,0 +1,126 @@
+"""
+100k pending reconnect-grace deadlines: one task per timer vs the timer wheel.
+
+For each approach it arms N deadlines, cancels half of them (reconnects),
+and lets the rest expire. It reports the time to arm and cancel, the memory
+held while all N are pending (tracemalloc, in a separate run so tracing
+doesn't skew the timings), how long the expiries took from the first one
+firing to the last, and how many expiry callbacks ran.
+
+    cd backend && python -m benchmarks.bench_grace_timers
+    python -m benchmarks.bench_grace_timers --timers 200000 --grace 2
+"""
+import argparse
+import asyncio
+import gc
+import sys
+import time
+import tracemalloc
+from typing import Dict, List
+
+from app.core.timer_wheel import TimerWheel
+
+TICK = 0.1
+
+
+async def bench_tasks(n: int, grace: float, trace: bool) -> Dict[str, float]:
+    """The previous design: asyncio.create_task(sleep(grace)) per disconnect."""
+    fired: List[float] = []
+    calls = 0
+
+    async def delayed(uid: int) -> None:
+        nonlocal calls
+        try:
+            await asyncio.sleep(grace)
+        except asyncio.CancelledError:
+            return
+        calls += 1
+        fired.append(time.perf_counter())
+
+    gc.collect()
+    if trace:
+        tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    t = time.perf_counter()
+    tasks = {uid: asyncio.create_task(delayed(uid)) for uid in range(n)}
+    armed = time.perf_counter() - t
+    await asyncio.sleep(0)  # let every task reach its sleep
+    held = tracemalloc.get_traced_memory()[0] - base
+    if trace:
+        tracemalloc.stop()
+
+    t = time.perf_counter()
+    for uid in range(0, n, 2):
+        tasks[uid].cancel()
+    cancelled = time.perf_counter() - t
+
+    await asyncio.gather(*tasks.values(), return_exceptions=True)
+    return _result(armed, cancelled, held, fired, calls)
+
+
+async def bench_wheel(n: int, grace: float, trace: bool) -> Dict[str, float]:
+    fired: List[float] = []
+    calls = 0
+    done = asyncio.Event()
+
+    async def on_expire(keys: list) -> None:
+        nonlocal calls
+        calls += 1
+        fired.extend(time.perf_counter() for _ in keys)
+        if len(wheel) == 0:
+            done.set()
+
+    gc.collect()
+    if trace:
+        tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    wheel = TimerWheel(TICK, slots=int(grace / TICK) + 1, on_expire=on_expire)
+    t = time.perf_counter()
+    for uid in range(n):
+        wheel.schedule(uid, grace)
+    armed = time.perf_counter() - t
+    held = tracemalloc.get_traced_memory()[0] - base
+    if trace:
+        tracemalloc.stop()
+
+    t = time.perf_counter()
+    for uid in range(0, n, 2):
+        wheel.cancel(uid)
+    cancelled = time.perf_counter() - t
+
+    await done.wait()
+    await wheel.stop()
+    return _result(armed, cancelled, held, fired, calls)
+
+
+def _result(armed: float, cancelled: float, held: int, fired: List[float], calls: int) -> Dict[str, float]:
+    return {
+        "arm_ms": armed * 1000,
+        "cancel_half_ms": cancelled * 1000,
+        "pending_mb": held / 1e6,
+        "expiry_span_ms": (max(fired) - min(fired)) * 1000 if fired else 0.0,
+        "expired": len(fired),
+        "callbacks": calls,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--timers", type=int, default=100_000)
+    parser.add_argument("--grace", type=float, default=1.0, help="seconds until the uncancelled deadlines fire")
+    args = parser.parse_args()
+
+    results = {}
+    for name, bench in (("task per timer", bench_tasks), ("timer wheel", bench_wheel)):
+        results[name] = asyncio.run(bench(args.timers, args.grace, trace=False))
+        results[name]["pending_mb"] = asyncio.run(bench(args.timers, args.grace, trace=True))["pending_mb"]
+    print(f"{args.timers:,} deadlines, half cancelled, {args.grace:g}s grace, {TICK * 1000:.0f} ms wheel tick\n")
+    print(f"{'':<16} {'arm ms':>9} {'cancel ms':>10} {'pending MB':>11} {'expiry span ms':>15} {'expired':>8} {'callbacks':>10}")
+    for name, r in results.items():
+        print(f"{name:<16} {r['arm_ms']:>9.1f} {r['cancel_half_ms']:>10.1f} {r['pending_mb']:>11.1f} "
+              f"{r['expiry_span_ms']:>15.1f} {r['expired']:>8,} {r['callbacks']:>10,}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""
+Heartbeat reaper against a real Matchmaker: who gets reaped, and how fast.
+
+Registers N paired users, each on a stub socket watched by one Heartbeat.
+Clients answer pings, except that some go half-open partway through (they
+stop sending anything), some run an old build that never pongs, and some
+keep chatting so they are never pinged. Reaped sockets go through
+`remove_user(is_disconnect=True)`, so their rooms enter the reconnect
+grace period.
+
+Reports reaped vs expected, false positives, detection delay after the
+last frame, and the time spent in the heartbeat per connection.
+
+    cd backend && python -m benchmarks.bench_heartbeat
+    python -m benchmarks.bench_heartbeat --users 20000 --interval 2 --timeout 1
+"""
+import argparse
+import asyncio
+import logging
+import random
+import sys
+import time
+from typing import Any, Dict, List
+
+from app.core.codec import default_codec
+from app.core.heartbeat import Heartbeat, ZOMBIES_REAPED
+from app.core.matchmaker import Matchmaker
+
+
+class Client:
+    """Stub socket plus the client behind it."""
+
+    codec = default_codec
+
+    def __init__(self, kind: str) -> None:
+        self.kind = kind  # "live", "chatty", "legacy" or "zombie"
+        self.closed = False
+        self.peer = None
+        self.reaped_at = None
+        self.last_frame = time.monotonic()
+        self.pings = 0
+        self.dies_at = float("inf")
+
+    def send(self, payload: Any, kind: str = "") -> None:
+        if kind != "ping" or self.closed:
+            return
+        self.pings += 1
+        if self.kind in ("live", "chatty") or (self.kind == "zombie" and not self.dead):
+            asyncio.get_running_loop().call_later(0.02, self.answer)
+
+    @property
+    def dead(self) -> bool:
+        return self.kind == "zombie" and time.monotonic() >= self.dies_at
+
+    def answer(self) -> None:
+        if not self.closed:
+            self.last_frame = time.monotonic()
+            self.peer.pong()
+
+
+async def run(users: int, interval: float, timeout: float, seconds: float) -> Dict[str, Any]:
+    rng = random.Random(5)
+    mm = Matchmaker()
+    hb = Heartbeat(interval=interval, timeout=timeout, tick=min(0.1, timeout / 4))
+    clients: List[Client] = []
+    started = time.monotonic()
+    for i in range(users):
+        roll = rng.random()
+        kind = "zombie" if roll < 0.05 else "legacy" if roll < 0.15 else "chatty" if roll < 0.35 else "live"
+        c = Client(kind)
+        uid = f"u{i}"
+
+        async def reap(c: Client = c, uid: str = uid) -> None:
+            c.closed = True
+            c.reaped_at = time.monotonic()
+            await mm.remove_user(uid, ws=c)
+
+        c.peer = hb.watch(c, reap)
+        clients.append(c)
+        await mm.register(uid, c, "🐱")
+        await mm.join_queue(uid)
+
+    run_start = time.monotonic()
+    for c in clients:
+        # Zombies answer at least one ping before going silent; until then they look like old builds
+        c.dies_at = run_start + rng.uniform(interval + timeout, seconds)
+
+    # Time spent in the heartbeat's expiry handler (pings, re-arming, reaping)
+    handler = {"seconds": 0.0, "calls": 0}
+    due = hb.wheel.on_expire
+
+    async def timed(peers: List[Any]) -> None:
+        t0 = time.perf_counter()
+        await due(peers)
+        handler["seconds"] += time.perf_counter() - t0
+        handler["calls"] += 1
+
+    hb.wheel.on_expire = timed
+    end = run_start + seconds
+    while time.monotonic() < end:
+        now = time.monotonic()
+        for c in clients:
+            if c.kind == "chatty" and not c.closed:
+                c.last_frame = now
+                c.peer.seen()
+        await asyncio.sleep(0.25)
+    pings_chatty = sum(c.pings for c in clients if c.kind == "chatty")
+    # Give every zombie interval + timeout since its last frame, plus slack for ticks and stalls
+    await asyncio.sleep(interval + timeout + 1.0)
+    await hb.stop()
+    await mm.grace.stop()
+    await mm.typing_timers.stop()
+
+    zombies = [c for c in clients if c.kind == "zombie"]
+    reaped = [c for c in clients if c.reaped_at is not None]
+    delays = sorted(c.reaped_at - c.last_frame for c in zombies if c.reaped_at is not None)
+    in_grace = sum(1 for u in mm.users.values() if u.grace_until is not None)
+    return {
+        "clients": {k: sum(1 for c in clients if c.kind == k) for k in ("live", "chatty", "legacy", "zombie")},
+        "reaped": len(reaped),
+        "zombies": len(zombies),
+        "false_positives": sum(1 for c in reaped if c.kind != "zombie"),
+        "in_grace": in_grace,
+        "pings_chatty": pings_chatty,
+        "delay_p50": delays[len(delays) // 2] if delays else 0.0,
+        "delay_max": delays[-1] if delays else 0.0,
+        "handler_calls": handler["calls"],
+        "handler_us_per_conn_s": handler["seconds"] / users / (time.monotonic() - started) * 1e6,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--interval", type=float, default=1.0)
+    parser.add_argument("--timeout", type=float, default=0.5)
+    parser.add_argument("--seconds", type=float, default=4.0)
+    args = parser.parse_args()
+    logging.getLogger("uvicorn.error").setLevel(logging.ERROR)
+
+    r = asyncio.run(run(args.users, args.interval, args.timeout, args.seconds))
+    print(f"interval {args.interval:g}s, timeout {args.timeout:g}s, {args.seconds:g}s run")
+    print("clients: " + ", ".join(f"{k} {v:,}" for k, v in r["clients"].items()))
+    print(f"reaped {r['reaped']:,} of {r['zombies']:,} half-open; false positives {r['false_positives']}")
+    print(f"rooms in reconnect grace afterwards: {r['in_grace']:,}")
+    print(f"pings sent to chatty clients while they chatted: {r['pings_chatty']}")
+    print(f"reaped after last frame: p50 {r['delay_p50']:.2f}s, max {r['delay_max']:.2f}s "
+          f"(nominal: interval + timeout + tick = {args.interval + args.timeout + 0.1:.2f}s)")
+    print(f"heartbeat handler: {r['handler_calls']} calls, {r['handler_us_per_conn_s']:.2f} µs per connection-second")
+    print(f"chat_ws_zombies_reaped_total: {dict(ZOMBIES_REAPED._values)}")
+    return 0 if r["reaped"] == r["zombies"] and not r["false_positives"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
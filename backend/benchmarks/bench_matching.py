@@ -0,0 +1,168 @@
+"""
+Preference matching: indexed MatchEngine vs scanning the queue, and the fallback bound.
+
+Fills a waiting queue with users whose preferences never overlap (a few
+languages and regions, interests of their own), then times joins with
+mostly narrow preferences against it: a naive FIFO scan that calls
+`compatible()` on each waiting user in order, and `MatchEngine.find()`.
+Both must pick the same partner for every join.
+
+A second, real-time run drives a Matchmaker with narrow preferences that
+never match and checks every user is paired within MATCH_FALLBACK_SECONDS
+plus a wheel tick.
+
+    cd backend && python -m benchmarks.bench_matching
+    python -m benchmarks.bench_matching --waiting 100000 --joins 2000 --fallback 0.5
+"""
+import argparse
+import asyncio
+import logging
+import random
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from app.core.codec import default_codec
+from app.core.match_engine import MatchEngine, Prefs, compatible, parse_prefs
+from app.core.matchmaker import Matchmaker
+from app.settings import settings
+
+LANGUAGES = ["en", "es", "pt", "fr", "de", "it", "ru", "tr", "ja", "ko", "hi", "ar"]
+REGIONS = ["na", "sa", "eu", "af", "me", "as", "oc"]
+
+
+def waiting_prefs(i: int) -> Optional[Prefs]:
+    # Interests of their own, so no two waiting users are compatible and the queue stays long
+    return parse_prefs({
+        "language": LANGUAGES[i % len(LANGUAGES)], "region": REGIONS[i % len(REGIONS)],
+        "interests": [f"topic{i}", f"topic{i}x"],
+    })
+
+
+def joiner_prefs(rng: random.Random, waiting: int) -> Optional[Prefs]:
+    """Mostly narrow; some without interests or without any preferences, who pair at once."""
+    roll = rng.random()
+    if roll < 0.02:
+        return None
+    # Half of them share language and region with someone waiting; interests rarely overlap
+    j = rng.randrange(waiting)
+    if roll < 0.5:
+        raw: Dict[str, Any] = {"language": LANGUAGES[j % len(LANGUAGES)], "region": REGIONS[j % len(REGIONS)]}
+    else:
+        raw = {"language": rng.choice(LANGUAGES), "region": rng.choice(REGIONS)}
+    if roll > 0.05:
+        raw["interests"] = [f"topic{rng.randrange(waiting * 4)}" for _ in range(settings.MATCH_MAX_INTERESTS - 1)]
+        raw["interests"].append(f"topic{j}")
+    return parse_prefs(raw)
+
+
+def scan(queue: List[str], prefs: Dict[str, Optional[Prefs]], want: Optional[Prefs]) -> Optional[str]:
+    for uid in queue:
+        if compatible(want, prefs[uid]):
+            return uid
+    return None
+
+
+def bench_lookup(waiting: int, joins: int) -> Dict[str, Any]:
+    rng = random.Random(11)
+    prefs: Dict[str, Optional[Prefs]] = {}
+    queue: List[str] = []
+    engine = MatchEngine()
+    t0 = time.perf_counter()
+    for i in range(waiting):
+        uid = f"w{i}"
+        prefs[uid] = waiting_prefs(i)
+        queue.append(uid)
+        engine.append(uid, prefs[uid])
+    fill_s = time.perf_counter() - t0
+
+    joiners = [joiner_prefs(rng, waiting) for _ in range(joins)]
+    t0 = time.perf_counter()
+    expected = [scan(queue, prefs, p) for p in joiners]
+    scan_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    found = [engine.find(p) for p in joiners]
+    find_s = time.perf_counter() - t0
+
+    # Pairing removes the partner: both sides again, with the queue shrinking
+    t0 = time.perf_counter()
+    for j, p in enumerate(joiners):
+        uid = engine.find(p)
+        if uid is not None:
+            engine.discard(uid)
+        else:
+            engine.append(f"j{j}", p)
+    churn_s = time.perf_counter() - t0
+    return {
+        "waiting": waiting, "joins": joins, "fill_s": fill_s,
+        "scan_us": scan_s / joins * 1e6, "find_us": find_s / joins * 1e6, "churn_us": churn_s / joins * 1e6,
+        "matched": sum(1 for uid in expected if uid is not None), "same": found == expected,
+    }
+
+
+class Client:
+    codec = default_codec
+    closed = False
+
+    def __init__(self) -> None:
+        self.joined_at = time.monotonic()
+        self.paired_at: Optional[float] = None
+
+    def send(self, payload: Any, kind: str = "") -> None:
+        if kind == "paired":
+            self.paired_at = time.monotonic()
+
+
+async def bench_fallback(users: int, fallback: float) -> Dict[str, Any]:
+    settings.MATCH_FALLBACK_SECONDS = fallback
+    mm = Matchmaker()
+    clients: List[Client] = []
+    # Everyone speaks a different language; joins are spread over two fallback periods
+    for i in range(users):
+        c = Client()
+        clients.append(c)
+        await mm.register(f"f{i}", c, "🐱")
+        await mm.join_queue(f"f{i}", {"language": f"lang{i}"})
+        await asyncio.sleep(2 * fallback / users)
+    deadline = time.monotonic() + 3 * fallback
+    while len(mm.waiting) > 1 and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    waits = sorted(c.paired_at - c.joined_at for c in clients if c.paired_at is not None)
+    tick = mm.match_fallback.tick
+    await mm.match_fallback.stop()
+    await mm.grace.stop()
+    await mm.typing_timers.stop()
+    return {
+        "users": users, "paired": len(waits), "left_waiting": len(mm.waiting), "tick": tick,
+        "wait_p50": waits[len(waits) // 2] if waits else 0.0, "wait_max": waits[-1] if waits else 0.0,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--waiting", type=int, default=50_000)
+    parser.add_argument("--joins", type=int, default=200)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--fallback", type=float, default=1.0)
+    args = parser.parse_args()
+    logging.getLogger("uvicorn.error").setLevel(logging.WARNING)
+
+    r = bench_lookup(args.waiting, args.joins)
+    print(f"{r['waiting']:,} waiting with disjoint preferences (filed in {r['fill_s']:.2f}s), {r['joins']:,} joins, "
+          f"{r['matched']:,} find a partner")
+    print(f"FIFO scan with compatible()  {r['scan_us']:10.1f} µs/join")
+    print(f"MatchEngine.find             {r['find_us']:10.1f} µs/join  ({r['scan_us'] / r['find_us']:,.0f}x)")
+    print(f"find + discard/append        {r['churn_us']:10.1f} µs/join")
+    print("same partners as the scan" if r["same"] else "MISMATCH with the scan")
+
+    f = asyncio.run(bench_fallback(args.users, args.fallback))
+    bound = args.fallback + f["tick"]
+    print(f"fallback {args.fallback:g}s, no compatible pairs: {f['paired']}/{f['users']} paired "
+          f"({f['left_waiting']} left waiting), wait p50 {f['wait_p50']:.2f}s, max {f['wait_max']:.2f}s "
+          f"(bound: fallback + tick = {bound:.2f}s)")
+    ok = f["left_waiting"] <= 1 and f["wait_max"] <= bound + 0.05
+    return 0 if r["same"] and ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
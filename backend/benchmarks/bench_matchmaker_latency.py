@@ -0,0 +1,84 @@
+"""
+join_queue / handle_next latency under growing concurrency.
+
+USERS connected users sit in rooms while ACTIVE clients concurrently run
+join → paired → next → ... against an in-process Matchmaker. Sockets are
+fakes whose send_text takes SEND_DELAY seconds, standing in for a real
+network write, so any socket I/O performed while a matchmaker lock is held
+shows up directly as queueing latency for everybody else.
+
+    cd backend && python -m benchmarks.bench_matchmaker_latency
+"""
+import asyncio
+import logging
+import statistics
+import time
+
+from app.core.matchmaker import Matchmaker
+from app.core.outbound import Outbound
+
+USERS = (1_000, 10_000, 50_000)
+ACTIVE = 200
+ROUNDS = 20
+SEND_DELAY = 0.001
+
+
+class FakeSocket:
+    async def send_text(self, text: str) -> None:
+        await asyncio.sleep(SEND_DELAY)
+
+
+def connect() -> Outbound:
+    conn = Outbound(FakeSocket())
+    conn.start()
+    return conn
+
+
+def pct(samples: list[float], q: float) -> float:
+    return statistics.quantiles(samples, n=100)[q - 1] * 1000
+
+
+async def run(users: int) -> tuple[list[float], list[float]]:
+    mm = Matchmaker()
+    joins: list[float] = []
+    nexts: list[float] = []
+
+    for i in range(users):
+        await mm.register(f"idle{i}", connect(), "🐶")
+        await mm.join_queue(f"idle{i}")
+    await asyncio.sleep(0.5)
+
+    async def client(i: int) -> None:
+        uid = f"u{i}"
+        await mm.register(uid, connect(), "🐱")
+        started = time.perf_counter()
+        await mm.join_queue(uid)
+        joins.append(time.perf_counter() - started)
+        for _ in range(ROUNDS):
+            await asyncio.sleep(0)
+            user = mm.users.get(uid)
+            if not user or user.room is None:
+                continue
+            started = time.perf_counter()
+            await mm.handle_next(uid)
+            nexts.append(time.perf_counter() - started)
+
+    await asyncio.gather(*[client(i) for i in range(ACTIVE)])
+    for user in list(mm.users.values()):
+        await user.ws.close()
+    return joins, nexts
+
+
+async def main() -> None:
+    logging.getLogger("uvicorn.error").setLevel(logging.WARNING)
+    print(f"{'users':>7}  {'join p50 ms':>11}  {'join p99 ms':>11}  {'next p50 ms':>11}  {'next p99 ms':>11}")
+    for users in USERS:
+        joins, nexts = await run(users)
+        print(
+            f"{users:>7}  {pct(joins, 50):>11.2f}  {pct(joins, 99):>11.2f}"
+            f"  {pct(nexts, 50):>11.2f}  {pct(nexts, 99):>11.2f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
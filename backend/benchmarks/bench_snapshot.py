@@ -0,0 +1,120 @@
+"""
+Matchmaker snapshot write and restore times, i.e. the restart cost a deploy adds.
+
+Fills a Matchmaker with paired rooms and a waiting queue, drains it, and
+times the shutdown side (building and writing the snapshot) and the startup
+side (reading and restoring it into a fresh Matchmaker). The restored state
+is then checked: every user gets their room back through `handle_reconnect`,
+and waiting users resume their wait.
+
+    cd backend && python -m benchmarks.bench_snapshot
+    python -m benchmarks.bench_snapshot --rooms 200000 --waiting 20000 --path /dev/shm/mm.snapshot
+"""
+import argparse
+import asyncio
+import gc
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict
+
+from app.core import snapshot
+from app.core.codec import default_codec
+from app.core.matchmaker import Matchmaker
+
+
+class Sink:
+    codec = default_codec
+    closed = False
+
+    def send(self, payload, kind: str = "") -> None:
+        pass
+
+
+def user_id(rng: random.Random) -> str:
+    # Same shape as the app's persistent ids: base36 millis + 8 random base36 chars
+    return f"{rng.randrange(36 ** 8):x}-{rng.randrange(36 ** 8):x}"
+
+
+async def fill(mm: Matchmaker, rooms: int, waiting: int, rng: random.Random) -> None:
+    sink = Sink()
+    for _ in range(rooms * 2):
+        uid = user_id(rng)
+        await mm.register(uid, sink, rng.choice("😎🤖🦊🐼🐸🦄🐯🐙🐶🐱🐵🐧🐢🐳🐝"))
+        await mm.join_queue(uid)
+    # Queued directly, so they stay waiting instead of pairing up
+    for _ in range(waiting):
+        uid = user_id(rng)
+        await mm.register(uid, sink, "🐱")
+        mm.waiting.append(uid)
+        mm.users[uid].queued_at = time.monotonic() - rng.uniform(0, 20)
+    await mm.drain()
+
+
+async def run(rooms: int, waiting: int, path: str) -> Dict[str, float]:
+    rng = random.Random(3)
+    old = Matchmaker()
+    await fill(old, rooms, waiting, rng)
+    expected_rooms = {r.id: (r.u1.id, r.u2.id) for r in old.rooms.values()}
+    expected_waiting = list(old.waiting)
+
+    # The two halves of a deploy, as Matchmaker.stop() and start() run them
+    t0 = time.perf_counter()
+    old.save_snapshot(path)
+    t1 = time.perf_counter()
+    size = os.path.getsize(path)
+    await old.grace.stop()
+    del old
+    gc.collect()
+
+    new = Matchmaker()
+    t2 = time.perf_counter()
+    new.load_snapshot(path)
+    t3 = time.perf_counter()
+
+    # Every member reconnects to their own room; waiting users resume their wait
+    ok_rooms = all(
+        new.rooms[rid].u1.id == a and new.rooms[rid].u2.id == b for rid, (a, b) in expected_rooms.items()
+    )
+    sink = Sink()
+    sample = rng.sample(sorted(expected_rooms), min(1000, len(expected_rooms)))
+    reconnected = 0
+    for rid in sample:
+        a, _ = expected_rooms[rid]
+        reconnected += await new.handle_reconnect(a, sink)
+    ok_waiting = list(new.rejoin) == expected_waiting
+    await new.grace.stop()
+    await new.typing_timers.stop()
+    return {
+        "rooms": len(expected_rooms), "waiting": len(expected_waiting), "bytes": size,
+        "save_ms": (t1 - t0) * 1000, "load_ms": (t3 - t2) * 1000,
+        "restored_rooms": len(new.rooms), "restored_waiting": len(new.rejoin),
+        "ok": ok_rooms and ok_waiting and reconnected == len(sample) and not os.path.exists(path),
+        "reconnected": reconnected, "sampled": len(sample),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rooms", type=int, default=100_000)
+    parser.add_argument("--waiting", type=int, default=10_000)
+    parser.add_argument("--path", default=os.path.join(tempfile.gettempdir(), "bench-matchmaker.snapshot"))
+    args = parser.parse_args()
+    logging.getLogger("uvicorn.error").setLevel(logging.WARNING)
+
+    r = asyncio.run(run(args.rooms, args.waiting, args.path))
+    print(f"{r['rooms']:,} rooms, {r['waiting']:,} waiting → {r['bytes'] / 1e6:.1f} MB "
+          f"({r['bytes'] / (2 * r['rooms'] + r['waiting']):.0f} B/user), orjson={'yes' if snapshot.orjson else 'no'}")
+    print(f"shutdown: snapshot + write + fsync  {r['save_ms']:7.1f} ms")
+    print(f"startup:  read + parse + restore    {r['load_ms']:7.1f} ms")
+    print(f"restored {r['restored_rooms']:,} rooms, {r['restored_waiting']:,} waiting; "
+          f"reconnected {r['reconnected']}/{r['sampled']} sampled users to their room")
+    print("ok" if r["ok"] else "MISMATCH")
+    return 0 if r["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
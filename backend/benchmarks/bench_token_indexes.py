@@ -0,0 +1,148 @@
+"""
+push_tokens hot queries at 1M rows, before and after the index migration.
+
+Builds push_tokens without secondary indexes, fills it with synthetic rows
+(99% of tokens inside the push cooldown, 0.5% never notified, opens over 30
+days, sign-ups over a year), then runs the real database functions and
+prints each one's median time and query plan. It then applies the pending
+migrations (app/db/migrations.py) and repeats.
+
+    cd backend && python -m benchmarks.bench_token_indexes            # temp SQLite file
+    python -m benchmarks.bench_token_indexes --rows 200000
+    python -m benchmarks.bench_token_indexes --url postgresql://...   # DROPS push_tokens there
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Tuple
+
+RUNS = 5
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--url", help="database to use; its push_tokens/daily_stats/schema_migrations are dropped")
+    args = parser.parse_args()
+
+    url = args.url or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    # The app reads DATABASE_URL at import time
+    os.environ["DATABASE_URL"] = url
+
+    from sqlalchemy import event, insert, text
+
+    from app.db import database, migrations
+
+    engine = database.engine
+    is_pg = engine.dialect.name == "postgresql"
+
+    with engine.begin() as conn:
+        for table in ("schema_migrations", "daily_stats", "push_tokens"):
+            conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+    database.metadata.create_all(engine)
+    for index in database.PUSH_TOKEN_INDEXES:
+        index.drop(engine, checkfirst=True)
+
+    now = datetime.now(timezone.utc)
+    started = time.perf_counter()
+    populate(engine, database.push_tokens, insert, args.rows, now)
+    print(f"inserted {args.rows:,} rows in {time.perf_counter() - started:.1f}s ({engine.dialect.name})\n")
+
+    mid_created = now - timedelta(days=180)
+    queries: Dict[str, Callable[[], object]] = {
+        "list by user_id": lambda: database.list_tokens(100, user_id="u4242"),
+        "list active in last 10 min": lambda: database.list_tokens(100, active_since=now - timedelta(minutes=10)),
+        "list never sent": lambda: database.list_tokens(100, never_sent=True),
+        "created_at keyset page": lambda: database.list_tokens(100, (mid_created, "t"), "created_at"),
+        "stats (single pass)": database.get_token_stats,
+    }
+
+    # Capture the SQL each function sends so it can be EXPLAINed as-is
+    captured: List[Tuple[str, object]] = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    def analyze() -> None:
+        with engine.begin() as conn:
+            conn.execute(text("ANALYZE push_tokens" if is_pg else "ANALYZE"))
+
+    def measure(label: str) -> Dict[str, float]:
+        print(f"── {label} " + "─" * (60 - len(label)))
+        timings: Dict[str, float] = {}
+        for name, fn in queries.items():
+            captured.clear()
+            fn()
+            statement, params = captured[-1]
+            samples = []
+            for _ in range(RUNS):
+                t = time.perf_counter()
+                fn()
+                samples.append(time.perf_counter() - t)
+            timings[name] = statistics.median(samples) * 1000
+            print(f"{name:<36} {timings[name]:>10.2f} ms")
+            for line in explain(engine, is_pg, statement, params):
+                print(f"    {line}")
+        print()
+        return timings
+
+    analyze()
+    before = measure("before: primary key only")
+
+    started = time.perf_counter()
+    migrations.upgrade(engine)
+    print(f"migrations applied in {time.perf_counter() - started:.1f}s\n")
+    analyze()
+    after = measure("after: migration indexes")
+
+    print(f"{'query':<36} {'before ms':>10} {'after ms':>10} {'speed-up':>9}")
+    for name in queries:
+        print(f"{name:<36} {before[name]:>10.2f} {after[name]:>10.2f} {before[name] / after[name]:>8.1f}x")
+    return 0
+
+
+def populate(engine, table, insert, rows: int, now: datetime) -> None:
+    rng = random.Random(1)
+    chunk: List[dict] = []
+    with engine.begin() as conn:
+        for i in range(rows):
+            roll = rng.random()
+            if roll < 0.005:
+                last_sent = None
+            elif roll < 0.01:
+                last_sent = now - timedelta(hours=rng.uniform(1, 48))
+            else:
+                last_sent = now - timedelta(minutes=rng.uniform(0, 29))
+            chunk.append({
+                "token": f"ExponentPushToken[{i:08x}]",
+                "user_id": f"u{i}",
+                "device_name": None,
+                "push_count": 1,
+                "app_opens_total": rng.randint(1, 50),
+                "app_opens_today": rng.randint(0, 3),
+                "last_opened_at": now - timedelta(minutes=rng.uniform(0, 30 * 24 * 60)),
+                "last_sent_at": last_sent,
+                "created_at": now - timedelta(minutes=rng.uniform(0, 365 * 24 * 60)),
+            })
+            if len(chunk) == 50_000:
+                conn.execute(insert(table), chunk)
+                chunk.clear()
+        if chunk:
+            conn.execute(insert(table), chunk)
+
+
+def explain(engine, is_pg: bool, statement: str, params) -> List[str]:
+    prefix = "EXPLAIN (ANALYZE, COSTS OFF) " if is_pg else "EXPLAIN QUERY PLAN "
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(prefix + statement, params).fetchall()
+    return [str(r[0]) if is_pg else str(r[-1]) for r in rows]
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+"""
+Typing frames forwarded by the matchmaker vs typing frames sent by clients.
+
+Replays a typing trace through a real Matchmaker in real time and counts
+the typing frames that reach partners. The baseline is the old relay, which
+forwarded every frame to a connected partner. The trace covers concurrent
+conversations in which the two users take turns typing. Some turns are
+abandoned without a final isTyping=false, and in some conversations the
+listener drops into a reconnect grace period. Two client models are
+synthesized:
+
+- keystroke: isTyping=true on every keystroke (web-style clients)
+- mobile: what mobile/src does, true after a 180 ms pause in typing and
+  false on send
+
+It also reports indicator coverage. That is the share of time a user is
+actively typing (a keystroke in the last second) during which the
+partner's app shows the indicator. The app hides it 2 s after the last
+true, so forwarding only transitions would lose coverage.
+
+    cd backend && python -m benchmarks.bench_typing
+    python -m benchmarks.bench_typing --save trace.jsonl      # keep the synthesized trace
+    python -m benchmarks.bench_typing --trace trace.jsonl     # replay a recorded one
+
+Trace lines: {"t": seconds, "conv": n, "user": 0|1, "type": "typing"|"key"|"drop", "isTyping": bool}.
+"key" marks a keystroke (used for coverage only); "drop" disconnects `user`.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple
+
+from app.core.codec import default_codec
+from app.core.matchmaker import Matchmaker
+from app.settings import settings
+
+APP_INDICATOR_TIMEOUT = 2.0  # mobile/src/state/ChatContext.tsx clears the dots after this
+ACTIVE_WINDOW = 1.0
+
+
+class Recorder:
+    """Stub socket that keeps the typing frames it is sent, with their time."""
+
+    codec = default_codec
+
+    def __init__(self) -> None:
+        self.typing: List[Tuple[float, bool]] = []
+
+    def send(self, payload: Any, kind: str = "") -> None:
+        if kind == "typing":
+            self.typing.append((time.monotonic(), json.loads(payload)["isTyping"]))
+
+
+def synthesize(model: str, conversations: int, seconds: float, rng: random.Random) -> List[Dict[str, Any]]:
+    events: List[Dict[str, Any]] = []
+    for conv in range(conversations):
+        t = rng.uniform(0, 1)
+        typer = rng.randrange(2)
+        drop_at = rng.uniform(seconds * 0.3, seconds) if rng.random() < 0.1 else None
+        if drop_at is not None:
+            events.append({"t": drop_at, "conv": conv, "user": 1 - typer, "type": "drop"})
+        while t < seconds:
+            keys = []
+            for _ in range(rng.randint(5, 60)):
+                t += rng.lognormvariate(-2.0, 0.5)  # ~140 ms between keys
+                if rng.random() < 0.05:
+                    t += rng.uniform(0.5, 2.5)  # thinking pause
+                keys.append(t)
+            abandoned = rng.random() < 0.15
+            for k in keys:
+                events.append({"t": k, "conv": conv, "user": typer, "type": "key"})
+            if model == "keystroke":
+                events += [{"t": k, "conv": conv, "user": typer, "type": "typing", "isTyping": True} for k in keys]
+            else:
+                # Trailing 180 ms debounce: fires once the user pauses
+                for k, nxt in zip(keys, keys[1:] + [float("inf")]):
+                    if nxt - k > 0.18:
+                        events.append({"t": k + 0.18, "conv": conv, "user": typer, "type": "typing", "isTyping": True})
+            if not abandoned:
+                events.append({"t": t + 0.05, "conv": conv, "user": typer, "type": "typing", "isTyping": False})
+            t += rng.uniform(0.5, 3.0)
+            typer = 1 - typer
+    events.sort(key=lambda e: e["t"])
+    return events
+
+
+async def replay(events: List[Dict[str, Any]]) -> Dict[str, float]:
+    mm = Matchmaker()
+    conversations = max(e["conv"] for e in events) + 1
+    sockets: Dict[Tuple[int, int], Recorder] = {}
+    rooms: Dict[int, str] = {}
+    for conv in range(conversations):
+        for user in (0, 1):
+            sockets[conv, user] = Recorder()
+            await mm.register(f"c{conv}u{user}", sockets[conv, user], "🐱")
+            await mm.join_queue(f"c{conv}u{user}")
+        rooms[conv] = mm.users[f"c{conv}u0"].room.id
+
+    dropped = set()
+    # What the old relay delivered: every frame, to a partner that is still connected
+    old_relay: Dict[Tuple[int, int], List[Tuple[float, bool]]] = defaultdict(list)
+    client_frames = 0
+    started = time.monotonic()
+    for e in events:
+        delay = started + e["t"] - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        conv, user = e["conv"], e["user"]
+        if e["type"] == "drop":
+            dropped.add((conv, user))
+            await mm.remove_user(f"c{conv}u{user}")
+        elif e["type"] == "typing":
+            client_frames += 1
+            if (conv, 1 - user) not in dropped:
+                old_relay[conv, 1 - user].append((e["t"], e["isTyping"]))
+            await mm.relay_typing(f"c{conv}u{user}", rooms[conv], e["isTyping"])
+    # Let pending isTyping=true states expire
+    await asyncio.sleep(settings.TYPING_TIMEOUT_MS / 1000 + 0.5)
+    await mm.grace.stop()
+    await mm.typing_timers.stop()
+
+    coalesced = {k: [(at - started, on) for at, on in s.typing] for k, s in sockets.items()}
+    return {
+        "client_frames": client_frames,
+        "old_relay": sum(len(v) for v in old_relay.values()),
+        "coalesced": sum(len(v) for v in coalesced.values()),
+        "old_coverage": coverage(events, old_relay, dropped),
+        "coverage": coverage(events, coalesced, dropped),
+    }
+
+
+def coverage(events: List[Dict[str, Any]], received: Dict[Tuple[int, int], List[Tuple[float, bool]]],
+             dropped: set) -> float:
+    """Share of 50 ms samples with a recent keystroke in which the listener's app shows the indicator."""
+    keys: Dict[Tuple[int, int], List[float]] = defaultdict(list)
+    for e in events:
+        if e["type"] == "key":
+            keys[e["conv"], e["user"]].append(e["t"])
+    end = events[-1]["t"]
+    covered = active = 0
+    for (conv, user), stamps in keys.items():
+        listener = (conv, 1 - user)
+        if listener in dropped:
+            continue
+        frames = received.get(listener, [])
+        i = j = 0
+        shown_until = 0.0
+        t = 0.0
+        while t < end:
+            while i < len(stamps) and stamps[i] <= t:
+                i += 1
+            while j < len(frames) and frames[j][0] <= t:
+                at, on = frames[j]
+                shown_until = at + APP_INDICATOR_TIMEOUT if on else 0.0
+                j += 1
+            if i and t - stamps[i - 1] < ACTIVE_WINDOW:
+                active += 1
+                covered += t < shown_until
+            t += 0.05
+    return covered / active if active else 0.0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--trace", help="replay this JSONL trace instead of synthesizing one")
+    parser.add_argument("--save", help="write the synthesized keystroke trace here")
+    args = parser.parse_args()
+    logging.getLogger("uvicorn.error").setLevel(logging.WARNING)
+
+    traces: Dict[str, List[Dict[str, Any]]] = {}
+    if args.trace:
+        with open(args.trace) as f:
+            traces["recorded"] = [json.loads(line) for line in f if line.strip()]
+    else:
+        for model in ("keystroke", "mobile"):
+            traces[model] = synthesize(model, args.conversations, args.seconds, random.Random(11))
+        if args.save:
+            with open(args.save, "w") as f:
+                f.writelines(json.dumps(e) + "\n" for e in traces["keystroke"])
+
+    print(f"refresh {settings.TYPING_REFRESH_MS} ms, timeout {settings.TYPING_TIMEOUT_MS} ms\n")
+    print(f"{'':<10} {'client':>8} {'frames to partners':>27} {'indicator coverage':>22}")
+    print(f"{'trace':<10} {'frames':>8} {'old relay':>10} {'coalesced':>10} {'cut':>6} {'old relay':>10} {'coalesced':>10}")
+    for name, events in traces.items():
+        r = asyncio.run(replay(events))
+        cut = 1 - r["coalesced"] / r["old_relay"] if r["old_relay"] else 0.0
+        print(f"{name:<10} {r['client_frames']:>8,} {r['old_relay']:>10,} {r['coalesced']:>10,} {cut:>6.1%} "
+              f"{r['old_coverage']:>10.1%} {r['coverage']:>10.1%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+Matchmaker memory per connected user at 100k connections.
+
+Registers N users on a stub socket and queues them all, so they end up
+paired into N/2 rooms. tracemalloc measures everything the matchmaker
+allocates for them: user and room records, ids, indexes and the waiting
+queue. The stub sockets are built before tracing starts, so they are not
+counted. Only the public Matchmaker API is used, which means the same
+script also runs against older trees for a before/after comparison.
+
+    cd backend && python -m benchmarks.bench_user_memory
+    python -m benchmarks.bench_user_memory --users 200000
+"""
+import argparse
+import asyncio
+import gc
+import logging
+import sys
+import tracemalloc
+
+from app.core.codec import default_codec
+from app.core.matchmaker import Matchmaker
+
+
+class StubSocket:
+    __slots__ = ()
+    codec = default_codec
+
+    def send(self, payload, kind: str = "") -> None:
+        pass
+
+
+async def measure(users: int) -> None:
+    mm = Matchmaker()
+    mm.queue_size.mark_dirty = lambda: None  # no fan-out task; only the records are of interest
+    # Ids arrive from the client, so they exist whatever the record layout
+    ids = [f"user-{i:08d}" for i in range(users)]
+    sockets = [StubSocket() for _ in range(users)]
+
+    gc.collect()
+    tracemalloc.start()
+    for uid, ws in zip(ids, sockets):
+        await mm.register(uid, ws, "🐱")
+    registered = tracemalloc.get_traced_memory()[0]
+    for uid in ids:
+        await mm.join_queue(uid)
+    gc.collect()
+    paired = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f"{users:,} users, {len(mm.rooms):,} rooms, {len(mm.waiting)} waiting\n")
+    print(f"{'state':<28} {'total MB':>9} {'bytes/user':>11}")
+    print(f"{'registered, not queued':<28} {registered / 1e6:>9.1f} {registered / users:>11.0f}")
+    print(f"{'all paired into rooms':<28} {paired / 1e6:>9.1f} {paired / users:>11.0f}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=100_000)
+    args = parser.parse_args()
+    logging.getLogger("uvicorn.error").setLevel(logging.WARNING)
+    asyncio.run(measure(args.users))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
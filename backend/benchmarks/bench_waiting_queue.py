@@ -0,0 +1,56 @@
+"""
+Join/leave churn on the waiting queue: the old deque vs WaitingQueue.
+
+Each round removes a random waiting user (a leave/disconnect) and enqueues a
+new one, after an idempotent "is already waiting?" check — the exact access
+pattern of remove_user + join_queue.
+
+    cd backend && python -m benchmarks.bench_waiting_queue
+"""
+import random
+import time
+from collections import deque
+
+from app.core.waiting_queue import WaitingQueue
+
+SIZES = (10_000, 100_000)
+OPS = 2_000
+
+
+def churn_deque(size: int, victims: list[str]) -> float:
+    q: deque[str] = deque(f"u{i}" for i in range(size))
+    started = time.perf_counter()
+    for n, victim in enumerate(victims):
+        try:
+            q.remove(victim)
+        except ValueError:
+            pass
+        new = f"n{n}"
+        if new not in q:
+            q.append(new)
+    return time.perf_counter() - started
+
+
+def churn_indexed(size: int, victims: list[str]) -> float:
+    q = WaitingQueue()
+    for i in range(size):
+        q.append(f"u{i}")
+    started = time.perf_counter()
+    for n, victim in enumerate(victims):
+        q.discard(victim)
+        q.append(f"n{n}")
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    rng = random.Random(42)
+    print(f"{'waiting':>9}  {'deque µs/op':>12}  {'indexed µs/op':>14}  {'speedup':>8}")
+    for size in SIZES:
+        victims = [f"u{rng.randrange(size)}" for _ in range(OPS)]
+        old = churn_deque(size, victims) / OPS * 1e6
+        new = churn_indexed(size, victims) / OPS * 1e6
+        print(f"{size:>9}  {old:>12.2f}  {new:>14.3f}  {old / new:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Bytes on the wire and CPU per frame for each /ws encoding and deflate setting.
+
+Replays the frames one client exchanges over a few chat sessions: queue_size
+updates while waiting, paired, a conversation with typing on/off around
+each partner message, then the partner leaving. Each configuration gets its
+own deflate context, as a connection would. It reports:
+
+- out: server frames. The average size on the wire (payload plus frame
+  header) and µs per frame to encode and compress.
+- in: client message/typing frames. The average size on the wire (client
+  frames are masked) and µs per frame to decompress and decode.
+- zlib KB: memory a connection's deflate context holds (tracemalloc).
+
+    cd backend && python -m benchmarks.bench_wire_formats
+"""
+import gc
+import json
+import random
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional, Tuple
+
+from websockets.extensions.permessage_deflate import PerMessageDeflate
+from websockets.frames import BINARY, TEXT, Frame
+
+from app.core.codec import CODECS, msgpack
+from app.core.ws_protocol import SmallFrameDeflate
+
+SESSIONS = 200
+ROUNDS = 5
+ROOM = "3f2a9c1be0d44c7a9b8e6f1d2c3b4a59"
+WORDS = (
+    "hi hey hello how are you doing today where from lol ok yeah nice cool what do like music "
+    "movies games sure really no way haha same here that's awesome wait why me too good night"
+).split()
+
+# (label, codec name, deflate as (window bits, memLevel, min bytes) or None)
+CONFIGS: List[Tuple[str, str, Optional[Tuple[int, int, int]]]] = [
+    ("json", "json-fast", None),
+    ("json + deflate 15/8", "json-fast", (15, 8, 0)),  # websockets' defaults
+    ("json + deflate 12/5", "json-fast", (12, 5, 0)),  # uvicorn's
+    ("json + deflate 10/3", "json-fast", (10, 3, 0)),  # ours
+    ("json + deflate 10/3 ≥80B", "json-fast", (10, 3, 80)),
+    ("msgpack", "msgpack", None),
+    ("msgpack + deflate 12/5", "msgpack", (12, 5, 0)),
+    ("msgpack + deflate 10/3", "msgpack", (10, 3, 0)),
+    ("msgpack + deflate 10/3 ≥80B", "msgpack", (10, 3, 80)),
+]
+
+def conversation(rng: random.Random) -> Tuple[List[Tuple[str, tuple]], List[Dict[str, Any]]]:
+    """Server events (kind, args) one client receives, and the frames it sends."""
+    out: List[Tuple[str, tuple]] = []
+    inbound: List[Dict[str, Any]] = []
+    now = 1_700_000_000_000
+    for _ in range(SESSIONS):
+        for _ in range(rng.randint(1, 6)):
+            out.append(("queue_size", (rng.randint(80, 400),)))
+        out.append(("paired", (ROOM, f"user-{rng.randrange(10**6)}", "🦊", now)))
+        for _ in range(rng.randint(4, 30)):
+            text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 12)))
+            now += rng.randint(500, 8000)
+            if rng.random() < 0.5:
+                # Partner types, then the message arrives
+                out += [("typing", (ROOM, True)), ("typing", (ROOM, False)), ("message", (ROOM, text, now))]
+            else:
+                inbound += [
+                    {"type": "typing", "room": ROOM, "isTyping": True},
+                    {"type": "typing", "room": ROOM, "isTyping": False},
+                    {"type": "message", "room": ROOM, "text": text, "sentAt": now},
+                ]
+                out.append(("message", (ROOM, text, now)))  # our own message, echoed back
+        out.append(("system", ("idle", "Partner left.")))
+    return out, inbound
+
+
+def encode_client_frame(codec_name: str, frame: Dict[str, Any]) -> Tuple[int, bytes]:
+    """What a client on this encoding puts in the frame."""
+    if codec_name == "msgpack":
+        if frame["type"] == "message":
+            return BINARY, msgpack.packb([2, frame["room"], frame["text"], frame["sentAt"]])
+        return BINARY, msgpack.packb([3, frame["room"], frame["isTyping"]])
+    return TEXT, json.dumps(frame, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def header_size(length: int, masked: bool) -> int:
+    size = 2 if length < 126 else 4 if length < 65536 else 10
+    return size + (4 if masked else 0)
+
+
+def run(codec_name: str, deflate: Optional[Tuple[int, int, int]],
+        out_events: List[Tuple[str, tuple]], inbound: List[Dict[str, Any]]) -> Dict[str, float]:
+    codec = CODECS[codec_name]
+    server: Optional[PerMessageDeflate] = None
+    client: Optional[PerMessageDeflate] = None
+    zlib_bytes = 0
+    if deflate is not None:
+        bits, mem_level, min_bytes = deflate
+        client = PerMessageDeflate(False, False, bits, bits, {"memLevel": mem_level})
+        probe = client.encode(Frame(TEXT, b"x" * 100))
+        gc.collect()
+        tracemalloc.start()
+        # The server's contexts: a compressor for what it sends, a decompressor for what it receives
+        server = SmallFrameDeflate(False, False, bits, bits, {"memLevel": mem_level})
+        server.encode(Frame(TEXT, b"x" * 100))
+        server.decode(probe)
+        zlib_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        client = PerMessageDeflate(False, False, bits, bits, {"memLevel": mem_level})
+        server = SmallFrameDeflate(False, False, bits, bits, {"memLevel": mem_level}, min_bytes=min_bytes)
+
+    # Outbound: encode + compress
+    out_bytes = 0
+    started = time.perf_counter()
+    for kind, args in out_events:
+        payload = codec.encode(kind, *args)
+        data = payload.encode() if isinstance(payload, str) else payload
+        frame = Frame(TEXT if isinstance(payload, str) else BINARY, data)
+        if server is not None:
+            frame = server.encode(frame)
+        out_bytes += len(frame.data) + header_size(len(frame.data), masked=False)
+    out_time = time.perf_counter() - started
+
+    # Inbound: the client compresses (not timed), the server decompresses + decodes
+    frames = []
+    for f in inbound:
+        opcode, data = encode_client_frame(codec_name, f)
+        frame = Frame(opcode, data)
+        if client is not None:
+            frame = client.encode(frame)
+        frames.append(frame)
+    in_bytes = sum(len(f.data) + header_size(len(f.data), masked=True) for f in frames)
+    started = time.perf_counter()
+    for frame in frames:
+        if server is not None:
+            frame = server.decode(frame)
+        raw = frame.data.decode() if frame.opcode == TEXT else bytes(frame.data)
+        codec.decode(raw)
+    in_time = time.perf_counter() - started
+
+    return {
+        "out_bytes": out_bytes / len(out_events),
+        "out_us": out_time / len(out_events) * 1e6,
+        "in_bytes": in_bytes / len(frames),
+        "in_us": in_time / len(frames) * 1e6,
+        "zlib_kb": zlib_bytes / 1024,
+    }
+
+
+def main() -> int:
+    if msgpack is None:
+        print("msgpack is not installed; skipping the msgpack rows")
+    out_events, inbound = conversation(random.Random(3))
+    print(f"{len(out_events):,} server frames, {len(inbound):,} client frames per configuration "
+          f"(best of {ROUNDS})\n")
+    print(f"{'':<30} {'out B/frame':>11} {'out µs':>7} {'in B/frame':>10} {'in µs':>6} {'zlib KB':>8}")
+    for label, codec_name, deflate in CONFIGS:
+        if codec_name not in CODECS:
+            continue
+        runs = [run(codec_name, deflate, out_events, inbound) for _ in range(ROUNDS)]
+        r = {k: min(x[k] for x in runs) for k in runs[0]}
+        print(f"{label:<30} {r['out_bytes']:>11.1f} {r['out_us']:>7.2f} {r['in_bytes']:>10.1f} "
+              f"{r['in_us']:>6.2f} {r['zlib_kb']:>8.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,521 @@
+"""
+WebSocket load harness for `/ws`.
+
+Starts the app locally (one uvicorn process, or a broker plus several
+workers), then drives simulated clients through the real protocol as
+described by a scenario file: join_queue, message, typing, next, leave,
+reconnect within the grace period, and plain disconnects. Reports:
+
+- pair latency: join_queue / next / re-join → `paired`
+- relay latency: `message` sent by one client → received by its partner
+- frame counts and rates, errors
+- CPU seconds, average CPU % and RSS (current and peak) of every server process
+
+Results are written as JSON with sorted keys and rounded values so runs can
+be diffed. `--compare` checks a run against a baseline and exits non-zero
+when a latency percentile or throughput regresses beyond `--tolerance`.
+
+    cd backend && python -m benchmarks.load_harness benchmarks/scenarios/smoke.json
+    python -m benchmarks.load_harness benchmarks/scenarios/chat.json --out new.json --compare base.json
+
+Scenario keys (see benchmarks/scenarios/): clients, duration_s, ramp_per_s,
+seed, workers, think_ms [min, max], reconnect_delay_ms [min, max],
+rejoin_ms [min, max], actions {message, typing, next, leave, reconnect,
+disconnect} as relative weights, env (extra settings for the server).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import websockets
+
+BASE_PORT = 8200
+ACTIONS = ("message", "typing", "next", "leave", "reconnect", "disconnect")
+DEFAULTS: Dict[str, Any] = {
+    "clients": 200,
+    "duration_s": 10,
+    "ramp_per_s": 500,
+    "seed": 1,
+    "workers": 1,
+    "think_ms": [200, 1000],
+    "reconnect_delay_ms": [50, 500],
+    "rejoin_ms": [100, 500],
+    "actions": {"message": 10, "typing": 4, "next": 1},
+    "env": {},
+}
+
+
+def percentiles(samples: List[float]) -> Dict[str, Optional[float]]:
+    if not samples:
+        return {"count": 0, "p50_ms": None, "p90_ms": None, "p99_ms": None, "max_ms": None}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+
+    return {
+        "count": len(ordered),
+        "p50_ms": pick(0.50),
+        "p90_ms": pick(0.90),
+        "p99_ms": pick(0.99),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+# ──────────────────────────────────────────────
+# Server processes
+# ──────────────────────────────────────────────
+
+class ProcessSampler:
+    """CPU time and RSS of a process, read from /proc (Linux only)."""
+
+    _ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+    def __init__(self, name: str, pid: int) -> None:
+        self.name = name
+        self.pid = pid
+        self._cpu_start = 0.0
+        self._t_start = 0.0
+
+    def cpu_seconds(self) -> Optional[float]:
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            return None
+        # utime and stime are fields 14 and 15 of /proc/<pid>/stat
+        return (int(fields[11]) + int(fields[12])) / self._ticks
+
+    def memory_kb(self) -> Dict[str, int]:
+        out: Dict[str, int] = {}
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    key, _, value = line.partition(":")
+                    if key in ("VmRSS", "VmHWM"):
+                        out[key] = int(value.split()[0])
+        except OSError:
+            pass
+        return out
+
+    def begin(self) -> None:
+        self._cpu_start = self.cpu_seconds() or 0.0
+        self._t_start = time.monotonic()
+
+    def report(self) -> Dict[str, Any]:
+        cpu = self.cpu_seconds()
+        mem = self.memory_kb()
+        elapsed = time.monotonic() - self._t_start
+        used = None if cpu is None else cpu - self._cpu_start
+        return {
+            "cpu_seconds": None if used is None else round(used, 2),
+            "cpu_percent": None if used is None or elapsed <= 0 else round(100 * used / elapsed, 1),
+            "rss_mb": round(mem["VmRSS"] / 1024, 1) if "VmRSS" in mem else None,
+            "rss_peak_mb": round(mem["VmHWM"] / 1024, 1) if "VmHWM" in mem else None,
+        }
+
+
+def wait_for_port(port: int, timeout: float = 20.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with socket.socket() as s:
+            if s.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.1)
+    raise TimeoutError(f"worker on port {port} did not start")
+
+
+class LocalServer:
+    """The app under test: one uvicorn process, or a broker plus N workers."""
+
+    def __init__(self, workers: int, env: Dict[str, str]) -> None:
+        self.workers = workers
+        self.extra_env = env
+        self.procs: List[subprocess.Popen] = []
+        self.samplers: List[ProcessSampler] = []
+        self.urls: List[str] = []
+
+    def __enter__(self) -> "LocalServer":
+        tmp = tempfile.mkdtemp()
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp}/load.db", **self.extra_env)
+        if self.workers > 1:
+            sock = f"{tmp}/broker.sock"
+            env["MATCHMAKER_BROKER_URL"] = f"unix://{sock}"
+            self._spawn("broker", [sys.executable, "-m", "app.core.broker"], env)
+            deadline = time.monotonic() + 20
+            while not os.path.exists(sock):
+                if time.monotonic() > deadline:
+                    raise TimeoutError("broker did not start")
+                time.sleep(0.1)
+        for n in range(self.workers):
+            port = BASE_PORT + n
+            self._spawn(f"worker{n}", [
+                sys.executable, "-m", "uvicorn", "app.main:app",
+                "--port", str(port), "--log-level", "warning",
+                "--ws", "app.core.ws_protocol:TunedWebSocketProtocol",
+            ], env)
+            self.urls.append(f"ws://127.0.0.1:{port}/ws")
+        for n in range(self.workers):
+            wait_for_port(BASE_PORT + n)
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        for p in self.procs:
+            p.terminate()
+        for p in self.procs:
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+    def _spawn(self, name: str, cmd: List[str], env: Dict[str, str]) -> None:
+        proc = subprocess.Popen(cmd, env=env)
+        self.procs.append(proc)
+        self.samplers.append(ProcessSampler(name, proc.pid))
+
+
+# ──────────────────────────────────────────────
+# Simulated clients
+# ──────────────────────────────────────────────
+
+class Results:
+    def __init__(self) -> None:
+        self.pair_latency: List[float] = []
+        self.relay_latency: List[float] = []
+        self.sent: Counter = Counter()
+        self.received: Counter = Counter()
+        self.errors: Counter = Counter()
+        # message id → send time, popped when the partner receives it
+        self.in_flight: Dict[str, float] = {}
+        self.connected = 0
+        self.peak_connected = 0
+
+
+class Client:
+    def __init__(self, n: int, url: str, scenario: Dict[str, Any], results: Results, deadline: float) -> None:
+        self.n = n
+        self.url = url
+        self.scenario = scenario
+        self.results = results
+        self.deadline = deadline
+        self.rng = random.Random(f"{scenario['seed']}:{n}")
+        self.generation = 0
+        self.ws: Any = None
+        self.room: Optional[str] = None
+        self.waiting_since: Optional[float] = None
+        self.next_action_at = 0.0
+        self.rejoin_at: Optional[float] = None
+        self.seq = 0
+        weights = scenario["actions"]
+        self.actions = [a for a in ACTIONS if weights.get(a)]
+        self.weights = [weights[a] for a in self.actions]
+
+    @property
+    def user_id(self) -> str:
+        return f"load-{self.n}-{self.generation}"
+
+    async def run(self) -> None:
+        try:
+            await self._connect()
+            await self._join()
+            while time.perf_counter() < self.deadline:
+                now = time.perf_counter()
+                if self.room:
+                    wake_at = self.next_action_at
+                else:
+                    wake_at = self.rejoin_at or self.deadline
+                try:
+                    raw = await asyncio.wait_for(self.ws.recv(), max(0.0, min(wake_at, self.deadline) - now))
+                except asyncio.TimeoutError:
+                    if time.perf_counter() >= self.deadline:
+                        break
+                    if self.room:
+                        await self._act()
+                    elif self.rejoin_at is not None:
+                        self.rejoin_at = None
+                        await self._join()
+                    continue
+                except websockets.ConnectionClosed:
+                    self.results.errors["server_closed"] += 1
+                    await self._fresh_session()
+                    continue
+                self._on_event(json.loads(raw))
+        except (OSError, asyncio.TimeoutError, websockets.InvalidHandshake) as e:
+            self.results.errors[type(e).__name__] += 1
+        finally:
+            if self.ws is not None:
+                await self._close()
+
+    # ─── protocol ───────────────────────────────────────────────────────────
+
+    def _on_event(self, evt: Dict[str, Any]) -> None:
+        t = evt.get("type")
+        self.results.received[t] += 1
+        now = time.perf_counter()
+        if t == "paired":
+            self.room = evt["room"]
+            if self.waiting_since is not None:
+                self.results.pair_latency.append(now - self.waiting_since)
+                self.waiting_since = None
+            self._schedule()
+        elif t == "message":
+            sent = self.results.in_flight.pop(evt.get("text", ""), None)
+            if sent is not None and not evt["text"].startswith(f"{self.user_id}:"):
+                self.results.relay_latency.append(now - sent)
+            elif sent is not None:
+                # Our own echo arrived first; keep waiting for the partner's copy
+                self.results.in_flight[evt["text"]] = sent
+        elif t == "system" and evt.get("code") == "idle" and self.room:
+            # Partner left: re-join after a pause, the way the app's "find next" does
+            self.room = None
+            self.rejoin_at = now + self._ms("rejoin_ms")
+        elif t == "error":
+            self.results.errors[f"server:{evt.get('message')}"] += 1
+
+    async def _act(self) -> None:
+        action = self.rng.choices(self.actions, self.weights)[0]
+        self.results.sent[action] += 1
+        if action == "message":
+            self.seq += 1
+            text = f"{self.user_id}:{self.seq}"
+            self.results.in_flight[text] = time.perf_counter()
+            await self._send({"type": "message", "room": self.room, "text": text, "sentAt": int(time.time() * 1000)})
+        elif action == "typing":
+            await self._send({"type": "typing", "room": self.room, "isTyping": self.rng.random() < 0.5})
+        elif action == "next":
+            self.room = None
+            self.waiting_since = time.perf_counter()
+            await self._send({"type": "next"})
+        elif action == "leave":
+            self.room = None
+            await self._send({"type": "leave"})
+            await asyncio.sleep(self._ms("rejoin_ms"))
+            await self._join()
+        elif action == "reconnect":
+            # Drop the socket and come back within the grace period on a new one
+            await self._close()
+            await asyncio.sleep(self._ms("reconnect_delay_ms"))
+            await self._connect()
+            await self._send({"type": "reconnect", "userId": self.user_id})
+            reply = await self._wait_for("system")
+            if reply is None or reply.get("code") != "reconnected":
+                self.results.errors["reconnect_expired"] += 1
+                await self._join()
+        elif action == "disconnect":
+            await self._fresh_session()
+            return
+        self._schedule()
+
+    async def _fresh_session(self) -> None:
+        """Leave without saying so; the partner sits out the grace period."""
+        await self._close()
+        self.generation += 1
+        self.room = None
+        self.rejoin_at = None
+        await asyncio.sleep(self._ms("rejoin_ms"))
+        await self._connect()
+        await self._join()
+
+    async def _join(self) -> None:
+        self.rejoin_at = None
+        self.waiting_since = time.perf_counter()
+        await self._send({"type": "join_queue", "userId": self.user_id, "avatar": "🤖"})
+
+    async def _wait_for(self, wanted: str, timeout: float = 5.0) -> Optional[Dict[str, Any]]:
+        try:
+            while True:
+                evt = json.loads(await asyncio.wait_for(self.ws.recv(), timeout))
+                self._on_event(evt)
+                if evt.get("type") == wanted:
+                    return evt
+        except asyncio.TimeoutError:
+            return None
+
+    async def _send(self, msg: Dict[str, Any]) -> None:
+        await self.ws.send(json.dumps(msg))
+
+    async def _connect(self) -> None:
+        self.ws = await websockets.connect(self.url, max_queue=None, open_timeout=30)
+        self.results.connected += 1
+        self.results.peak_connected = max(self.results.peak_connected, self.results.connected)
+
+    async def _close(self) -> None:
+        ws, self.ws = self.ws, None
+        if ws is not None:
+            self.results.connected -= 1
+            await ws.close()
+
+    def _schedule(self) -> None:
+        self.next_action_at = time.perf_counter() + self._ms("think_ms")
+
+    def _ms(self, key: str) -> float:
+        lo, hi = self.scenario[key]
+        return self.rng.uniform(lo, hi) / 1000
+
+
+async def drive(scenario: Dict[str, Any], urls: List[str], samplers: List[ProcessSampler]) -> Dict[str, Any]:
+    results = Results()
+    clients = scenario["clients"]
+    ramp = clients / scenario["ramp_per_s"]
+    started = time.perf_counter()
+    deadline = started + ramp + scenario["duration_s"]
+    self_sampler = ProcessSampler("loadgen", os.getpid())
+    for s in samplers + [self_sampler]:
+        s.begin()
+
+    tasks = []
+    for n in range(clients):
+        client = Client(n, urls[n % len(urls)], scenario, results, deadline)
+        tasks.append(asyncio.create_task(client.run()))
+        await asyncio.sleep(1 / scenario["ramp_per_s"])
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    processes = {s.name: s.report() for s in samplers}
+    return {
+        "scenario": scenario,
+        "environment": {
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "git": _git_revision(),
+        },
+        "elapsed_s": round(elapsed, 1),
+        "peak_connected": results.peak_connected,
+        "pair_latency": percentiles(results.pair_latency),
+        "relay_latency": percentiles(results.relay_latency),
+        "pairs_per_s": round(len(results.pair_latency) / elapsed, 1),
+        "messages_per_s": round(len(results.relay_latency) / elapsed, 1),
+        "undelivered_messages": len(results.in_flight),
+        "sent": dict(sorted(results.sent.items())),
+        "received": dict(sorted(results.received.items())),
+        "errors": dict(sorted(results.errors.items())),
+        "processes": processes,
+        # The generator shares the machine; if it is saturated, latencies are its own
+        "loadgen": self_sampler.report(),
+    }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ──────────────────────────────────────────────
+# Reporting
+# ──────────────────────────────────────────────
+
+# metric path → True when higher is better
+GATED = {
+    ("pair_latency", "p50_ms"): False,
+    ("pair_latency", "p99_ms"): False,
+    ("relay_latency", "p50_ms"): False,
+    ("relay_latency", "p99_ms"): False,
+    ("pairs_per_s",): True,
+    ("messages_per_s",): True,
+}
+
+
+def summarize(report: Dict[str, Any]) -> str:
+    lines = [
+        f"scenario {report['scenario'].get('name', '?')}: {report['scenario']['clients']} clients, "
+        f"{report['scenario']['workers']} worker(s), {report['elapsed_s']}s, peak {report['peak_connected']} sockets",
+    ]
+    for key in ("pair_latency", "relay_latency"):
+        p = report[key]
+        lines.append(
+            f"  {key:<14} n={p['count']:<7} p50={p['p50_ms']} ms  p90={p['p90_ms']} ms  "
+            f"p99={p['p99_ms']} ms  max={p['max_ms']} ms"
+        )
+    lines.append(f"  pairs/s {report['pairs_per_s']}   messages/s {report['messages_per_s']}   "
+                 f"undelivered {report['undelivered_messages']}")
+    for name, proc in {**report["processes"], "loadgen": report["loadgen"]}.items():
+        lines.append(
+            f"  {name:<8} cpu {proc['cpu_seconds']}s ({proc['cpu_percent']}%)  "
+            f"rss {proc['rss_mb']} MB  peak {proc['rss_peak_mb']} MB"
+        )
+    if report["errors"]:
+        lines.append(f"  errors {report['errors']}")
+    return "\n".join(lines)
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Human-readable regressions of `report` against `baseline`."""
+    regressions = []
+    for path, higher_is_better in GATED.items():
+        new, old = report, baseline
+        for key in path:
+            new, old = (new or {}).get(key), (old or {}).get(key)
+        if new is None or old is None or old == 0:
+            continue
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        label = ".".join(path)
+        print(f"  {label:<22} {old:>10} → {new:<10} ({change:+.1%})")
+        if worse > tolerance:
+            regressions.append(f"{label} regressed {worse:.1%} (tolerance {tolerance:.0%})")
+    return regressions
+
+
+def load_scenario(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        scenario = {**DEFAULTS, **json.load(f)}
+    scenario.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+    return scenario
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Drive simulated clients against /ws.")
+    parser.add_argument("scenario", help="scenario JSON file")
+    parser.add_argument("--url", action="append", help="target an already running server instead (repeatable)")
+    parser.add_argument("--clients", type=int, help="override the scenario's client count")
+    parser.add_argument("--duration", type=float, help="override the scenario's duration_s")
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--compare", help="baseline JSON report to check against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression (default 0.25)")
+    args = parser.parse_args()
+
+    scenario = load_scenario(args.scenario)
+    if args.clients:
+        scenario["clients"] = args.clients
+    if args.duration:
+        scenario["duration_s"] = args.duration
+
+    if args.url:
+        report = asyncio.run(drive(scenario, args.url, []))
+    else:
+        env = {k: str(v) for k, v in scenario["env"].items()}
+        with LocalServer(scenario["workers"], env) as server:
+            report = asyncio.run(drive(scenario, server.urls, server.samplers))
+
+    print(summarize(report))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True, ensure_ascii=False)
+            f.write("\n")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"compared with {args.compare}:")
+        regressions = compare(report, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION: {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,20 @@
+import os
+import tempfile
+
+import pytest
+
+# Before anything imports app.settings: a throwaway database and snapshot path per test run
+_tmp = tempfile.mkdtemp(prefix="chat-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp}/test.db")
+os.environ.setdefault("MATCHMAKER_SNAPSHOT_PATH", f"{_tmp}/matchmaker.snapshot")
+
+
+@pytest.fixture(scope="session")
+def client():
+    """One app lifespan for the whole run: shutdown_db() retires the DB executor for good."""
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as client:
+        yield client
@@ -0,0 +1,53 @@
+import asyncio
+
+from sqlalchemy.exc import OperationalError
+
+from app.core.app_opens import AppOpenBuffer
+from app.db import database
+
+
+def stored(token: str):
+    for row in database.list_tokens(10, None, "token", user_id=None, active_since=None, never_sent=False):
+        if row["token"] == token:
+            return row
+    return None
+
+
+def test_malformed_opens_are_not_buffered():
+    buffer = AppOpenBuffer(flush_interval=60, max_entries=100)
+    buffer.record(["evil"], "ExponentPushToken[x]")
+    buffer.record("u1", 42)
+    buffer.record("u1", "ExponentPushToken[y]", device_name={"a": 1})
+    buffer.record("", "ExponentPushToken[z]")
+    assert buffer._pending == {}
+
+
+def test_a_row_that_fails_on_its_own_is_dropped_and_the_rest_written():
+    database.metadata.create_all(database.engine)
+    buffer = AppOpenBuffer(flush_interval=60, max_entries=100)
+    buffer.record("u1", "ExponentPushToken[opens-good]")
+    buffer.record("u2", "ExponentPushToken[opens-bad]")
+    # A bad value that got past record(), e.g. from a future caller
+    buffer._pending["ExponentPushToken[opens-bad]"].user_id = ["evil"]
+
+    asyncio.run(buffer.flush())
+    assert buffer._pending == {}
+    assert stored("ExponentPushToken[opens-good]")["user_id"] == "u1"
+    assert stored("ExponentPushToken[opens-bad]") is None
+
+
+def test_opens_are_kept_while_the_database_is_unreachable(monkeypatch):
+    def unreachable(rows):
+        raise OperationalError("INSERT", {}, Exception("connection refused"))
+
+    buffer = AppOpenBuffer(flush_interval=60, max_entries=100)
+    buffer.record("u1", "ExponentPushToken[opens-later]")
+    monkeypatch.setattr(database, "upsert_app_opens", unreachable)
+    asyncio.run(buffer.flush())
+    assert buffer._pending["ExponentPushToken[opens-later]"].opens_total == 1
+
+    monkeypatch.undo()
+    database.metadata.create_all(database.engine)
+    buffer.record("u1", "ExponentPushToken[opens-later]")
+    asyncio.run(buffer.flush())
+    assert stored("ExponentPushToken[opens-later]")["app_opens_total"] == 2
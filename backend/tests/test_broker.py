@@ -0,0 +1,173 @@
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+import websockets
+
+from app.core.broker import BrokerClient
+from app.core.codec import default_codec
+
+
+class StubConn:
+    """Worker-side socket: records the events the broker forwards to it."""
+
+    codec = default_codec
+    closed = False
+
+    def __init__(self) -> None:
+        self.broker_conn_id = None
+        self.kinds = []
+
+    def send(self, payload, kind: str = "event") -> None:
+        self.kinds.append(kind)
+
+
+def wait_for(predicate, timeout: float = 15.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise TimeoutError
+        time.sleep(0.05)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def port_open(port: int) -> bool:
+    with socket.socket() as s:
+        return s.connect_ex(("127.0.0.1", port)) == 0
+
+
+async def recv_type(sock, wanted: str, timeout: float = 5.0) -> dict:
+    while True:
+        evt = json.loads(await asyncio.wait_for(sock.recv(), timeout))
+        if evt["type"] == wanted:
+            return evt
+
+
+def broker_env(tmp_path) -> dict:
+    return dict(
+        os.environ,
+        MATCHMAKER_BROKER_URL=f"unix://{tmp_path}/broker.sock",
+        DATABASE_URL=f"sqlite:///{tmp_path}/broker.db",
+        MATCHMAKER_SNAPSHOT_PATH=str(tmp_path / "matchmaker.snapshot"),
+    )
+
+
+@pytest.fixture
+def broker(tmp_path):
+    env = broker_env(tmp_path)
+    url = env["MATCHMAKER_BROKER_URL"]
+    proc = subprocess.Popen([sys.executable, "-m", "app.core.broker", "--url", url], env=env)
+    try:
+        wait_for(lambda: os.path.exists(f"{tmp_path}/broker.sock"))
+        yield proc, url, tmp_path / "matchmaker.snapshot"
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+
+def test_broker_writes_snapshot_on_sigterm(broker):
+    proc, url, snapshot_path = broker
+
+    async def pair() -> None:
+        client = BrokerClient(url)
+        a, b = StubConn(), StubConn()
+        await client.register("a", a, "🦊")
+        await client.join_queue("a")
+        await client.register("b", b, "🐻")
+        await client.join_queue("b")
+        for _ in range(100):
+            if "paired" in a.kinds and "paired" in b.kinds:
+                break
+            await asyncio.sleep(0.05)
+        assert "paired" in a.kinds and "paired" in b.kinds
+        await client.stop()
+
+    asyncio.run(pair())
+    proc.send_signal(signal.SIGTERM)
+    assert proc.wait(timeout=15) == 0
+    state = json.loads(snapshot_path.read_text())
+    # Room layout in app/core/snapshot.py: the members' ids are fields 2 and 5
+    assert [(room[2], room[5]) for room in state["rooms"]] == [("a", "b")]
+
+
+def test_admin_push_operations_reach_the_broker(broker):
+    _, url, _ = broker
+
+    async def run() -> None:
+        client = BrokerClient(url)
+        await client.register("a", StubConn(), "🦊")
+        await client.add_push_token("a", "ExponentPushToken[a]")
+        await client.add_push_token("a", "ExponentPushToken[b]")
+
+        text = await client.render_metrics()
+        assert "chat_users 1" in text
+        assert "chat_push_tokens_indexed 2" in text
+        # Worker-side series stay with the worker
+        assert "chat_ws_frames_in_total" not in text
+
+        await client.remove_push_tokens(["ExponentPushToken[a]"])
+        assert "chat_push_tokens_indexed 1" in await client.render_metrics()
+        await client.clear_push_tokens()
+        assert "chat_push_tokens_indexed 0" in await client.render_metrics()
+        assert (await client.push_stats())["batches_sent"] == 0
+        await client.stop()
+
+    asyncio.run(run())
+
+
+@pytest.fixture
+def workers(broker, tmp_path):
+    """Two uvicorn workers sharing the broker; yields their ports."""
+    ports = [free_port(), free_port()]
+    procs = [
+        subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+            env=broker_env(tmp_path),
+        )
+        for port in ports
+    ]
+    try:
+        for port in ports:
+            wait_for(lambda: port_open(port))
+        yield ports
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.wait(timeout=10)
+
+
+def test_users_on_two_workers_are_paired_through_the_broker(workers):
+    async def run() -> None:
+        async with websockets.connect(f"ws://127.0.0.1:{workers[0]}/ws") as a, \
+                websockets.connect(f"ws://127.0.0.1:{workers[1]}/ws") as b:
+            await a.send(json.dumps({"type": "join_queue", "userId": "alice", "avatar": "🦊"}))
+            await b.send(json.dumps({"type": "join_queue", "userId": "bob", "avatar": "🐻"}))
+
+            pa, pb = await recv_type(a, "paired"), await recv_type(b, "paired")
+            assert pa["room"] == pb["room"]
+            assert pa["partner"]["id"] == "bob" and pb["partner"]["id"] == "alice"
+            room = pa["room"]
+
+            await a.send(json.dumps({"type": "message", "room": room, "text": "hi bob", "sentAt": 1}))
+            assert (await recv_type(b, "message"))["text"] == "hi bob"
+
+            await b.send(json.dumps({"type": "typing", "room": room, "isTyping": True}))
+            assert (await recv_type(a, "typing"))["isTyping"] is True
+
+            await a.send(json.dumps({"type": "next"}))
+            assert (await recv_type(b, "system"))["code"] == "idle"
+
+    asyncio.run(run())
@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from app.db import database
+
+
+def opens(token: str, count: int = 1) -> dict:
+    now = database._now_utc()
+    return {
+        "token": token, "user_id": None, "device_name": None,
+        "opens_total": count, "opens_today": count,
+        "day_start": database.ist_day_start_utc(now),
+        "first_opened_at": now - timedelta(seconds=1), "last_opened_at": now,
+    }
+
+
+def today() -> dict:
+    day = database._now_utc().astimezone(database.IST).date()
+    for row in database.get_daily_stats(1):
+        if row["day"] == day:
+            return row
+    return {"new_users": 0, "active_users": 0, "app_opens": 0}
+
+
+def test_app_opens_count_a_token_as_new_once():
+    database.metadata.create_all(database.engine)
+    before = today()
+
+    # Out of token order on purpose: the rollup sorts before inserting and locking
+    database.upsert_app_opens([opens("ExponentPushToken[rollup-b]", 2), opens("ExponentPushToken[rollup-a]")])
+    database.upsert_app_opens([opens("ExponentPushToken[rollup-a]", 3)])
+
+    after = today()
+    assert after["new_users"] - before["new_users"] == 2
+    assert after["active_users"] - before["active_users"] == 2
+    assert after["app_opens"] - before["app_opens"] == 6
+    rows = {r["token"]: r for r in database.list_tokens(10, None, "token", user_id=None,
+                                                         active_since=None, never_sent=False)}
+    assert rows["ExponentPushToken[rollup-a]"]["app_opens_total"] == 4
+    assert rows["ExponentPushToken[rollup-a]"]["app_opens_today"] == 4
+    assert rows["ExponentPushToken[rollup-b]"]["app_opens_total"] == 2
@@ -0,0 +1,57 @@
+import asyncio
+
+from app.core.codec import default_codec
+from app.core.matchmaker import PAIR_WAIT, Matchmaker
+
+
+class Sink:
+    codec = default_codec
+    closed = False
+
+    def __init__(self) -> None:
+        self.kinds = []
+
+    def send(self, payload, kind: str = "event") -> None:
+        self.kinds.append(kind)
+
+
+async def stop(mm: Matchmaker) -> None:
+    await mm.match_fallback.stop()
+    await mm.grace.stop()
+    await mm.typing_timers.stop()
+    await mm.notifier.stop()
+
+
+def test_rejoin_from_new_socket_while_queued_uses_new_prefs():
+    async def scenario() -> None:
+        mm = Matchmaker()
+        await mm.register("a", Sink(), "🦊")
+        await mm.join_queue("a", {"language": "en"})
+        # Same user, new socket, different preferences, still waiting
+        fresh = Sink()
+        await mm.register("a", fresh, "🦊")
+        await mm.join_queue("a", {"language": "fr"})
+        assert mm.users["a"].queued_at > 0
+
+        # The old filing under "en" is gone
+        await mm.register("c", Sink(), "🐼")
+        await mm.join_queue("c", {"language": "en"})
+        assert mm.users["c"].room is None
+
+        series = PAIR_WAIT._series.get(())
+        waited_before = series[-2] if series else 0
+        await mm.register("b", Sink(), "🐻")
+        await mm.join_queue("b", {"language": "fr"})
+        assert mm.users["a"].partner is mm.users["b"]
+        assert "paired" in fresh.kinds
+        # Both waits are the few milliseconds this test took, not the process uptime
+        assert PAIR_WAIT._series[()][-2] - waited_before < 1
+        await stop(mm)
+
+    asyncio.run(scenario())
+
+
+def test_unwritable_snapshot_path_does_not_break_shutdown(tmp_path):
+    mm = Matchmaker()
+    mm.save_snapshot(str(tmp_path / "missing" / "matchmaker.snapshot"))
+    assert not (tmp_path / "missing").exists()
@@ -0,0 +1,117 @@
+import asyncio
+import gzip
+import json
+
+import httpx
+
+from app.core.push_index import push_index
+from app.core.push_service import PushService
+from app.db import database
+from app.settings import settings
+
+
+class StubExpo:
+    """Expo push API on an httpx.MockTransport: records requests and answers from scripted rules."""
+
+    def __init__(self, dead_tickets=(), failed_tickets=(), dead_receipts=(), busy=0) -> None:
+        self.dead_tickets = set(dead_tickets)
+        self.failed_tickets = set(failed_tickets)
+        self.dead_receipts = set(dead_receipts)
+        # Answer this many /send requests with 503 before serving them
+        self.busy = busy
+        self.batches = []
+        self.receipt_requests = []
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        body = request.content
+        if request.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        payload = json.loads(body)
+        if request.url.path.endswith("/send"):
+            if self.busy:
+                self.busy -= 1
+                return httpx.Response(503, headers={"Retry-After": "0"})
+            self.batches.append([m["to"] for m in payload])
+            return httpx.Response(200, json={"data": [self._ticket(m["to"]) for m in payload]})
+        self.receipt_requests.append(payload["ids"])
+        return httpx.Response(200, json={"data": {
+            rid: {"status": "error", "details": {"error": "DeviceNotRegistered"}}
+            if rid[len("ticket-"):] in self.dead_receipts else {"status": "ok"}
+            for rid in payload["ids"]
+        }})
+
+    def _ticket(self, token: str) -> dict:
+        if token in self.dead_tickets:
+            return {"status": "error", "details": {"error": "DeviceNotRegistered"}}
+        if token in self.failed_tickets:
+            return {"status": "error", "details": {"error": "MessageRateExceeded"}}
+        return {"status": "ok", "id": f"ticket-{token}"}
+
+
+def tokens(n: int) -> list:
+    return [f"ExponentPushToken[{i}]" for i in range(n)]
+
+
+def run_dispatch(monkeypatch, stub: StubExpo, sent: list) -> tuple:
+    """Send one campaign to `sent` and wait for its receipts; returns the service and deleted tokens."""
+    deleted = []
+
+    def delete_tokens(batch):
+        deleted.extend(batch)
+        return len(batch)
+
+    monkeypatch.setattr(database, "delete_tokens", delete_tokens)
+    monkeypatch.setattr(settings, "PUSH_RETRY_BASE_SECONDS", 0.001)
+    push_index.clear()
+    for token in sent:
+        push_index.add(token, None)
+    service = PushService(base_url="https://expo.test/push", transport=stub.transport(), receipt_delay=0)
+
+    async def scenario() -> None:
+        await service.send_push_notifications(sent + ["not-an-expo-token"], pool_size=3)
+        await asyncio.gather(*service._receipt_tasks)
+        await service.aclose()
+
+    asyncio.run(scenario())
+    return service, deleted
+
+
+def test_messages_go_out_in_batches_of_100(monkeypatch):
+    sent = tokens(250)
+    stub = StubExpo()
+    service, deleted = run_dispatch(monkeypatch, stub, sent)
+
+    assert sorted(len(b) for b in stub.batches) == [50, 100, 100]
+    assert sorted(t for b in stub.batches for t in b) == sorted(sent)
+    assert service.stats.batches_sent == 3 and service.stats.messages_sent == 250
+    assert service.stats.tickets_ok == 250
+    # Every ticket id is looked up in one receipts request
+    assert [len(ids) for ids in stub.receipt_requests] == [250]
+
+
+def test_ticket_errors_prune_only_unregistered_devices(monkeypatch):
+    sent = tokens(5)
+    stub = StubExpo(dead_tickets=[sent[0]], failed_tickets=[sent[1]], busy=1)
+    service, deleted = run_dispatch(monkeypatch, stub, sent)
+
+    assert service.stats.retries == 1
+    assert service.stats.tickets_ok == 3 and service.stats.tickets_error == 2
+    assert deleted == [sent[0]]
+    assert sent[0] not in push_index._entries
+    # A ticket error that isn't DeviceNotRegistered puts the token back in the pool
+    assert push_index._entries[sent[1]].last_sent == 0.0
+    assert push_index._entries[sent[2]].last_sent > 0
+
+
+def test_receipt_errors_prune_unregistered_devices(monkeypatch):
+    sent = tokens(4)
+    stub = StubExpo(dead_receipts=[sent[3]])
+    service, deleted = run_dispatch(monkeypatch, stub, sent)
+
+    assert stub.receipt_requests == [[f"ticket-{t}" for t in sent]]
+    assert service.stats.receipts_checked == 4 and service.stats.receipts_error == 1
+    assert deleted == [sent[3]]
+    assert sent[3] not in push_index._entries and sent[2] in push_index._entries
@@ -0,0 +1,89 @@
+from fastapi.testclient import TestClient
+
+from app.api import ws
+
+
+def join(client: TestClient, user_id: str):
+    conn = client.websocket_connect("/ws")
+    sock = conn.__enter__()
+    sock.send_json({"type": "join_queue", "userId": user_id, "avatar": "🦊"})
+    return conn, sock
+
+
+def receive_type(sock, wanted: str) -> dict:
+    while True:
+        evt = sock.receive_json()
+        if evt["type"] == wanted:
+            return evt
+
+
+def test_client_close_with_service_restart_does_not_drain(client):
+    conn, sock = join(client, "restart-a")
+    receive_type(sock, "queue_size")
+    sock.close(code=1012)
+    conn.__exit__(None, None, None)
+    assert not ws.mm.draining
+
+    # Matchmaking still works for everyone else
+    a, sock_a = join(client, "after-a")
+    b, sock_b = join(client, "after-b")
+    room = receive_type(sock_a, "paired")["room"]
+    assert receive_type(sock_b, "paired")["room"] == room
+    a.__exit__(None, None, None)
+    b.__exit__(None, None, None)
+
+
+def test_non_object_frames_are_rejected_and_the_user_stays_usable(client):
+    conn, sock = join(client, "odd-a")
+    for raw in ("5", "[1, 2]", '"join_queue"', "null", '{"type": ["next"]}'):
+        sock.send_text(raw)
+        assert receive_type(sock, "error")["message"] in ("Invalid JSON", "Unknown type")
+    assert "odd-a" in ws.mm.users
+
+    other, _ = join(client, "odd-b")
+    assert receive_type(sock, "paired")["partner"]["id"] == "odd-b"
+    conn.__exit__(None, None, None)
+    other.__exit__(None, None, None)
+
+
+def test_unexpected_error_still_removes_the_user(client, monkeypatch):
+    async def broken(*args, **kwargs):
+        raise RuntimeError("boom")
+
+    conn, sock = join(client, "crash-a")
+    receive_type(sock, "queue_size")
+    monkeypatch.setattr(ws.mm, "handle_next", broken)
+    sock.send_json({"type": "next"})
+    conn.__exit__(None, None, None)
+    assert "crash-a" not in ws.mm.users
+    assert "crash-a" not in ws.mm.waiting
+
+
+def test_metrics_lists_each_series_once(client):
+    names = [line.split()[2] for line in client.get("/metrics").text.splitlines() if line.startswith("# TYPE")]
+    assert "chat_users" in names and "chat_ws_frames_in_total" in names
+    assert len(names) == len(set(names))
+
+
+def test_push_registration_with_wrong_types_is_rejected(client, monkeypatch):
+    from app.core.push_index import push_index
+    from app.settings import settings
+
+    monkeypatch.setitem(settings.WS_EVENT_RATE_LIMITS, "register_push", (100, 100))
+    conn = client.websocket_connect("/ws")
+    sock = conn.__enter__()
+    for frame in (
+        {"token": 42, "userId": "push-a"},
+        {"token": "ExponentPushToken[typed]", "userId": ["push-a"]},
+        {"token": "ExponentPushToken[typed]", "userId": "push-a", "deviceName": {"model": "x"}},
+        {"token": "", "userId": "push-a"},
+    ):
+        sock.send_json({"type": "register_push", **frame})
+        assert receive_type(sock, "error")["message"] == "Invalid push registration"
+    assert "ExponentPushToken[typed]" not in push_index._entries
+
+    sock.send_json({"type": "register_push", "token": "ExponentPushToken[typed]", "userId": "push-a"})
+    sock.send_json({"type": "join_queue", "userId": "push-a", "avatar": "🦊"})
+    receive_type(sock, "queue_size")
+    assert push_index._entries["ExponentPushToken[typed]"].user_id == "push-a"
+    conn.__exit__(None, None, None)
@@ -101,6 +101,8 @@ export const useChatStore = create<Store>((set, get) => ({
         }
       } else if (data.type === 'queue_size') {
         set({ queueSize: data.count })
+      } else if (data.type === 'ping') {
+        ws.send(JSON.stringify({ type: 'pong' }))
       }
     }
     ws.onclose = () => {
@@ -1,9 +1,13 @@
+// Optional; the server matches users who share a value for every attribute both set
+export type MatchPrefs = { language?: string; region?: string; interests?: string[] };
+
 export type ClientToServer =
-  | { type: 'join_queue'; userId: string; avatar: string }
+  | { type: 'join_queue'; userId: string; avatar: string; prefs?: MatchPrefs }
   | { type: 'message'; room: string; text: string; sentAt: number }
   | { type: 'typing'; room: string; isTyping: boolean }
   | { type: 'next' }
-  | { type: 'leave' };
+  | { type: 'leave' }
+  | { type: 'pong' };
 
 export type ServerToClient =
   | { type: 'paired'; room: string; partner: { id: string; avatar: string }; startedAt: number }
@@ -11,4 +15,5 @@ export type ServerToClient =
   | { type: 'typing'; room: string; isTyping: boolean }
   | { type: 'system'; code: 'idle' | 'searching'; message: string }
   | { type: 'queue_size'; count: number }
-  | { type: 'error'; message: string };
\ No newline at end of file
+  | { type: 'error'; message: string }
+  | { type: 'ping' };
\ No newline at end of file
@@ -41,10 +41,15 @@ const genId = () => `${Date.now().toString(36)}-${Math.random().toString(36).sli
 
 const USER_ID_KEY = '@stranger_chat_user_id'
 
+// Close code the server sends when it restarts; rooms survive the restart for the grace period
+const SERVICE_RESTART = 1012
+const RESTART_REATTACH_ATTEMPTS = 10
+
 export function ChatProvider({ children }: { children: React.ReactNode }) {
   const wsRef = useRef<WebSocket | null>(null)
   const typingClearTimer = useRef<ReturnType<typeof setTimeout> | null>(null)
   const appState = useRef(AppState.currentState)
+  const statusRef = useRef<Status>('idle')
 
   const [status, setStatus] = useState<Status>('idle')
   const [socketOpen, setSocketOpen] = useState(false)
@@ -59,6 +64,10 @@ export function ChatProvider({ children }: { children: React.ReactNode }) {
 
   const [queueSize, setQueueSize] = useState<number | null>(null)
 
+  useEffect(() => {
+    statusRef.current = status
+  }, [status])
+
   // Load or create persistent user_id
   useEffect(() => {
     (async () => {
@@ -136,6 +145,9 @@ export function ChatProvider({ children }: { children: React.ReactNode }) {
     if (status === 'searching') {
       console.log('[WS] Was searching, will reconnect in 1s...')
       setTimeout(() => connectAndFind(), 1000)
+    } else if (ev?.code === SERVICE_RESTART && statusRef.current === 'matched') {
+      console.log('[WS] Server restarting, will reattach to the room...')
+      setTimeout(() => reattach(RESTART_REATTACH_ATTEMPTS), 1000 + Math.random() * 1000)
     }
   }, [status])
 
@@ -189,12 +201,37 @@ export function ChatProvider({ children }: { children: React.ReactNode }) {
         }
       } else if (data.type === 'queue_size') {
         setQueueSize(data.count)
+      } else if (data.type === 'ping') {
+        // Heartbeat: answering lets the server reap this socket if it goes half-open
+        wsRef.current?.send(JSON.stringify({ type: 'pong' }))
       }
     } catch (e) {
       console.error('[WS] Failed to parse message:', e)
     }
   }, [])
 
+  // Sends `reconnect` on a new socket, retrying while the server is still coming back up
+  const reattach = useCallback((attemptsLeft: number) => {
+    if (statusRef.current !== 'matched') return
+    const ws = new WebSocket(getWsUrl())
+    wsRef.current = ws
+    let opened = false
+    ws.onopen = () => {
+      opened = true
+      ws.send(JSON.stringify({ type: 'reconnect', userId } satisfies ClientToServer))
+    }
+    ws.onmessage = handleMessage
+    ws.onclose = (ev) => {
+      if (!opened && attemptsLeft > 1) {
+        wsRef.current = null
+        setTimeout(() => reattach(attemptsLeft - 1), 2000)
+      } else {
+        handleClose(ev)
+      }
+    }
+    ws.onerror = (err) => console.error('[WS] ❌ Reattach error:', JSON.stringify(err))
+  }, [userId, handleMessage, handleClose])
+
   const connectAndFind = useCallback(() => {
     if (!ready) {
       console.warn('[WS] user_id not loaded yet, ignoring connectAndFind')
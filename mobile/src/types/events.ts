@@ -1,9 +1,13 @@
+// Optional; the server matches users who share a value for every attribute both set
+export type MatchPrefs = { language?: string; region?: string; interests?: string[] };
+
 export type ClientToServer =
-  | { type: 'join_queue'; userId: string; avatar: string }
+  | { type: 'join_queue'; userId: string; avatar: string; prefs?: MatchPrefs }
   | { type: 'message'; room: string; text: string; sentAt: number }
   | { type: 'typing'; room: string; isTyping: boolean }
   | { type: 'next' }
   | { type: 'leave' }
+  | { type: 'pong' }
   | { type: 'reconnect'; userId: string };
 
 export type ServerToClient =
@@ -17,5 +21,6 @@ export type ServerToClient =
   | { type: 'typing'; room: string; isTyping: boolean }
   | { type: 'system'; code: 'idle' | 'searching' | 'reconnected'; message: string }
   | { type: 'queue_size'; count: number }
-  | { type: 'error'; message: string };
+  | { type: 'error'; message: string }
+  | { type: 'ping' };
 